@@ -6,25 +6,138 @@ Author: Administrator
 Version: 2.0
 """
 
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_file
+from flask import (Flask, Blueprint, current_app, render_template, request, jsonify, session, redirect, url_for,
+                   send_file, g, Response, stream_with_context)
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSession
+import sqlalchemy as sa
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from werkzeug.security import generate_password_hash, check_password_hash
+import click
 from datetime import datetime, timedelta
 from functools import wraps
+from itertools import chain
+from contextlib import contextmanager
 import os
-from io import BytesIO
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+import sys
+import csv
+import sqlite3
+import gzip
+import zlib
+import mimetypes
+import json
+import uuid
+import hashlib
+import bisect
+import heapq
+import time
+import queue
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FutureTimeoutError
+from io import BytesIO, StringIO
+from werkzeug.datastructures import MultiDict
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # brotli ixtiyoriy: bo'lmasa faqat gzip
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack ixtiyoriy: bo'lmasa faqat JSON formatlari
+    msgpack = None
 
 # ==================== APP CONFIGURATION ====================
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'sklad-tizim-secret-key-2024')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///sklad.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
-app.config['SESSION_COOKIE_HTTPONLY'] = True
-
-db = SQLAlchemy(app)
+# openpyxl, reportlab va numpy modul boshida emas, ularni ishlatadigan funksiyalarda import qilinadi:
+# har bir WSGI worker ularning yuklanish vaqti va xotirasini faqat export/tahlil kerak bo'lganda to'laydi
+
+
+def default_config(instance_path):
+    """Muhit o'zgaruvchilaridan standart sozlamalar (create_app(config) ularni ustidan yozadi)"""
+    return {
+        'SECRET_KEY': os.environ.get('SECRET_KEY', 'sklad-tizim-secret-key-2024'),
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///sklad.db',
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'PERMANENT_SESSION_LIFETIME': timedelta(days=7),
+        'SESSION_COOKIE_HTTPONLY': True,
+        'EXPORT_CACHE_DIR': os.environ.get('EXPORT_CACHE_DIR', os.path.join(instance_path, 'export_cache')),
+        'EXPORT_CACHE_MAX_BYTES': int(os.environ.get('EXPORT_CACHE_MAX_BYTES', 200 * 1024 * 1024)),
+        'EXPORT_WORKERS': int(os.environ.get('EXPORT_WORKERS', 2)),
+        'PDF_FONT_PATH': os.environ.get('PDF_FONT_PATH'),
+        # Skaner oqimi uchun guruhli commit (ixtiyoriy)
+        'GROUP_COMMIT': os.environ.get('GROUP_COMMIT', '0') == '1',
+        'GROUP_COMMIT_MAX_OPS': int(os.environ.get('GROUP_COMMIT_MAX_OPS', 64)),
+        'GROUP_COMMIT_MAX_DELAY_MS': int(os.environ.get('GROUP_COMMIT_MAX_DELAY_MS', 5)),
+        'GROUP_COMMIT_TIMEOUT': float(os.environ.get('GROUP_COMMIT_TIMEOUT', 30)),
+        # Texnik xizmat: onlayn zaxira nusxa, ANALYZE, incremental VACUUM
+        'BACKUP_DIR': os.environ.get('BACKUP_DIR', os.path.join(instance_path, 'backups')),
+        'BACKUP_KEEP': int(os.environ.get('BACKUP_KEEP', 7)),
+        'BACKUP_PAGES_PER_STEP': int(os.environ.get('BACKUP_PAGES_PER_STEP', 256)),
+        'MAINTENANCE_SCHEDULER': os.environ.get('MAINTENANCE_SCHEDULER', '0') == '1',
+        'MAINTENANCE_WINDOW': os.environ.get('MAINTENANCE_WINDOW', '03:00-05:00'),
+        'MAINTENANCE_VACUUM_PAGES': int(os.environ.get('MAINTENANCE_VACUUM_PAGES', 64)),
+        # Omborlar ro'yxati: birinchisi asosiy (sklad.db), qolganlari instance/sklad_<id>.db
+        'WAREHOUSES': [w.strip() for w in os.environ.get('WAREHOUSES', 'main').split(',') if w.strip()],
+        # create_app() bazani yaratadi, migratsiyalarni qo'llaydi va xotiradagi indekslarni quradi
+        # (INIT_DB=0 - bazaga tegmaydigan CLI buyruqlari uchun, masalan bench-startup)
+        'INIT_DB': os.environ.get('INIT_DB', '1') == '1',
+        # Ko'p jarayonli WSGI: boshqa workerlar yozuvlari xotiradagi indekslarga shu oraliqda yetib keladi
+        # (0 - o'chirilgan, bitta jarayon uchun)
+        'INDEX_REFRESH_SECONDS': float(os.environ.get('INDEX_REFRESH_SECONDS', 0)),
+        # Shu hajmdan (bayt) katta javoblar gzip/brotli bilan siqiladi; oqimli javoblar har doim
+        'COMPRESS_MIN_SIZE': int(os.environ.get('COMPRESS_MIN_SIZE', 1024)),
+    }
+
+# Har bir omborning alohida SQLite faylida saqlanadigan jadvallar
+SHARDED_TABLES = {
+    'products', 'product_stock', 'batches', 'batch_movements', 'stock_requests', 'stock_reservations',
+    'stock_snapshots', 'stock_snapshot_items', 'user_activity',
+}
+
+
+class WarehouseSession(FlaskSession):
+    """Ombor jadvallarini joriy omborning SQLite fayliga yo'naltiruvchi sessiya"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            table = None
+            if mapper is not None:
+                try:
+                    table = sa.inspect(mapper).local_table
+                except sa.exc.NoInspectionAvailable:
+                    table = None
+            elif isinstance(clause, sa.Table):
+                table = clause
+            elif isinstance(clause, sa.sql.dml.UpdateBase) and isinstance(clause.table, sa.Table):
+                table = clause.table
+            if table is not None and table.name in SHARDED_TABLES:
+                engine = warehouse_engine()
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': WarehouseSession})
+bp = Blueprint('sklad', __name__, cli_group=None)
+
+
+@sa.event.listens_for(sa.engine.Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL: o'quvchilar (zaxira nusxa ham) yozuvchilarni bloklamaydi; yangi bazalarda incremental VACUUM"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        # auto_vacuum bo'sh bazada birinchi sahifa yozilishidan oldin o'rnatilishi kerak
+        dbapi_connection.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        dbapi_connection.execute('PRAGMA journal_mode = WAL')
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Ombor to'ri: sektorlar, qatorlar va yacheykalar
+WAREHOUSE_SECTORS = ['A', 'B', 'C']
+WAREHOUSE_ROWS = 9
+WAREHOUSE_CELLS = 4
 
 
 # ==================== DATABASE MODELS ====================
@@ -38,12 +151,26 @@ class User(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.now)
 
 
+def product_key(name):
+    """Mahsulot nomining normallashtirilgan qidiruv kaliti"""
+    return ' '.join((name or '').split()).casefold()
+
+
+class Product(db.Model):
+    """Mahsulotlar lug'ati (partiya va so'rovlar id orqali bog'lanadi)"""
+    __tablename__ = 'products'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    search_key = db.Column(db.String(200), nullable=False, unique=True)
+
+
 class Batch(db.Model):
     """Partiyalar jadvali"""
     __tablename__ = 'batches'
     
     id = db.Column(db.Integer, primary_key=True)
-    product_name = db.Column(db.String(200), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     batch_code = db.Column(db.String(100), nullable=False)
     quantity = db.Column(db.Integer, nullable=True)
     quantity_sht = db.Column(db.Integer, nullable=True)
@@ -57,8 +184,19 @@ class Batch(db.Model):
     removed_by = db.Column(db.Integer, db.ForeignKey('users.id'))
     removed_quantity_sht = db.Column(db.Integer, default=0)
     removed_quantity_kg = db.Column(db.Float, default=0.0)
+    reserved_sht = db.Column(db.Integer, default=0)
+    reserved_kg = db.Column(db.Float, default=0.0)
     
     user = db.relationship('User', backref='batches_removed')
+    product = db.relationship('Product', lazy='joined')
+
+    @hybrid_property
+    def product_name(self):
+        return self.product.name if self.product else None
+
+    @product_name.expression
+    def product_name(cls):
+        return db.select(Product.name).where(Product.id == cls.product_id).scalar_subquery()
 
 
 class BatchMovement(db.Model):
@@ -80,7 +218,7 @@ class StockRequest(db.Model):
     __tablename__ = 'stock_requests'
 
     id = db.Column(db.Integer, primary_key=True)
-    product_name = db.Column(db.String(200), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     batch_code = db.Column(db.String(100), nullable=True)
     quantity_sht = db.Column(db.Integer, default=0)
     quantity_kg = db.Column(db.Float, default=0.0)
@@ -91,6 +229,179 @@ class StockRequest(db.Model):
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
 
     user = db.relationship('User', backref='stock_requests')
+    product = db.relationship('Product', lazy='joined')
+    reservations = db.relationship('StockReservation', backref='request', lazy='selectin',
+                                   cascade='all, delete-orphan')
+
+    @hybrid_property
+    def product_name(self):
+        return self.product.name if self.product else None
+
+    @product_name.expression
+    def product_name(cls):
+        return db.select(Product.name).where(Product.id == cls.product_id).scalar_subquery()
+
+
+class StockReservation(db.Model):
+    """So'rov uchun partiyadan band qilingan miqdor (bajarilganda chiqimga aylanadi)"""
+    __tablename__ = 'stock_reservations'
+
+    id = db.Column(db.Integer, primary_key=True)
+    request_id = db.Column(db.Integer, db.ForeignKey('stock_requests.id'), nullable=False)
+    batch_id = db.Column(db.Integer, db.ForeignKey('batches.id'), nullable=False)
+    quantity_sht = db.Column(db.Integer, default=0)
+    quantity_kg = db.Column(db.Float, default=0.0)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+    batch = db.relationship('Batch', lazy='joined')
+
+
+class ProductStock(db.Model):
+    """Mahsulot bo'yicha faol qoldiq va band qilingan miqdor (partiyalar bilan bir tranzaksiyada yangilanadi)"""
+    __tablename__ = 'product_stock'
+
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), primary_key=True)
+    quantity_sht = db.Column(db.Integer, nullable=False, default=0)
+    quantity_kg = db.Column(db.Float, nullable=False, default=0.0)
+    reserved_sht = db.Column(db.Integer, nullable=False, default=0)
+    reserved_kg = db.Column(db.Float, nullable=False, default=0.0)
+
+
+class UserActivity(db.Model):
+    """Foydalanuvchi faoliyati hisoblagichlari: foydalanuvchi va kun bo'yicha bitta qator (rollup).
+
+    Partiyalar bilan bir omborda - hisoblagichlar o'zgarish bilan bitta tranzaksiyada yangilanadi.
+    """
+    __tablename__ = 'user_activity'
+
+    user_id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    batches_removed = db.Column(db.Integer, default=0)
+    requests_created = db.Column(db.Integer, default=0)
+    requests_completed = db.Column(db.Integer, default=0)
+    requests_failed = db.Column(db.Integer, default=0)
+    released_sht = db.Column(db.Integer, default=0)
+    released_kg = db.Column(db.Float, default=0.0)
+
+
+class MaintenanceRun(db.Model):
+    """Texnik xizmat vazifalari natijasi: davomiylik va fayl hajmi"""
+    __tablename__ = 'maintenance_runs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    warehouse = db.Column(db.String(50), nullable=False)
+    task = db.Column(db.String(20), nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    duration_ms = db.Column(db.Integer, default=0)
+    size_before = db.Column(db.Integer, default=0)
+    size_after = db.Column(db.Integer, default=0)
+    ok = db.Column(db.Boolean, default=True)
+    detail = db.Column(db.String(255))
+
+
+class StockSnapshot(db.Model):
+    """Qoldiqlarning davriy suratlari (snapshot)"""
+    __tablename__ = 'stock_snapshots'
+
+    id = db.Column(db.Integer, primary_key=True)
+    taken_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    # Snapshotga kirgan oxirgi harakat (batch_movements.id): keyingilari as-of hisobida qo'shiladi
+    last_movement_id = db.Column(db.Integer)
+
+    items = db.relationship('StockSnapshotItem', backref='snapshot', cascade='all, delete-orphan')
+
+
+class StockSnapshotItem(db.Model):
+    """Snapshot paytidagi har bir partiya qoldig'i"""
+    __tablename__ = 'stock_snapshot_items'
+
+    id = db.Column(db.Integer, primary_key=True)
+    snapshot_id = db.Column(db.Integer, db.ForeignKey('stock_snapshots.id'), nullable=False)
+    batch_id = db.Column(db.Integer, db.ForeignKey('batches.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    batch_code = db.Column(db.String(100), nullable=False)
+    location = db.Column(db.String(100), nullable=False)
+    quantity_sht = db.Column(db.Integer, default=0)
+    quantity_kg = db.Column(db.Float, default=0.0)
+
+
+# ==================== WAREHOUSES ====================
+def app_state():
+    """Joriy ilovaning jarayon ichidagi holati (AppState)"""
+    return current_app.extensions['sklad']
+
+
+def default_warehouse():
+    """Asosiy ombor (WAREHOUSES ro'yxatida birinchisi)"""
+    return current_app.config['WAREHOUSES'][0]
+
+
+def current_warehouse():
+    """Joriy ombor identifikatori"""
+    return g.get('warehouse') or default_warehouse()
+
+
+def warehouse_engine(warehouse_id=None):
+    """Ombor SQLite faylining engine'i (asosiy ombor uchun None - standart bog'lanish)"""
+    warehouse_id = warehouse_id or current_warehouse()
+    if warehouse_id == default_warehouse():
+        return None
+
+    state = app_state()
+    engine = state.warehouse_engines.get(warehouse_id)
+    if engine is None:
+        with state.engines_lock:
+            engine = state.warehouse_engines.get(warehouse_id)
+            if engine is None:
+                os.makedirs(current_app.instance_path, exist_ok=True)
+                path = os.path.join(current_app.instance_path, f"sklad_{warehouse_id}.db")
+                engine = sa.create_engine(f"sqlite:///{path}")
+                db.metadata.create_all(engine, tables=[
+                    t for name, t in db.metadata.tables.items() if name in SHARDED_TABLES
+                ])
+                migrate_db(engine, main=False)
+                state.warehouse_engines[warehouse_id] = engine
+    return engine
+
+
+@contextmanager
+def warehouse_context(warehouse_id, app=None):
+    """Berilgan ombor uchun alohida app konteksti (fon oqimlari va CLI uchun)"""
+    with (app or current_app._get_current_object()).app_context():
+        g.warehouse = warehouse_id
+        yield
+
+
+def query_all_warehouses(fn, *args):
+    """fn ni barcha omborlarda parallel bajarish: {ombor: natija}"""
+    app = current_app._get_current_object()
+
+    def run(warehouse_id):
+        with warehouse_context(warehouse_id, app):
+            return fn(*args)
+
+    warehouses = current_app.config['WAREHOUSES']
+    return dict(zip(warehouses, app_state().warehouse_executor.map(run, warehouses)))
+
+
+class PerWarehouse:
+    """Har bir ombor (va ilova) uchun alohida xotiradagi obyekt"""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._lock = threading.Lock()
+
+    def get(self, warehouse_id=None):
+        key = (self, warehouse_id or current_warehouse())
+        items = app_state().per_warehouse
+        item = items.get(key)
+        if item is None:
+            with self._lock:
+                item = items.setdefault(key, self.factory())
+        return item
+
+
+product_cache = PerWarehouse(dict)
 
 
 # ==================== DECORATORS ====================
@@ -101,7 +412,7 @@ def login_required(f):
         if 'user_id' not in session:
             if request.is_json:
                 return jsonify({'error': 'Avtorizatsiya talab qilinadi'}), 401
-            return redirect(url_for('login'))
+            return redirect(url_for('sklad.login'))
         return f(*args, **kwargs)
     return decorated_function
 
@@ -118,8 +429,543 @@ def add_movement(batch, movement_type, qty_sht=0, qty_kg=0.0, created_at=None):
     db.session.add(movement)
 
 
+def adjust_product_stock(product_id, qty_sht=0, qty_kg=0.0, reserved_sht=0, reserved_kg=0.0):
+    """Mahsulot qoldig'i agregatiga o'zgarishni qo'shish (yozuv bo'lmasa yaratiladi)"""
+    stmt = sqlite_insert(ProductStock).values(
+        product_id=product_id,
+        quantity_sht=qty_sht,
+        quantity_kg=qty_kg,
+        reserved_sht=reserved_sht,
+        reserved_kg=reserved_kg
+    )
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['product_id'],
+        set_={
+            'quantity_sht': ProductStock.quantity_sht + stmt.excluded.quantity_sht,
+            'quantity_kg': ProductStock.quantity_kg + stmt.excluded.quantity_kg,
+            'reserved_sht': ProductStock.reserved_sht + stmt.excluded.reserved_sht,
+            'reserved_kg': ProductStock.reserved_kg + stmt.excluded.reserved_kg,
+        }
+    ))
+
+
+def record_activity(user_id, **counts):
+    """Foydalanuvchining bugungi hisoblagichlariga qo'shish (yozuv bo'lmasa yaratiladi)"""
+    if user_id is None:
+        return
+    stmt = sqlite_insert(UserActivity).values(user_id=user_id, day=datetime.now().date(), **counts)
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['user_id', 'day'],
+        set_={name: getattr(UserActivity, name) + getattr(stmt.excluded, name) for name in counts}
+    ))
+
+
+def lock_for_update(model, row_id):
+    """Yozish qulfini olish va qatorni qayta o'qish (None - topilmadi).
+
+    Bo'sh UPDATE tranzaksiyani yozuvchi sifatida boshlaydi: keyingi tekshiruvlar boshqa jarayonlar
+    commit qilgan oxirgi holatga qarshi bajariladi va commitgacha o'zgarmaydi.
+    """
+    db.session.execute(
+        db.update(model).where(model.id == row_id).values(id=model.id).execution_options(synchronize_session=False)
+    )
+    return db.session.get(model, row_id, populate_existing=True)
+
+
+def batch_available(batch):
+    """Partiyaning band qilinmagan qoldig'i: (dona, kg)"""
+    return (
+        (batch.quantity_sht or 0) - (batch.reserved_sht or 0),
+        round((batch.quantity_kg or 0.0) - (batch.reserved_kg or 0.0), 3)
+    )
+
+
+def withdraw_from_batch(batch, qty_sht, qty_kg, user_id):
+    """Tekshirilgan miqdorni partiyadan chiqarish va OUT harakatini yozish (to'liq chiqdimi?)"""
+    before_sht, before_kg = batch.quantity_sht or 0, batch.quantity_kg or 0.0
+
+    # Qisman chiqarish - qolgan miqdorni hisoblash
+    remaining_sht = batch.quantity_sht
+    remaining_kg = batch.quantity_kg
+    
+    if qty_sht is not None and remaining_sht is not None:
+        remaining_sht = remaining_sht - qty_sht
+    if qty_kg is not None and remaining_kg is not None:
+        remaining_kg = remaining_kg - qty_kg
+    
+    # Chiqarilgan miqdorlarni qo'shib saqlash (accumulated)
+    if qty_sht is not None:
+        batch.removed_quantity_sht = (batch.removed_quantity_sht or 0) + qty_sht
+    if qty_kg is not None:
+        batch.removed_quantity_kg = (batch.removed_quantity_kg or 0) + qty_kg
+    
+    # Qolgan miqdorni yangilash
+    batch.quantity_sht = remaining_sht
+    batch.quantity_kg = remaining_kg
+    
+    # Agar hammasi chiqarilgan bo'lsa
+    fully_removed = (remaining_sht is None or remaining_sht <= 0) and (remaining_kg is None or remaining_kg <= 0)
+    if fully_removed:
+        batch.status = 'REMOVED'
+        batch.removed_at = datetime.now()
+        batch.removed_by = user_id
+        batch.quantity_sht = 0
+        batch.quantity_kg = 0
+        batch.is_archived = True
+
+    add_movement(
+        batch,
+        movement_type='OUT',
+        qty_sht=qty_sht or 0,
+        qty_kg=qty_kg or 0.0,
+        created_at=datetime.now()
+    )
+    released_sht = before_sht - (batch.quantity_sht or 0)
+    released_kg = before_kg - (batch.quantity_kg or 0.0)
+    adjust_product_stock(batch.product_id, qty_sht=-released_sht, qty_kg=-released_kg)
+    record_activity(
+        user_id,
+        batches_removed=int(fully_removed),
+        released_sht=released_sht,
+        released_kg=round(released_kg, 3)
+    )
+    return fully_removed
+
+
+def intern_product(name):
+    """Mahsulot nomini lug'atdan topish yoki qo'shish: (id, kanonik nom)"""
+    key = product_key(name)
+    cache = product_cache.get()
+    cached = cache.get(key)
+    if cached:
+        return cached
+
+    row = db.session.query(Product.id, Product.name).filter_by(search_key=key).first()
+    if row is None:
+        db.session.execute(
+            sqlite_insert(Product)
+            .values(name=' '.join(name.split()), search_key=key)
+            .on_conflict_do_nothing(index_elements=['search_key'])
+        )
+        # Yangi yozuv tranzaksiya bekor qilinsa yo'qolishi mumkin - keshga qo'ymaymiz
+        row = db.session.query(Product.id, Product.name).filter_by(search_key=key).first()
+        return tuple(row)
+
+    cache[key] = tuple(row)
+    return cache[key]
+
+
+def take_stock_snapshot():
+    """Joriy qoldiqlarni snapshot sifatida saqlash"""
+    snapshot = StockSnapshot(taken_at=datetime.now())
+    db.session.add(snapshot)
+    db.session.flush()
+
+    # INSERT yozish qulfini oldi: qoldiqlar va harakatlar chegarasi bir xil holatdan o'qiladi.
+    # Vaqt emas, id chegara: harakat vaqti commitdan oldin (guruhli commitda kechikish bilan) belgilanadi
+    snapshot.last_movement_id = db.session.query(db.func.max(BatchMovement.id)).scalar() or 0
+
+    rows = db.session.query(
+        Batch.id, Batch.product_id, Batch.batch_code, Batch.location,
+        Batch.quantity_sht, Batch.quantity_kg
+    ).filter(
+        Batch.status == 'ACTIVE',
+        ((Batch.quantity_sht != None) & (Batch.quantity_sht > 0)) |
+        ((Batch.quantity_kg != None) & (Batch.quantity_kg > 0))
+    ).all()
+
+    db.session.bulk_insert_mappings(StockSnapshotItem, [{
+        'snapshot_id': snapshot.id,
+        'batch_id': r.id,
+        'product_id': r.product_id,
+        'batch_code': r.batch_code,
+        'location': r.location,
+        'quantity_sht': r.quantity_sht or 0,
+        'quantity_kg': r.quantity_kg or 0.0
+    } for r in rows])
+    db.session.commit()
+    return snapshot
+
+
+# ==================== LOCATION INDEX ====================
+def index_outdated(index):
+    """Boshqa worker jarayoni yozgan bo'lsa (data_version o'zgargan) xotiradagi indeks eskirgan.
+
+    INDEX_REFRESH_SECONDS oralig'ida bir martadan ko'p tekshirilmaydi.
+    """
+    interval = current_app.config['INDEX_REFRESH_SECONDS']
+    now = time.monotonic()
+    if not interval or now - index.checked_at < interval:
+        return False
+    index.checked_at = now
+    return data_version() != index.version
+
+
+class LocationIndex:
+    """Yacheykalar bandligining xotiradagi bitmapi.
+
+    Har bir yacheyka bitta bit: ``sektor * qatorlar * yacheykalar + (qator-1) * yacheykalar + (yacheyka-1)``.
+    Ishga tushganda bitta GROUP BY so'rovi bilan quriladi va create_batch/remove_batch
+    tomonidan yangilanadi.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.version = None
+        self.checked_at = 0.0
+        self.bitmap = 0
+        self._counts = {}     # yacheyka indeksi -> faol partiyalar soni
+        self._products = {}   # yacheyka indeksi -> {mahsulot nomi: soni}
+
+    @staticmethod
+    def cell_index(location):
+        """'A-1-1' -> bit indeksi (to'rdan tashqari bo'lsa None)"""
+        try:
+            sector, row, cell = location.split('-')
+            sector_idx = WAREHOUSE_SECTORS.index(sector.upper())
+            row, cell = int(row), int(cell)
+        except (ValueError, AttributeError):
+            return None
+        if not (1 <= row <= WAREHOUSE_ROWS and 1 <= cell <= WAREHOUSE_CELLS):
+            return None
+        return (sector_idx * WAREHOUSE_ROWS + row - 1) * WAREHOUSE_CELLS + cell - 1
+
+    @staticmethod
+    def cell_location(idx):
+        """Bit indeksi -> (sektor, qator, yacheyka)"""
+        cell = idx % WAREHOUSE_CELLS + 1
+        row = idx // WAREHOUSE_CELLS % WAREHOUSE_ROWS + 1
+        sector = WAREHOUSE_SECTORS[idx // (WAREHOUSE_CELLS * WAREHOUSE_ROWS)]
+        return sector, row, cell
+
+    def rebuild(self):
+        """Bitmapni bazadan qayta qurish"""
+        version = data_version()
+        rows = db.session.query(
+            Batch.location, Product.search_key, db.func.count(Batch.id)
+        ).join(Product, Product.id == Batch.product_id).filter(
+            ((Batch.quantity_sht != None) & (Batch.quantity_sht > 0)) |
+            ((Batch.quantity_kg != None) & (Batch.quantity_kg > 0))
+        ).group_by(Batch.location, Batch.product_id).all()
+
+        with self._lock:
+            self.bitmap = 0
+            self._counts = {}
+            self._products = {}
+            for location, key, count in rows:
+                self._add(location, key, count)
+            self._loaded = True
+            self.version, self.checked_at = version, time.monotonic()
+
+    def ensure_loaded(self):
+        if not self._loaded or index_outdated(self):
+            self.rebuild()
+
+    def _add(self, location, key, count=1):
+        idx = self.cell_index(location)
+        if idx is None:
+            return
+        self._counts[idx] = self._counts.get(idx, 0) + count
+        products = self._products.setdefault(idx, {})
+        products[key] = products.get(key, 0) + count
+        self.bitmap |= 1 << idx
+
+    def add(self, location, product_name):
+        """Yacheykaga partiya qo'yildi"""
+        with self._lock:
+            if self._loaded:
+                self._add(location, product_key(product_name))
+
+    def remove(self, location, product_name):
+        """Partiya yacheykadan to'liq chiqarildi"""
+        idx = self.cell_index(location)
+        if idx is None:
+            return
+        with self._lock:
+            if not self._loaded or idx not in self._counts:
+                return
+            products = self._products[idx]
+            key = product_key(product_name)
+            if key in products:
+                products[key] -= 1
+                if products[key] <= 0:
+                    del products[key]
+            self._counts[idx] -= 1
+            if self._counts[idx] <= 0:
+                del self._counts[idx]
+                del self._products[idx]
+                self.bitmap &= ~(1 << idx)
+
+    def suggest(self, sector=None, row=None, product_name=None, limit=5):
+        """Afzal sektor/qatorga eng yaqin bo'sh (yoki shu mahsulotli) yacheykalar"""
+        self.ensure_loaded()
+        sector_idx = WAREHOUSE_SECTORS.index(sector) if sector in WAREHOUSE_SECTORS else None
+        key = product_key(product_name) if product_name else None
+
+        def distance(idx):
+            s, r, c = self.cell_location(idx)
+            s_idx = WAREHOUSE_SECTORS.index(s)
+            return (
+                abs(s_idx - sector_idx) if sector_idx is not None else s_idx,
+                abs(r - row) if row else r,
+                c
+            )
+
+        with self._lock:
+            bitmap = self.bitmap
+            same_product = [
+                idx for idx, products in self._products.items()
+                if key and key in products
+            ]
+
+        total = len(WAREHOUSE_SECTORS) * WAREHOUSE_ROWS * WAREHOUSE_CELLS
+        free = [idx for idx in range(total) if not bitmap >> idx & 1]
+
+        candidates = ([(idx, 'same_product') for idx in sorted(same_product, key=distance)] +
+                      [(idx, 'free') for idx in sorted(free, key=distance)])
+
+        result = []
+        for idx, reason in candidates[:limit]:
+            s, r, c = self.cell_location(idx)
+            result.append({'location': f"{s}-{r}-{c}", 'reason': reason})
+        return result
+
+
+location_indexes = PerWarehouse(LocationIndex)
+
+
+# ==================== AUTOCOMPLETE INDEX ====================
+class PrefixIndex:
+    """Faol partiyalar ustuni bo'yicha xotiradagi saralangan prefiks indeksi"""
+
+    def __init__(self, column, group_by=None):
+        self.column = column
+        self.group_by = group_by if group_by is not None else column
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.version = None
+        self.checked_at = 0.0
+        self._keys = []       # saralangan kichik harfli kalitlar
+        self._entries = {}    # kalit -> [asl qiymat, faol partiyalar soni]
+
+    def rebuild(self):
+        """Indeksni bazadan qayta qurish"""
+        version = data_version()
+        rows = db.session.query(self.column, db.func.count(Batch.id)).select_from(Batch).join(
+            Product, Product.id == Batch.product_id
+        ).filter(
+            Batch.status == 'ACTIVE'
+        ).group_by(self.group_by).all()
+
+        with self._lock:
+            self._entries = {}
+            for value, count in rows:
+                if value:
+                    self._add(value, count)
+            self._keys = sorted(self._entries)
+            self._loaded = True
+            self.version, self.checked_at = version, time.monotonic()
+
+    def ensure_loaded(self):
+        if not self._loaded or index_outdated(self):
+            self.rebuild()
+
+    def _add(self, value, count):
+        key = value.lower()
+        entry = self._entries.get(key)
+        if entry is None:
+            self._entries[key] = [value, count]
+            return True
+        entry[1] += count
+        return False
+
+    def add(self, value):
+        """Yangi faol partiya qo'shildi"""
+        if not value:
+            return
+        with self._lock:
+            if self._loaded and self._add(value, 1):
+                bisect.insort(self._keys, value.lower())
+
+    def remove(self, value):
+        """Partiya faol bo'lmay qoldi"""
+        if not value:
+            return
+        key = value.lower()
+        with self._lock:
+            entry = self._entries.get(key) if self._loaded else None
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._entries[key]
+                i = bisect.bisect_left(self._keys, key)
+                if i < len(self._keys) and self._keys[i] == key:
+                    del self._keys[i]
+
+    def search(self, prefix, limit=10):
+        """Prefiks bilan boshlanuvchi eng ko'p uchraydigan qiymatlar"""
+        self.ensure_loaded()
+        prefix = prefix.lower()
+        with self._lock:
+            lo = bisect.bisect_left(self._keys, prefix)
+            hi = bisect.bisect_left(self._keys, prefix + '\U0010ffff')
+            matches = [self._entries[k] for k in self._keys[lo:hi]]
+        top = heapq.nlargest(limit, matches, key=lambda e: e[1])
+        return [{'value': value, 'count': count} for value, count in top]
+
+
+autocomplete_indexes = PerWarehouse(lambda: {
+    'batch_code': PrefixIndex(Batch.batch_code),
+    'product_name': PrefixIndex(Product.name, group_by=Batch.product_id)
+})
+
+
+# ==================== WRITE COORDINATOR ====================
+class WriteError(Exception):
+    """Yozish operatsiyasi tekshiruvdan o'tmadi (faqat o'z chaqiruvchisiga qaytariladi)"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class WriteCoordinator:
+    """Guruhli commit: ko'p oqimdan kelgan yozuvlarni bitta tranzaksiyada saqlash.
+
+    Har bir operatsiya ``fn(*args) -> (natija, after_commit)`` ko'rinishida bo'lib,
+    tekshiruvni o'zgartirishlardan oldin bajaradi. Chaqiruvchi o'z guruhi commit
+    qilingandan keyingina javob oladi.
+    """
+
+    def __init__(self, app, max_ops, max_delay, timeout):
+        self.app = app
+        self.max_ops = max_ops
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self._queues = {}
+        self._lock = threading.Lock()
+
+    def submit(self, warehouse_id, fn, *args):
+        """Operatsiyani navbatga qo'yish va commit bo'lguncha kutish"""
+        q = self._queues.get(warehouse_id)
+        if q is None:
+            with self._lock:
+                q = self._queues.get(warehouse_id)
+                if q is None:
+                    q = self._queues[warehouse_id] = queue.Queue()
+                    threading.Thread(
+                        target=self._run, args=(warehouse_id, q),
+                        name=f"write-{warehouse_id}", daemon=True
+                    ).start()
+        future = Future()
+        q.put((fn, args, future))
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # Hali navbatda bo'lsa bekor qilinadi; bajarilayotgan bo'lsa natijasi keyin commit bo'lishi mumkin
+            future.cancel()
+            raise WriteError('Yozish navbati javob bermadi, qayta urinib ko\'ring', 503)
+
+    def _run(self, warehouse_id, q):
+        with warehouse_context(warehouse_id, self.app):
+            while True:
+                ops = [q.get()]
+                deadline = time.monotonic() + self.max_delay
+                while len(ops) < self.max_ops:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        ops.append(q.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+                # Kutish vaqti tugab bekor qilinganlar bajarilmaydi
+                ops = [op for op in ops if op[2].set_running_or_notify_cancel()]
+                try:
+                    if not self._apply(ops):
+                        # Kutilmagan xato: har birini alohida tranzaksiyada qayta bajarish
+                        for op in ops:
+                            if not op[2].done():
+                                self._apply([op])
+                except Exception as e:
+                    # Oqim to'xtamasligi kerak: aks holda shu omborning barcha yozuvlari osilib qoladi
+                    self.app.logger.exception('Yozish navbati xatosi')
+                    self._rollback()
+                    for _, _, future in ops:
+                        if not future.done():
+                            future.set_exception(e)
+
+    def _rollback(self):
+        try:
+            db.session.rollback()
+        except Exception:
+            self.app.logger.exception('Rollback xatosi')
+            db.session.remove()
+
+    def _apply(self, ops):
+        applied = []
+        for fn, args, future in ops:
+            try:
+                result, after_commit = fn(*args)
+            except WriteError as e:
+                future.set_exception(e)
+                continue
+            except Exception as e:
+                self._rollback()
+                if len(ops) > 1:
+                    return False
+                self.app.logger.exception('Yozish xatosi')
+                future.set_exception(e)
+                return True
+            applied.append((future, result, after_commit))
+
+        try:
+            db.session.commit()
+        except Exception as e:
+            self._rollback()
+            if len(ops) > 1:
+                return False
+            self.app.logger.exception('Commit xatosi')
+            for future, _, _ in applied:
+                future.set_exception(e)
+            return True
+
+        for future, result, after_commit in applied:
+            run_after_commit(after_commit)
+            future.set_result(result)
+        return True
+
+
+def run_after_commit(after_commit):
+    """Commitdan keyingi ish (xotiradagi indekslar): xatosi saqlangan yozuvni muvaffaqiyatsiz qilmaydi"""
+    if after_commit is None:
+        return
+    try:
+        after_commit()
+    except Exception:
+        current_app.logger.exception('Commitdan keyingi yangilash xatosi')
+
+
+def execute_write(fn, *args):
+    """Yozish operatsiyasini bajarish: guruhli commit yoqilgan bo'lsa koordinator orqali"""
+    if current_app.config['GROUP_COMMIT']:
+        return app_state().write_coordinator.submit(current_warehouse(), fn, *args)
+
+    try:
+        result, after_commit = fn(*args)
+    except WriteError:
+        db.session.rollback()
+        raise
+    db.session.commit()
+    run_after_commit(after_commit)
+    return result
+
+
 # ==================== MIDDLEWARE ====================
-@app.after_request
+@bp.after_app_request
 def set_cache_headers(response):
     """API javoblarini keshlamaslik"""
     if request.path.startswith('/api/'):
@@ -129,8 +975,211 @@ def set_cache_headers(response):
     return response
 
 
+@bp.before_app_request
+def select_warehouse():
+    """So'rov uchun omborni tanlash: URL (?warehouse=), sarlavha yoki sessiya"""
+    warehouse_id = request.args.get('warehouse') or request.headers.get('X-Warehouse')
+    if warehouse_id and warehouse_id not in current_app.config['WAREHOUSES']:
+        return jsonify({'error': 'Ombor topilmadi'}), 404
+    if not warehouse_id:
+        warehouse_id = session.get('warehouse')
+        if warehouse_id not in current_app.config['WAREHOUSES']:
+            warehouse_id = default_warehouse()
+    g.warehouse = warehouse_id
+
+
+# ==================== RESPONSE FORMATS ====================
+# Ro'yxat endpointlari formatlari: ?format= yoki Accept sarlavhasi bo'yicha tanlanadi
+LIST_FORMATS = {
+    'json': 'application/json',
+    'columnar': 'application/vnd.sklad.columnar+json',
+    'msgpack': 'application/msgpack',
+}
+MSGPACK_ALIAS = 'application/x-msgpack'
+
+# Dinamik javoblarni siqish: tezlik va hajm o'rtasidagi muvozanat (statik fayllar oldindan maksimal siqiladi)
+COMPRESSIBLE_MIMETYPES = {
+    LIST_FORMATS['json'], LIST_FORMATS['columnar'], LIST_FORMATS['msgpack'],
+    'text/html', 'text/plain', 'text/csv',
+}
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def columnar(value):
+    """Lug'atlar ro'yxatini ustunli ko'rinishga o'tkazish: kalitlar bir marta, qiymatlar ustun bo'yicha"""
+    if isinstance(value, dict):
+        return {key: columnar(item) for key, item in value.items()}
+    if isinstance(value, list) and value and all(isinstance(item, dict) for item in value):
+        columns = list(dict.fromkeys(key for item in value for key in item))
+        return {
+            'columns': columns,
+            'data': [[columnar(item.get(key)) for item in value] for key in columns]
+        }
+    if isinstance(value, list):
+        return [columnar(item) for item in value]
+    return value
+
+
+def list_format():
+    """So'ralgan ro'yxat formati (None - format qo'llab-quvvatlanmaydi)"""
+    available = [name for name in LIST_FORMATS if name != 'msgpack' or msgpack is not None]
+    name = request.args.get('format')
+    if name:
+        return name if name in available else None
+
+    offered = [LIST_FORMATS[name] for name in available]
+    if msgpack is not None:
+        offered.append(MSGPACK_ALIAS)
+    best = request.accept_mimetypes.best_match(offered, default=LIST_FORMATS['json'])
+    if best == MSGPACK_ALIAS:
+        return 'msgpack'
+    return next(name for name in available if LIST_FORMATS[name] == best)
+
+
+def list_response(payload):
+    """Ro'yxatli javob: JSON (standart), ustunli JSON yoki MessagePack"""
+    name = list_format()
+    if name is None:
+        response = jsonify({'error': 'Javob formati qo\'llab-quvvatlanmaydi'})
+        response.status_code = 406
+    elif name == 'json':
+        response = jsonify(payload)
+    elif name == 'columnar':
+        response = current_app.response_class(current_app.json.dumps(columnar(payload)),
+                                              mimetype=LIST_FORMATS['columnar'])
+    else:
+        response = current_app.response_class(msgpack.packb(columnar(payload), use_bin_type=True),
+                                              mimetype=LIST_FORMATS['msgpack'])
+    response.vary.add('Accept')
+    return response
+
+
+def compress_stream(chunks, encoding):
+    """Oqimli javobni bo'laklab siqish (butun javobni xotiraga yig'masdan)"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        compress, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: gzip sarlavhasi bilan
+        compress, finish = compressor.compress, compressor.flush
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = compress(chunk)
+            if data:
+                yield data
+        yield finish()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+@bp.after_app_request
+def compress_response(response):
+    """Katta JSON/MessagePack/CSV javoblarni gzip yoki brotli bilan siqish"""
+    if (request.method == 'HEAD' or response.status_code in (204, 304) or response.direct_passthrough
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    if brotli is not None and request.accept_encodings['br']:
+        encoding = 'br'
+    elif request.accept_encodings['gzip']:
+        encoding = 'gzip'
+    else:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < current_app.config['COMPRESS_MIN_SIZE']:
+            return response
+        if encoding == 'br':
+            response.set_data(brotli.compress(data, quality=BROTLI_QUALITY))
+        else:
+            response.set_data(gzip.compress(data, GZIP_LEVEL))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+# ==================== STATIC ASSETS ====================
+asset_cache = {}
+asset_cache_lock = threading.Lock()
+ASSET_ETAG_SUFFIXES = {'br': '-br', 'gzip': '-gz', None: ''}
+
+
+def load_asset(filename):
+    """Statik faylni xesh va oldindan siqilgan variantlari bilan yuklash (mtime bo'yicha keshlanadi)"""
+    path = safe_join(current_app.static_folder, filename)
+    if path is None or not os.path.isfile(path):
+        return None
+
+    mtime = os.path.getmtime(path)
+    asset = asset_cache.get(filename)
+    if asset is not None and asset['mtime'] == mtime:
+        return asset
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    asset = {
+        'mtime': mtime,
+        'hash': hashlib.sha256(data).hexdigest()[:12],
+        'mimetype': mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+        'identity': data,
+        'gzip': gzip.compress(data, 9),
+        'br': brotli.compress(data, quality=11) if brotli else None
+    }
+    with asset_cache_lock:
+        asset_cache[filename] = asset
+    return asset
+
+
+@bp.app_template_global()
+def asset_url(filename):
+    """Kontent xeshi qo'shilgan statik fayl URL manzili: css/app.css -> /assets/css/app.<xesh>.css"""
+    asset = load_asset(filename)
+    if asset is None:
+        return url_for('static', filename=filename)
+    name, ext = os.path.splitext(filename)
+    return url_for('sklad.serve_asset', filename=f"{name}.{asset['hash']}{ext}")
+
+
+@bp.route('/assets/<path:filename>')
+def serve_asset(filename):
+    """Xeshlangan statik fayllar: o'zgarmas kesh, gzip/brotli variantlari"""
+    name, ext = os.path.splitext(filename)
+    name, _, digest = name.rpartition('.')
+    asset = load_asset(name + ext) if name else None
+    if asset is None:
+        return render_template('404.html'), 404
+
+    encoding = None
+    if asset['br'] is not None and request.accept_encodings['br']:
+        encoding = 'br'
+    elif request.accept_encodings['gzip']:
+        encoding = 'gzip'
+
+    response = Response(asset[encoding or 'identity'], mimetype=asset['mimetype'])
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    # Har bir kodlash o'z tanasi - ETag ham alohida, aks holda kesh boshqa kodlash uchun 304 qaytaradi
+    response.set_etag(asset['hash'] + ASSET_ETAG_SUFFIXES[encoding])
+    if digest == asset['hash']:
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        # Eski xesh (deploydan keyin): joriy faylni qaytarish, lekin keshlamaslik
+        response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+
 # ==================== AUTH ROUTES ====================
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     """Login sahifasi"""
     if request.method == 'POST':
@@ -149,23 +1198,46 @@ def login():
     return render_template('login.html')
 
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     """Chiqish"""
     session.clear()
-    return redirect(url_for('login'))
+    return redirect(url_for('sklad.login'))
 
 
 # ==================== MAIN ROUTES ====================
-@app.route('/')
+@bp.route('/')
 @login_required
 def index():
     """Bosh sahifa"""
     return render_template('index.html')
 
 
+# ==================== WAREHOUSE API ====================
+@bp.route('/api/warehouses', methods=['GET'])
+@login_required
+def get_warehouses():
+    """Omborlar ro'yxati va joriy ombor"""
+    return jsonify({
+        'warehouses': current_app.config['WAREHOUSES'],
+        'current': current_warehouse()
+    })
+
+
+@bp.route('/api/warehouse', methods=['PUT'])
+@login_required
+def select_session_warehouse():
+    """Sessiya uchun omborni tanlash"""
+    data = request.get_json(silent=True) or {}
+    warehouse_id = data.get('warehouse')
+    if warehouse_id not in current_app.config['WAREHOUSES']:
+        return jsonify({'error': 'Ombor topilmadi'}), 404
+    session['warehouse'] = warehouse_id
+    return jsonify({'success': True, 'current': warehouse_id})
+
+
 # ==================== USER API ====================
-@app.route('/api/user', methods=['GET'])
+@bp.route('/api/user', methods=['GET'])
 @login_required
 def get_user():
     """Joriy foydalanuvchi ma'lumotlari"""
@@ -177,7 +1249,7 @@ def get_user():
     })
 
 
-@app.route('/api/user/password', methods=['POST'])
+@bp.route('/api/user/password', methods=['POST'])
 @login_required
 def change_password():
     """Parolni o'zgartirish"""
@@ -199,23 +1271,80 @@ def change_password():
     return jsonify({'success': True, 'message': 'Parol muvaffaqiyatli o\'zgartirildi!'})
 
 
-@app.route('/api/user/activity', methods=['GET'])
+ACTIVITY_COUNTERS = (
+    'batches_removed', 'requests_created', 'requests_completed', 'requests_failed', 'released_sht', 'released_kg'
+)
+# group_by -> SQLite strftime formati
+ACTIVITY_PERIODS = {'day': '%Y-%m-%d', 'month': '%Y-%m'}
+
+
+def user_activity_query(user_id, period=None, start=None, end=None):
+    """Foydalanuvchi hisoblagichlari yig'indisi (period berilsa - davrlar bo'yicha) rollup jadvalidan"""
+    columns = [db.func.coalesce(db.func.sum(getattr(UserActivity, name)), 0) for name in ACTIVITY_COUNTERS]
+    query = db.session.query(*columns).filter(UserActivity.user_id == user_id)
+    if start is not None:
+        query = query.filter(UserActivity.day >= start)
+    if end is not None:
+        query = query.filter(UserActivity.day <= end)
+    if period is not None:
+        bucket = db.func.strftime(ACTIVITY_PERIODS[period], UserActivity.day)
+        query = query.add_columns(bucket).group_by(bucket).order_by(bucket)
+    return query
+
+
+def activity_json(values):
+    counters = dict(zip(ACTIVITY_COUNTERS, values))
+    counters['released_kg'] = round(counters['released_kg'] or 0.0, 3)
+    return counters
+
+
+@bp.route('/api/user/activity', methods=['GET'])
 @login_required
 def get_user_activity():
-    """Foydalanuvchi faoliyati statistikasi"""
+    """Foydalanuvchi faoliyati: hisoblagichlar jami yoki ?group_by=day|month&start=&end= vaqt qatori"""
     user_id = session['user_id']
-    total_batches = Batch.query.filter_by(status='ACTIVE').count()
-    removed_batches = Batch.query.filter_by(status='REMOVED', removed_by=user_id).count()
-    
-    return jsonify({
-        'total_batches': total_batches,
-        'removed_batches': removed_batches,
-        'last_active': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    group_by = request.args.get('group_by')
+    if not group_by:
+        totals = activity_json(user_activity_query(user_id).one())
+        return jsonify(dict(
+            totals,
+            total_batches=db.session.query(db.func.count(Batch.id)).filter(Batch.status == 'ACTIVE').scalar(),
+            removed_batches=totals['batches_removed'],
+            last_active=datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        ))
+
+    if group_by not in ACTIVITY_PERIODS:
+        return jsonify({'error': 'group_by: day yoki month'}), 400
+    try:
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if request.args.get('end') \
+            else datetime.now().date()
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d').date() if request.args.get('start') \
+            else end - timedelta(days=29 if group_by == 'day' else 364)
+    except ValueError:
+        return jsonify({'error': 'Sanalar noto\'g\'ri formatda'}), 400
+    if start > end or (end - start).days > 3660:
+        return jsonify({'error': 'Davr noto\'g\'ri'}), 400
+
+    rows = {row[-1]: row[:-1] for row in user_activity_query(user_id, group_by, start, end)}
+    # Faoliyatsiz davrlar ham nol qiymatlar bilan qaytariladi
+    periods = []
+    day = start
+    while day <= end:
+        period = day.strftime(ACTIVITY_PERIODS[group_by])
+        if not periods or periods[-1] != period:
+            periods.append(period)
+        day += timedelta(days=1)
+    zero = (0,) * len(ACTIVITY_COUNTERS)
+    return list_response({
+        'group_by': group_by,
+        'start': start.strftime('%Y-%m-%d'),
+        'end': end.strftime('%Y-%m-%d'),
+        'series': [dict(activity_json(rows.get(period, zero)), period=period) for period in periods]
     })
 
 
 # ==================== BATCH API ====================
-@app.route('/api/batches', methods=['GET'])
+@bp.route('/api/batches', methods=['GET'])
 @login_required
 def get_batches():
     """Barcha partiyalarni olish"""
@@ -228,7 +1357,7 @@ def get_batches():
                 (b.quantity_kg == 0 or b.quantity_kg is None))
     ]
     
-    return jsonify([{
+    return list_response([{
         'id': b.id,
         'product_name': b.product_name,
         'batch_code': b.batch_code,
@@ -247,7 +1376,7 @@ def get_batches():
     } for b in filtered])
 
 
-@app.route('/api/batches', methods=['POST'])
+@bp.route('/api/batches', methods=['POST'])
 @login_required
 def create_batch():
     """Yangi partiya qo'shish"""
@@ -289,15 +1418,29 @@ def create_batch():
     if (quantity_sht is None or quantity_sht == 0) and (quantity_kg is None or quantity_kg == 0):
         return jsonify({'error': 'Kamida bitta miqdor kiritilishi kerak (dona yoki kg)'}), 400
     
+    try:
+        batch_id = execute_write(
+            apply_create_batch, product_name, batch_code, location,
+            quantity_sht, quantity_kg, data.get('comment', '').strip()
+        )
+    except WriteError as e:
+        return jsonify({'error': e.message}), e.status
+    
+    return jsonify({'success': True, 'batch_id': batch_id}), 201
+
+
+def apply_create_batch(product_name, batch_code, location, quantity_sht, quantity_kg, comment):
+    """Tekshirilgan partiyani yozish (bitta tranzaksiya ichida)"""
     quantity = quantity_sht or quantity_kg or 0
+    product_id, product_name = intern_product(product_name)
     
     batch = Batch(
-        product_name=product_name,
+        product_id=product_id,
         batch_code=batch_code,
         quantity=quantity,
         quantity_sht=quantity_sht,
         quantity_kg=quantity_kg,
-        comment=data.get('comment', '').strip(),
+        comment=comment,
         location=location,
         status='ACTIVE',
         is_archived=False,
@@ -306,7 +1449,7 @@ def create_batch():
     )
     
     db.session.add(batch)
-    db.session.commit()
+    db.session.flush()
 
     add_movement(
         batch,
@@ -315,111 +1458,97 @@ def create_batch():
         qty_kg=quantity_kg or 0.0,
         created_at=batch.created_at
     )
-    db.session.commit()
-    
-    return jsonify({'success': True, 'batch_id': batch.id}), 201
+    adjust_product_stock(product_id, qty_sht=quantity_sht or 0, qty_kg=quantity_kg or 0.0)
 
+    def after_commit():
+        location_indexes.get().add(location, product_name)
+        autocomplete_indexes.get()['batch_code'].add(batch_code)
+        autocomplete_indexes.get()['product_name'].add(product_name)
 
-@app.route('/api/batches/<int:batch_id>/remove', methods=['PUT'])
+    return batch.id, after_commit
+
+
+@bp.route('/api/batches/<int:batch_id>/remove', methods=['PUT'])
 @login_required
 def remove_batch(batch_id):
     """Partiyani chiqarish"""
-    batch = db.session.get(Batch, batch_id)
+    data = request.get_json(silent=True) or {}
+    try:
+        execute_write(apply_remove_batch, batch_id, data, session['user_id'])
+    except WriteError as e:
+        return jsonify({'error': e.message}), e.status
+    
+    return jsonify({'success': True})
+
+
+def apply_remove_batch(batch_id, data, user_id):
+    """Chiqarishni tekshirish va yozish (xatoda hech narsa o'zgartirilmaydi)"""
+    # Band qilingan miqdor qulf ostida o'qiladi - parallel so'rov bandi chiqarib yuborilmaydi
+    batch = lock_for_update(Batch, batch_id)
     
     if not batch:
-        return jsonify({'error': 'Partiya topilmadi'}), 404
+        raise WriteError('Partiya topilmadi', 404)
     
     if batch.is_archived:
-        return jsonify({'error': 'Arxivlangan partiya o\'zgartirilishi mumkin emas'}), 403
+        raise WriteError('Arxivlangan partiya o\'zgartirilishi mumkin emas', 403)
     
-    data = request.get_json(silent=True) or {}
     qty_sht = data.get('quantity_sht')
     qty_kg = data.get('quantity_kg')
     
     if qty_sht is None and qty_kg is None:
-        return jsonify({'error': 'Miqdor kiritilmadi'}), 400
+        raise WriteError('Miqdor kiritilmadi')
+    
+    # So'rovlar uchun band qilingan miqdorni chiqarib bo'lmaydi
+    available_sht, available_kg = batch_available(batch)
     
     # Dona miqdorini tekshirish
     if qty_sht is not None:
         try:
             qty_sht = int(qty_sht)
         except (ValueError, TypeError):
-            return jsonify({'error': 'Noto\'g\'ri dona miqdor'}), 400
+            raise WriteError('Noto\'g\'ri dona miqdor')
         
-        if qty_sht < 0 or (batch.quantity_sht is not None and qty_sht > batch.quantity_sht):
-            return jsonify({'error': f'Dona miqdor 0 dan {batch.quantity_sht} gacha bo\'lishi kerak'}), 400
+        if qty_sht < 0 or (batch.quantity_sht is not None and qty_sht > available_sht):
+            reserved = f' ({batch.reserved_sht} dona so\'rovlar uchun band)' if batch.reserved_sht else ''
+            raise WriteError(f'Dona miqdor 0 dan {available_sht} gacha bo\'lishi kerak{reserved}')
     
     # Kg miqdorini tekshirish
     if qty_kg is not None:
         try:
             qty_kg = float(qty_kg)
         except (ValueError, TypeError):
-            return jsonify({'error': 'Noto\'g\'ri kg miqdor'}), 400
+            raise WriteError('Noto\'g\'ri kg miqdor')
         
-        if qty_kg < 0 or (batch.quantity_kg is not None and qty_kg > batch.quantity_kg):
-            return jsonify({'error': f'Kg miqdor 0 dan {batch.quantity_kg} gacha bo\'lishi kerak'}), 400
-    
-    # Qisman chiqarish - qolgan miqdorni hisoblash
-    remaining_sht = batch.quantity_sht
-    remaining_kg = batch.quantity_kg
-    
-    if qty_sht is not None and remaining_sht is not None:
-        remaining_sht = remaining_sht - qty_sht
-    if qty_kg is not None and remaining_kg is not None:
-        remaining_kg = remaining_kg - qty_kg
-    
-    # Chiqarilgan miqdorlarni qo'shib saqlash (accumulated)
-    if qty_sht is not None:
-        batch.removed_quantity_sht = (batch.removed_quantity_sht or 0) + qty_sht
-    if qty_kg is not None:
-        batch.removed_quantity_kg = (batch.removed_quantity_kg or 0) + qty_kg
-    
-    # Qolgan miqdorni yangilash
-    batch.quantity_sht = remaining_sht
-    batch.quantity_kg = remaining_kg
+        if qty_kg < 0 or (batch.quantity_kg is not None and qty_kg > available_kg):
+            reserved = f' ({batch.reserved_kg} kg so\'rovlar uchun band)' if batch.reserved_kg else ''
+            raise WriteError(f'Kg miqdor 0 dan {available_kg} gacha bo\'lishi kerak{reserved}')
     
-    # Agar hammasi chiqarilgan bo'lsa
-    if (remaining_sht is None or remaining_sht <= 0) and (remaining_kg is None or remaining_kg <= 0):
-        batch.status = 'REMOVED'
-        batch.removed_at = datetime.now()
-        batch.removed_by = session['user_id']
-        batch.quantity_sht = 0
-        batch.quantity_kg = 0
-        batch.is_archived = True
+    fully_removed = withdraw_from_batch(batch, qty_sht, qty_kg, user_id)
 
-    add_movement(
-        batch,
-        movement_type='OUT',
-        qty_sht=qty_sht or 0,
-        qty_kg=qty_kg or 0.0,
-        created_at=datetime.now()
-    )
-    
-    db.session.commit()
-    
-    return jsonify({'success': True})
+    location, product_name, batch_code = batch.location, batch.product_name, batch.batch_code
+
+    def after_commit():
+        if fully_removed:
+            location_indexes.get().remove(location, product_name)
+            autocomplete_indexes.get()['batch_code'].remove(batch_code)
+            autocomplete_indexes.get()['product_name'].remove(product_name)
+
+    return None, after_commit
 
 
 # ==================== SEARCH API ====================
-@app.route('/api/search', methods=['GET'])
+@bp.route('/api/search', methods=['GET'])
 @login_required
 def search():
     """Partiyalarni qidirish"""
     query = request.args.get('q', '').lower()
     
     if not query:
-        return jsonify([])
+        return list_response([])
     
-    results = Batch.query.filter(
-        Batch.status == 'ACTIVE',
-        db.or_(
-            Batch.batch_code.ilike(f'%{query}%'),
-            Batch.product_name.ilike(f'%{query}%'),
-            Batch.location.ilike(f'%{query}%')
-        )
-    ).all()
+    results = quick_search_query(query).all()
     
-    return jsonify([{
+    return list_response([{
         'id': b.id,
         'product_name': b.product_name,
         'batch_code': b.batch_code,
@@ -428,11 +1557,35 @@ def search():
         'quantity_kg': b.quantity_kg or 0.0,
         'location': b.location,
         'is_archived': b.is_archived,
-        'created_at': b.created_at.strftime('%Y-%m-%d %H:%M')
+        'created_at': b.created_at.strftime('%Y-%m-%d %H:%M'),
+        **availability_json(b)
     } for b in results])
 
 
-@app.route('/api/batches/search', methods=['GET'])
+def quick_search_query(query):
+    """Faol partiyalar orasida kod, mahsulot yoki yacheyka bo'yicha qidirish"""
+    return Batch.query.filter(
+        Batch.status == 'ACTIVE',
+        db.or_(
+            Batch.batch_code.ilike(f'%{query}%'),
+            Batch.product_name.ilike(f'%{query}%'),
+            Batch.location.ilike(f'%{query}%')
+        )
+    )
+
+
+def availability_json(batch):
+    """Band qilingan va bo'sh (chiqarish mumkin bo'lgan) qoldiq"""
+    available_sht, available_kg = batch_available(batch)
+    return {
+        'reserved_sht': batch.reserved_sht or 0,
+        'reserved_kg': batch.reserved_kg or 0.0,
+        'available_sht': available_sht,
+        'available_kg': available_kg
+    }
+
+
+@bp.route('/api/batches/search', methods=['GET'])
 @login_required
 def search_batches():
     """Partiyalarni sahifalash bilan qidirish"""
@@ -441,7 +1594,7 @@ def search_batches():
     page_size = int(request.args.get('page_size', 7))
     
     if not query:
-        return jsonify({'results': [], 'total': 0})
+        return list_response({'results': [], 'total': 0})
     
     q = f"%{query.lower()}%"
     batches_query = Batch.query.filter(
@@ -469,13 +1622,14 @@ def search_batches():
         'is_archived': b.is_archived,
         'created_at': b.created_at.strftime('%Y-%m-%d %H:%M'),
         'removed_at': b.removed_at.strftime('%Y-%m-%d %H:%M') if b.removed_at else None,
-        'removed_by': b.removed_by
+        'removed_by': b.removed_by,
+        **availability_json(b)
     } for b in batches]
     
-    return jsonify({'results': results, 'total': total})
+    return list_response({'results': results, 'total': total})
 
 
-@app.route('/api/batches/by-code', methods=['GET'])
+@bp.route('/api/batches/by-code', methods=['GET'])
 @login_required
 def get_batch_by_code():
     """Partiya kodi bo'yicha ma'lumot olish"""
@@ -493,13 +1647,16 @@ def get_batch_by_code():
 
     total_sht = sum(b.quantity_sht or 0 for b in batches)
     total_kg = sum(b.quantity_kg or 0.0 for b in batches)
+    available = [batch_available(b) for b in batches]
     product_names = list({b.product_name for b in batches})
     product_name = product_names[0] if len(product_names) == 1 else product_names[0]
 
-    return jsonify({
+    return list_response({
         'product_name': product_name,
         'quantity_sht': total_sht,
         'quantity_kg': total_kg,
+        'available_sht': sum(sht for sht, _ in available),
+        'available_kg': round(sum(kg for _, kg in available), 3),
         'items': [{
             'id': b.id,
             'product_name': b.product_name,
@@ -507,19 +1664,37 @@ def get_batch_by_code():
             'quantity_sht': b.quantity_sht or 0,
             'quantity_kg': b.quantity_kg or 0.0,
             'location': b.location,
-            'created_at': b.created_at.strftime('%Y-%m-%d %H:%M')
+            'created_at': b.created_at.strftime('%Y-%m-%d %H:%M'),
+            **availability_json(b)
         } for b in batches]
     })
 
 
+@bp.route('/api/autocomplete', methods=['GET'])
+@login_required
+def autocomplete():
+    """Partiya kodi / mahsulot nomi bo'yicha avtoto'ldirish"""
+    field = request.args.get('field', 'batch_code')
+    prefix = (request.args.get('prefix') or '').strip()
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+
+    index = autocomplete_indexes.get().get(field)
+    if index is None:
+        return jsonify({'error': 'Noto\'g\'ri maydon'}), 400
+    if not prefix:
+        return list_response([])
+
+    return list_response(index.search(prefix, limit))
+
+
 # ==================== WAREHOUSE STATUS API ====================
-@app.route('/api/rows_matrix_status')
+@bp.route('/api/rows_matrix_status')
 @login_required
 def rows_matrix_status():
     """Ombor matritsa holati"""
-    sectors = ['A', 'B', 'C']
-    rows = 9
-    cells = 4
+    sectors = WAREHOUSE_SECTORS
+    rows = WAREHOUSE_ROWS
+    cells = WAREHOUSE_CELLS
     matrix = {}
     
     for sector in sectors:
@@ -538,28 +1713,49 @@ def rows_matrix_status():
     return jsonify(matrix)
 
 
-# ==================== ARCHIVE API ====================
-@app.route('/api/archive', methods=['GET'])
+@bp.route('/api/locations/suggest', methods=['GET'])
 @login_required
-def get_archive():
-    """Arxiv ma'lumotlarini olish"""
-    start_date_str = request.args.get('start_date')
-    end_date_str = request.args.get('end_date')
-    year = request.args.get('year', type=int)
-    month = request.args.get('month', type=int)
-    day = request.args.get('day')
-    
+def suggest_locations():
+    """Yangi partiya uchun yacheyka tavsiyasi"""
+    sector = (request.args.get('sector') or '').strip().upper() or None
+    row = request.args.get('row', type=int)
+    product_name = (request.args.get('product_name') or '').strip() or None
+    limit = min(max(request.args.get('limit', 5, type=int), 1), 50)
+
+    return list_response(location_indexes.get().suggest(sector, row, product_name, limit))
+
+
+# ==================== ARCHIVE API ====================
+def archive_params(args):
+    """Arxiv filtrlarini so'rov parametrlaridan olish"""
+    return {
+        'start_date': args.get('start_date') or None,
+        'end_date': args.get('end_date') or None,
+        'year': args.get('year', type=int),
+        'month': args.get('month', type=int),
+        'day': args.get('day') or None,
+        'search': (args.get('search') or '').strip().lower()
+    }
+
+
+def archive_movements_query(params):
+    """Filtrlangan harakatlar so'rovi (xato bo'lsa ValueError)"""
+    start_date_str = params['start_date']
+    end_date_str = params['end_date']
+    year = params['year']
+    month = params['month']
+    day = params['day']
+
     movements_query = BatchMovement.query.join(Batch)
-    
-    # Sana bo'yicha filtrlash
+
     if start_date_str or end_date_str:
         try:
             start_date = datetime.strptime(start_date_str, '%Y-%m-%d') if start_date_str else None
             end_date = datetime.strptime(end_date_str, '%Y-%m-%d') if end_date_str else None
         except ValueError:
-            return jsonify({'error': 'Sana noto\'g\'ri formatda'}), 400
+            raise ValueError('Sana noto\'g\'ri formatda')
         if start_date and end_date and end_date < start_date:
-            return jsonify({'error': 'Sana oralig\'i noto\'g\'ri'}), 400
+            raise ValueError('Sana oralig\'i noto\'g\'ri')
         if start_date:
             movements_query = movements_query.filter(BatchMovement.created_at >= start_date)
         if end_date:
@@ -570,7 +1766,7 @@ def get_archive():
             start_date = datetime.strptime(day, '%Y-%m-%d')
             end_date = start_date + timedelta(days=1)
         except ValueError:
-            return jsonify({'error': 'Sana noto\'g\'ri formatda'}), 400
+            raise ValueError('Sana noto\'g\'ri formatda')
         movements_query = movements_query.filter(
             BatchMovement.created_at >= start_date,
             BatchMovement.created_at < end_date
@@ -597,75 +1793,119 @@ def get_archive():
             BatchMovement.created_at >= start_date,
             BatchMovement.created_at < end_date
         )
-    
-    incoming_movements = movements_query.filter(BatchMovement.movement_type == 'IN').all()
-    outgoing_movements = movements_query.filter(BatchMovement.movement_type == 'OUT').all()
-    
-    def aggregate_movements(movements):
-        aggregated = {}
-        for m in movements:
-            b = m.batch
-            if not b:
+
+    return movements_query
+
+
+def archive_aggregate_query(params, movement_type):
+    """Harakatlarni SQL da (partiya kodi, mahsulot id) bo'yicha jamlash"""
+    return (archive_movements_query(params)
+            .join(Product, Product.id == Batch.product_id)
+            .filter(BatchMovement.movement_type == movement_type)
+            .with_entities(
+                Batch.batch_code,
+                Product.name,
+                db.func.coalesce(db.func.sum(BatchMovement.quantity_sht), 0),
+                db.func.coalesce(db.func.sum(BatchMovement.quantity_kg), 0.0)
+            )
+            .group_by(Batch.batch_code, Batch.product_id)
+            .order_by(db.func.min(BatchMovement.id)))
+
+
+def archive_totals(params):
+    """Davr bo'yicha kirim va chiqim jamlanmasi"""
+    search = params['search']
+
+    def aggregate(movement_type):
+        result = []
+        for batch_code, product_name, qty_sht, qty_kg in archive_aggregate_query(params, movement_type):
+            if search and search not in (batch_code or '').lower() and search not in (product_name or '').lower():
                 continue
-            key = (b.batch_code, b.product_name)
-            if key not in aggregated:
-                aggregated[key] = {
-                    'product_name': b.product_name,
-                    'batch_code': b.batch_code,
-                    'quantity_sht': 0,
-                    'quantity_kg': 0.0
-                }
-            aggregated[key]['quantity_sht'] += m.quantity_sht or 0
-            aggregated[key]['quantity_kg'] += m.quantity_kg or 0.0
-        return list(aggregated.values())
-    
-    return jsonify({
-        'incoming': aggregate_movements(incoming_movements),
-        'outgoing': aggregate_movements(outgoing_movements)
-    })
+            result.append({
+                'product_name': product_name,
+                'batch_code': batch_code,
+                'quantity_sht': qty_sht,
+                'quantity_kg': float(qty_kg)
+            })
+        return result
+
+    return {
+        'incoming': aggregate('IN'),
+        'outgoing': aggregate('OUT')
+    }
+
+
+@bp.route('/api/archive', methods=['GET'])
+@login_required
+def get_archive():
+    """Arxiv ma'lumotlarini olish"""
+    params = archive_params(request.args)
+    params['search'] = ''
+    try:
+        return list_response(archive_totals(params))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
 
 # ==================== STOCK REQUEST API ====================
-@app.route('/api/requests', methods=['GET'])
+@bp.route('/api/requests', methods=['GET'])
 @login_required
 def get_stock_requests():
     """Sklad so'rovlarini olish"""
     status = request.args.get('status')
-    query = StockRequest.query.order_by(StockRequest.created_at.desc())
-    if status:
-        if status == 'COMPLETED':
-            query = query.filter(StockRequest.status.in_(['DONE', 'FAILED']))
-        else:
-            query = query.filter(StockRequest.status == status)
-    requests_list = query.all()
-
-    batch_codes = [r.batch_code for r in requests_list if r.batch_code]
-    location_map = {}
-    if batch_codes:
-        batches = (Batch.query
-                   .filter(Batch.batch_code.in_(batch_codes))
-                   .order_by(Batch.created_at.desc())
-                   .all())
-        for b in batches:
-            if b.batch_code not in location_map:
-                location_map[b.batch_code] = b.location
-
-    return jsonify([{
+    requests_list = stock_requests_query(status).all()
+
+    return list_response([{
         'id': r.id,
         'product_name': r.product_name,
         'batch_code': r.batch_code,
-        'location': location_map.get(r.batch_code) if r.batch_code else None,
+        'location': location if r.batch_code else None,
         'quantity_sht': r.quantity_sht or 0,
         'quantity_kg': r.quantity_kg or 0.0,
         'comment': r.comment,
         'status': r.status,
-        'created_at': (r.seen_at if r.status in ['DONE', 'FAILED'] and r.seen_at else r.created_at).strftime('%Y-%m-%d %H:%M'),
+        'created_at': request_display_date(r).strftime('%Y-%m-%d %H:%M'),
         'seen_at': r.seen_at.strftime('%Y-%m-%d %H:%M') if r.seen_at else None,
-        'created_by': r.created_by
-    } for r in requests_list])
+        'created_by': r.created_by,
+        'reservations': [reservation_json(reservation) for reservation in r.reservations]
+    } for r, location in requests_list])
+
+
+def reservation_json(reservation):
+    """Band qilingan partiya ma'lumoti"""
+    return {
+        'batch_id': reservation.batch_id,
+        'batch_code': reservation.batch.batch_code,
+        'location': reservation.batch.location,
+        'quantity_sht': reservation.quantity_sht or 0,
+        'quantity_kg': reservation.quantity_kg or 0.0
+    }
+
+
+def stock_requests_query(status=None):
+    """So'rovlar va partiya kodining eng yangi yacheykasi (status bo'yicha indeksli)"""
+    newest_location = (db.select(Batch.location)
+                       .where(Batch.batch_code == StockRequest.batch_code)
+                       .order_by(Batch.created_at.desc())
+                       .limit(1)
+                       .correlate(StockRequest)
+                       .scalar_subquery())
+
+    query = db.session.query(StockRequest, newest_location.label('location'))
+    if status:
+        if status == 'COMPLETED':
+            query = query.filter(StockRequest.status.in_(['DONE', 'FAILED']))
+        else:
+            query = query.filter(StockRequest.status == status)
+    return query.order_by(StockRequest.created_at.desc())
+
 
+def request_display_date(r):
+    """Yakunlangan so'rovlar uchun ko'rilgan vaqt, aks holda yaratilgan vaqt"""
+    return r.seen_at if r.status in ['DONE', 'FAILED'] and r.seen_at else r.created_at
 
-@app.route('/api/requests', methods=['POST'])
+
+@bp.route('/api/requests', methods=['POST'])
 @login_required
 def create_stock_request():
     """Skladga so'rov yaratish"""
@@ -701,147 +1941,390 @@ def create_stock_request():
     if qty_sht == 0 and qty_kg == 0:
         return jsonify({'error': 'Kamida bitta miqdor kiriting'}), 400
 
+    try:
+        request_id, reservations = execute_write(
+            apply_create_stock_request, product_name, batch_code, qty_sht, qty_kg, comment, session['user_id']
+        )
+    except WriteError as e:
+        return jsonify({'error': e.message}), e.status
+
+    return jsonify({'success': True, 'id': request_id, 'reservations': reservations})
+
+
+def apply_create_stock_request(product_name, batch_code, qty_sht, qty_kg, comment, user_id):
+    """So'rovni yozish va miqdorni faol partiyalardan band qilish"""
+    # Mahsulot bo'yicha mavjud qoldiq - bitta birlamchi kalit bo'yicha o'qish
+    stock = db.session.execute(
+        db.select(
+            ProductStock.product_id,
+            ProductStock.quantity_sht - ProductStock.reserved_sht,
+            ProductStock.quantity_kg - ProductStock.reserved_kg
+        ).join(Product, Product.id == ProductStock.product_id)
+        .where(Product.search_key == product_key(product_name))
+    ).first()
+    product_id, available_sht, available_kg = stock if stock else (None, 0, 0.0)
+    available_kg = round(available_kg, 3)
+    if qty_sht > available_sht or qty_kg > available_kg:
+        raise WriteError(
+            f'Omborda yetarli qoldiq yo\'q (mavjud: {available_sht} dona, {available_kg} kg)', 409
+        )
+
+    # Qulfsiz dastlabki tekshiruv: yetarli partiya bo'lmasa yozish qulfi olinmaydi
+    allocate_stock(product_id, batch_code, qty_sht, qty_kg)
+
+    # Shartli UPDATE: parallel so'rovlar bir xil qoldiqni ikki marta band qila olmaydi
+    reserved = db.session.execute(
+        db.update(ProductStock).where(
+            ProductStock.product_id == product_id,
+            ProductStock.quantity_sht - ProductStock.reserved_sht >= qty_sht,
+            ProductStock.quantity_kg - ProductStock.reserved_kg >= qty_kg - 0.0005
+        ).values(
+            reserved_sht=ProductStock.reserved_sht + qty_sht,
+            reserved_kg=ProductStock.reserved_kg + qty_kg
+        )
+    )
+    if reserved.rowcount == 0:
+        raise WriteError('Omborda yetarli qoldiq yo\'q', 409)
+
+    # Yozish qulfi endi shu tranzaksiyada - partiyalar qayta o'qiladi. Orada boshqa worker partiyadan
+    # chiqargan bo'lishi mumkin: WriteError o'zgarishsiz deb hisoblanadi (guruhli commit qolgan
+    # operatsiyalarni commit qiladi), shuning uchun bandni qaytarib keyin xato beriladi
+    try:
+        allocation = allocate_stock(product_id, batch_code, qty_sht, qty_kg)
+    except WriteError:
+        adjust_product_stock(product_id, reserved_sht=-qty_sht, reserved_kg=-qty_kg)
+        raise
+
     new_request = StockRequest(
-        product_name=product_name,
+        product_id=product_id,
         batch_code=batch_code,
         quantity_sht=qty_sht,
         quantity_kg=qty_kg,
         comment=comment,
         status='NEW',
-        created_by=session['user_id']
+        created_by=user_id
     )
     db.session.add(new_request)
-    db.session.commit()
+    for batch, take_sht, take_kg in allocation:
+        batch.reserved_sht = (batch.reserved_sht or 0) + take_sht
+        batch.reserved_kg = round((batch.reserved_kg or 0.0) + take_kg, 3)
+        new_request.reservations.append(
+            StockReservation(batch=batch, quantity_sht=take_sht, quantity_kg=take_kg)
+        )
+    record_activity(user_id, requests_created=1)
+    db.session.flush()
+
+    return (new_request.id, [reservation_json(r) for r in new_request.reservations]), None
+
+
+def allocate_stock(product_id, batch_code, qty_sht, qty_kg):
+    """Miqdorni faol partiyalarga eskisidan boshlab taqsimlash: [(partiya, dona, kg)] (faqat o'qiydi)"""
+    query = Batch.query.filter(Batch.product_id == product_id, Batch.status == 'ACTIVE')
+    if batch_code:
+        query = query.filter(Batch.batch_code == batch_code)
+
+    need_sht, need_kg = qty_sht, qty_kg
+    allocation = []
+    for batch in query.order_by(Batch.created_at, Batch.id).populate_existing():
+        if need_sht <= 0 and need_kg <= 0:
+            break
+        available_sht, available_kg = batch_available(batch)
+        take_sht = min(need_sht, max(available_sht, 0))
+        take_kg = round(min(need_kg, max(available_kg, 0.0)), 3)
+        if take_sht or take_kg:
+            allocation.append((batch, take_sht, take_kg))
+            need_sht -= take_sht
+            need_kg = round(need_kg - take_kg, 3)
+
+    if need_sht > 0 or need_kg > 0:
+        if batch_code:
+            raise WriteError(f'{batch_code} partiyasida yetarli qoldiq yo\'q', 409)
+        raise WriteError('Omborda yetarli qoldiq yo\'q', 409)
+    return allocation
+
+
+def release_reservation(reservation):
+    """Band qilingan miqdorni partiya va mahsulot qoldig'iga qaytarish"""
+    batch = reservation.batch
+    batch.reserved_sht = (batch.reserved_sht or 0) - (reservation.quantity_sht or 0)
+    batch.reserved_kg = round((batch.reserved_kg or 0.0) - (reservation.quantity_kg or 0.0), 3)
+    adjust_product_stock(
+        batch.product_id,
+        reserved_sht=-(reservation.quantity_sht or 0),
+        reserved_kg=-(reservation.quantity_kg or 0.0)
+    )
 
-    return jsonify({'success': True, 'id': new_request.id})
 
+FINISHED_REQUEST_STATUSES = ('DONE', 'FAILED')
 
-@app.route('/api/requests/<int:req_id>/seen', methods=['PUT'])
+
+@bp.route('/api/requests/<int:req_id>/seen', methods=['PUT'])
 @login_required
 def mark_request_seen(req_id):
     """So'rovni ko'rildi deb belgilash"""
     req = db.session.get(StockRequest, req_id)
     if not req:
         return jsonify({'error': 'So\'rov topilmadi'}), 404
-    req.status = 'SEEN'
-    req.seen_at = datetime.now()
-    db.session.commit()
+    # Yakunlangan so'rov qayta ochilmaydi (aks holda uni yana yakunlash mumkin bo'lib qoladi)
+    if req.status not in FINISHED_REQUEST_STATUSES:
+        req.status = 'SEEN'
+        req.seen_at = datetime.now()
+        db.session.commit()
     return jsonify({'success': True})
 
 
-@app.route('/api/requests/<int:req_id>/done', methods=['PUT'])
+@bp.route('/api/requests/<int:req_id>/done', methods=['PUT'])
 @login_required
 def mark_request_done(req_id):
-    """So'rovni bajarildi deb belgilash"""
-    req = db.session.get(StockRequest, req_id)
-    if not req:
-        return jsonify({'error': 'So\'rov topilmadi'}), 404
-    req.status = 'DONE'
-    req.seen_at = datetime.now()
-    db.session.commit()
+    """So'rovni bajarildi deb belgilash (band qilingan miqdor chiqimga aylanadi)"""
+    try:
+        execute_write(apply_finish_stock_request, req_id, 'DONE', session['user_id'])
+    except WriteError as e:
+        return jsonify({'error': e.message}), e.status
     return jsonify({'success': True})
 
 
-@app.route('/api/requests/<int:req_id>/failed', methods=['PUT'])
+@bp.route('/api/requests/<int:req_id>/failed', methods=['PUT'])
 @login_required
 def mark_request_failed(req_id):
-    """So'rovni bajarilmadi deb belgilash"""
-    req = db.session.get(StockRequest, req_id)
+    """So'rovni bajarilmadi deb belgilash (band qilingan miqdor bo'shatiladi)"""
+    try:
+        execute_write(apply_finish_stock_request, req_id, 'FAILED', session['user_id'])
+    except WriteError as e:
+        return jsonify({'error': e.message}), e.status
+    return jsonify({'success': True})
+
+
+def apply_finish_stock_request(req_id, status, user_id):
+    """So'rovni yakunlash: bandlarni bo'shatish, DONE bo'lsa partiyalardan chiqarish"""
+    # Partiya qoldiqlari qulf olingandan keyin yuklanadi - parallel chiqarish yo'qolmaydi
+    req = lock_for_update(StockRequest, req_id)
     if not req:
-        return jsonify({'error': 'So\'rov topilmadi'}), 404
-    req.status = 'FAILED'
+        raise WriteError('So\'rov topilmadi', 404)
+    # Faqat NEW/SEEN -> DONE/FAILED: yakunlangan so'rovning bandlari allaqachon bo'shatilgan yoki chiqarilgan
+    if req.status in FINISHED_REQUEST_STATUSES:
+        raise WriteError('So\'rov allaqachon yakunlangan', 409)
+
+    removed = []
+    for reservation in req.reservations:
+        release_reservation(reservation)
+        if status == 'DONE':
+            batch = reservation.batch
+            if withdraw_from_batch(batch, reservation.quantity_sht or 0, reservation.quantity_kg or 0.0, user_id):
+                removed.append((batch.location, batch.product_name, batch.batch_code))
+    req.reservations.clear()
+    # Hisoblagich faqat NEW/SEEN dan birinchi chiqishda: bitta so'rov ham bajarilgan, ham bajarilmagan
+    # bo'lib sanalmaydi (yuqoridagi tekshiruvdan qat'i nazar)
+    if req.status not in FINISHED_REQUEST_STATUSES:
+        record_activity(user_id, **{'requests_completed' if status == 'DONE' else 'requests_failed': 1})
+    req.status = status
     req.seen_at = datetime.now()
-    db.session.commit()
-    return jsonify({'success': True})
 
+    def after_commit():
+        for location, product_name, batch_code in removed:
+            location_indexes.get().remove(location, product_name)
+            autocomplete_indexes.get()['batch_code'].remove(batch_code)
+            autocomplete_indexes.get()['product_name'].remove(product_name)
+
+    return None, after_commit
+
+
+REQUEST_EXPORT_HEADERS = ['Товар', 'Партия', 'Ячейка', 'Шт', 'Кг', 'Комментарий', 'Статус', 'Дата']
+REQUEST_STATUS_LABELS = {'DONE': 'Выполнен', 'FAILED': 'Не выполнен'}
+
+
+def request_export_rows(status):
+    """Eksport qatorlarini bazadan bo'lib-bo'lib o'qish"""
+    for r, location in stock_requests_query(status).yield_per(500):
+        yield [
+            r.product_name or '',
+            r.batch_code or '-',
+            (location if r.batch_code else None) or '-',
+            r.quantity_sht or 0,
+            r.quantity_kg or 0.0,
+            r.comment or '',
+            REQUEST_STATUS_LABELS.get(r.status, 'Новый'),
+            request_display_date(r).strftime('%Y-%m-%d %H:%M')
+        ]
+
+
+def pdf_font_name():
+    """Kirill harflarini qo'llaydigan TTF shrift (topilmasa Helvetica)"""
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    if 'SkladFont' in pdfmetrics.getRegisteredFontNames():
+        return 'SkladFont'
+    candidates = [
+        current_app.config['PDF_FONT_PATH'],
+        '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+        '/usr/share/fonts/TTF/DejaVuSans.ttf',
+        'C:\\Windows\\Fonts\\arial.ttf'
+    ]
+    for path in candidates:
+        if path and os.path.exists(path):
+            pdfmetrics.registerFont(TTFont('SkladFont', path))
+            return 'SkladFont'
+    return 'Helvetica'
+
+
+def build_requests_xlsx(rows):
+    """So'rovlar ro'yxatini xlsx ga yozish (write-only rejim, xotirada qator saqlanmaydi)"""
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Запросы')
+    ws.column_dimensions['A'].width = 28
+    ws.column_dimensions['F'].width = 30
+    ws.column_dimensions['H'].width = 17
+    header = []
+    for h in REQUEST_EXPORT_HEADERS:
+        cell = WriteOnlyCell(ws, value=h)
+        cell.font = Font(bold=True)
+        header.append(cell)
+    ws.append(header)
+    for row in rows:
+        ws.append(row)
 
-@app.route('/api/archive/export', methods=['GET'])
-@login_required
-def export_archive_excel():
-    """Arxiv ma'lumotlarini Excelga export qilish"""
-    start_date_str = request.args.get('start_date')
-    end_date_str = request.args.get('end_date')
-    year = request.args.get('year', type=int)
-    month = request.args.get('month', type=int)
-    day = request.args.get('day')
-    search = (request.args.get('search') or '').strip().lower()
+    output = BytesIO()
+    wb.save(output)
+    output.seek(0)
+    return output
 
-    movements_query = BatchMovement.query.join(Batch)
 
-    if start_date_str or end_date_str:
-        try:
-            start_date = datetime.strptime(start_date_str, '%Y-%m-%d') if start_date_str else None
-            end_date = datetime.strptime(end_date_str, '%Y-%m-%d') if end_date_str else None
-        except ValueError:
-            return jsonify({'error': 'Sana noto\'g\'ri formatda'}), 400
-        if start_date and end_date and end_date < start_date:
-            return jsonify({'error': 'Sana oralig\'i noto\'g\'ri'}), 400
-        if start_date:
-            movements_query = movements_query.filter(BatchMovement.created_at >= start_date)
-        if end_date:
-            end_exclusive = end_date + timedelta(days=1)
-            movements_query = movements_query.filter(BatchMovement.created_at < end_exclusive)
-    elif day:
-        try:
-            start_date = datetime.strptime(day, '%Y-%m-%d')
-            end_date = start_date + timedelta(days=1)
-        except ValueError:
-            return jsonify({'error': 'Sana noto\'g\'ri formatda'}), 400
-        movements_query = movements_query.filter(
-            BatchMovement.created_at >= start_date,
-            BatchMovement.created_at < end_date
+def build_requests_pdf(rows):
+    """So'rovlar ro'yxatini PDF ga sahifalab yozish"""
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.pdfgen import canvas
+    from reportlab.pdfbase import pdfmetrics
+
+    output = BytesIO()
+    page_width, page_height = landscape(A4)
+    pdf = canvas.Canvas(output, pagesize=(page_width, page_height))
+    font = pdf_font_name()
+    margin = 28
+    widths = [170, 90, 60, 50, 50, 200, 80, 85]
+    line_height = 16
+
+    def fit(text, width):
+        text = str(text)
+        while text and pdfmetrics.stringWidth(text, font, 9) > width - 6:
+            text = text[:-1]
+        return text
+
+    def draw_row(values, y):
+        x = margin
+        for value, width in zip(values, widths):
+            pdf.drawString(x, y, fit(value, width))
+            x += width
+
+    def new_page(first=False):
+        if not first:
+            pdf.showPage()
+        y = page_height - margin
+        if first:
+            pdf.setFont(font, 14)
+            pdf.drawString(margin, y - 4, 'Запросы на склад')
+            y -= 28
+        pdf.setFont(font, 9)
+        draw_row(REQUEST_EXPORT_HEADERS, y)
+        pdf.line(margin, y - 4, page_width - margin, y - 4)
+        return y - line_height
+
+    y = new_page(first=True)
+    empty = True
+    for row in rows:
+        empty = False
+        if y < margin:
+            y = new_page()
+        row = list(row)
+        row[4] = f"{row[4]:.0f}"
+        draw_row(row, y)
+        y -= line_height
+    if empty:
+        pdf.drawString(margin, y, 'Запросов нет')
+
+    pdf.save()
+    output.seek(0)
+    return output
+
+
+@bp.route('/api/requests/export', methods=['GET'])
+@login_required
+def export_stock_requests():
+    """So'rovlar ro'yxatini serverda xlsx/csv/pdf ga eksport qilish"""
+    export_format = request.args.get('format', 'xlsx')
+    status = request.args.get('status')
+    if export_format not in ('xlsx', 'csv', 'pdf'):
+        return jsonify({'error': 'Noto\'g\'ri format'}), 400
+
+    filename = f"requests-{datetime.now().strftime('%Y%m%d-%H%M')}.{export_format}"
+
+    if export_format == 'csv':
+        def generate():
+            buffer = StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(REQUEST_EXPORT_HEADERS)
+            yield '\ufeff' + buffer.getvalue()
+            for row in request_export_rows(status):
+                buffer.seek(0)
+                buffer.truncate()
+                writer.writerow(row)
+                yield buffer.getvalue()
+
+        return Response(
+            stream_with_context(generate()),
+            mimetype='text/csv',
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
         )
-    elif year and month:
-        start_date = datetime(year, month, 1)
-        end_date = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
-        movements_query = movements_query.filter(
-            BatchMovement.created_at >= start_date,
-            BatchMovement.created_at < end_date
+
+    if export_format == 'pdf':
+        return send_file(
+            build_requests_pdf(request_export_rows(status)),
+            as_attachment=True,
+            download_name=filename,
+            mimetype='application/pdf'
         )
+
+    return send_file(
+        build_requests_xlsx(request_export_rows(status)),
+        as_attachment=True,
+        download_name=filename,
+        mimetype=XLSX_MIMETYPE
+    )
+
+
+# ==================== ARCHIVE EXPORT ====================
+def archive_export_filename(params):
+    """Export fayl nomi"""
+    day, year, month = params['day'], params['year'], params['month']
+    period = ''
+    if day:
+        period = day
+    elif year and month:
+        period = f"{year}-{str(month).zfill(2)}"
     elif year:
-        start_date = datetime(year, 1, 1)
-        end_date = datetime(year + 1, 1, 1)
-        movements_query = movements_query.filter(
-            BatchMovement.created_at >= start_date,
-            BatchMovement.created_at < end_date
-        )
+        period = f"{year}"
     elif month:
-        current_year = datetime.now().year
-        start_date = datetime(current_year, month, 1)
-        end_date = datetime(current_year + 1, 1, 1) if month == 12 else datetime(current_year, month + 1, 1)
-        movements_query = movements_query.filter(
-            BatchMovement.created_at >= start_date,
-            BatchMovement.created_at < end_date
-        )
+        period = f"{str(month).zfill(2)}"
+    return f"архив_{period or 'all'}.xlsx"
 
-    incoming_movements = movements_query.filter(BatchMovement.movement_type == 'IN').all()
-    outgoing_movements = movements_query.filter(BatchMovement.movement_type == 'OUT').all()
 
-    def aggregate_movements(movements):
-        aggregated = {}
-        for m in movements:
-            b = m.batch
-            if not b:
-                continue
-            if search:
-                code = (b.batch_code or '').lower()
-                name = (b.product_name or '').lower()
-                if search not in code and search not in name:
-                    continue
-            key = (b.batch_code, b.product_name)
-            if key not in aggregated:
-                aggregated[key] = {
-                    'product_name': b.product_name,
-                    'batch_code': b.batch_code,
-                    'quantity_sht': 0,
-                    'quantity_kg': 0.0
-                }
-            aggregated[key]['quantity_sht'] += m.quantity_sht or 0
-            aggregated[key]['quantity_kg'] += m.quantity_kg or 0.0
-        return list(aggregated.values())
-
-    incoming = aggregate_movements(incoming_movements)
-    outgoing = aggregate_movements(outgoing_movements)
+def build_archive_export(params, progress=None):
+    """Arxiv Excel faylini yaratish; progress(foiz) ixtiyoriy"""
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+
+    def report_progress(value):
+        if progress:
+            progress(value)
+
+    totals = archive_totals(params)
+    incoming = totals['incoming']
+    outgoing = totals['outgoing']
+    report_progress(60)
 
     wb = Workbook()
     ws = wb.active
@@ -913,45 +2396,244 @@ def export_archive_excel():
             ws.cell(row=row, column=c).border = border
 
     write_table(1, header_fill_in, incoming)
+    report_progress(75)
     write_table(6, header_fill_out, outgoing)
+    report_progress(90)
 
     output = BytesIO()
     wb.save(output)
     output.seek(0)
+    report_progress(100)
+
+    return output, archive_export_filename(params)
 
-    period = ''
-    if day:
-        period = day
-    elif year and month:
-        period = f"{year}-{str(month).zfill(2)}"
-    elif year:
-        period = f"{year}"
-    elif month:
-        period = f"{str(month).zfill(2)}"
 
-    filename = f"архив_{period or 'all'}.xlsx"
+@bp.route('/api/archive/export', methods=['GET'])
+@login_required
+def export_archive_excel():
+    """Arxiv ma'lumotlarini Excelga export qilish (fon exportlari bilan umumiy kesh orqali)"""
+    params = archive_params(request.args)
+    state = app_state()
+    job_id = export_job_key(params)
+    path = state.export_cache.get(job_id)
+    if path:
+        filename = (state.export_cache.load_job(job_id) or {}).get('filename') or archive_export_filename(params)
+    else:
+        try:
+            output, filename = build_archive_export(params)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        path = state.export_cache.put(job_id, output.getvalue())
+        state.export_cache.save_job(job_id, {'status': 'DONE', 'progress': 100, 'filename': filename})
+
     return send_file(
-        output,
+        path,
         as_attachment=True,
         download_name=filename,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        mimetype=XLSX_MIMETYPE
     )
 
 
-# ==================== REPORT API ====================
-@app.route('/api/report', methods=['GET'])
+# ==================== EXPORT JOBS ====================
+def data_version():
+    """Ma'lumotlar versiyasi: harakatlar faqat qo'shiladi, shuning uchun oxirgi id yetarli"""
+    return db.session.query(db.func.max(BatchMovement.id)).scalar() or 0
+
+
+class ExportCache:
+    """Tayyor export fayllarining diskdagi keshi (umumiy hajm bo'yicha LRU)"""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(params, version):
+        raw = json.dumps({'params': params, 'version': version}, sort_keys=True)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.xlsx")
+
+    def get(self, key):
+        """Kesh fayli yo'li (topilsa, LRU uchun vaqtini yangilaydi)"""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, data):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.evict()
+        return path
+
+    def save_job(self, key, job):
+        """Ish holatini diskka yozish - uni boshqa worker jarayonlari ham ko'radi"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{key}.json")
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({k: job.get(k) for k in ('status', 'progress', 'error', 'filename')}, f)
+        os.replace(tmp_path, path)
+
+    def load_job(self, key):
+        """Diskdagi ish holati (boshqa jarayonda boshlangan bo'lsa)"""
+        try:
+            with open(os.path.join(self.directory, f"{key}.json"), encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def evict(self):
+        """Umumiy hajm chegaradan oshsa eng eski fayllarni o'chirish"""
+        with self._lock:
+            try:
+                entries = [e for e in os.scandir(self.directory) if e.name.endswith('.xlsx')]
+            except FileNotFoundError:
+                return
+            files = []
+            for e in entries:
+                try:
+                    st = e.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_mtime, st.st_size, e.path))
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                for stale in (path, path[:-len('.xlsx')] + '.json'):
+                    try:
+                        os.remove(stale)
+                    except FileNotFoundError:
+                        pass
+                total -= size
+
+
+def export_job_key(params):
+    """Export keshi kaliti: parametrlar, joriy ombor va ma'lumotlar versiyasi bo'yicha"""
+    return ExportCache.make_key(dict(params, warehouse=current_warehouse()), data_version())
+
+
+def run_export_job(app, job_id, params, warehouse_id):
+    """Fon oqimida export faylini yaratish"""
+    state = app.extensions['sklad']
+    job = state.export_jobs[job_id]
+
+    def progress(value):
+        job['progress'] = value
+        state.export_cache.save_job(job_id, job)
+
+    job['status'] = 'RUNNING'
+    state.export_cache.save_job(job_id, job)
+    try:
+        with warehouse_context(warehouse_id, app):
+            output, _ = build_archive_export(params, progress)
+        state.export_cache.put(job_id, output.getvalue())
+        job['status'] = 'DONE'
+    except Exception as e:
+        app.logger.exception('Export xatosi: %s', job_id)
+        job['status'] = 'FAILED'
+        job['error'] = str(e) if isinstance(e, ValueError) else 'Server xatosi'
+    state.export_cache.save_job(job_id, job)
+
+
+def export_job_json(job_id, job):
+    return {
+        'id': job_id,
+        'status': job['status'],
+        'progress': job['progress'],
+        'error': job.get('error'),
+        'download_url': url_for('sklad.download_export', job_id=job_id) if job['status'] == 'DONE' else None
+    }
+
+
+@bp.route('/api/exports', methods=['POST'])
 @login_required
-def report():
-    """Kirim/chiqim hisoboti"""
-    start_date = request.args.get('start')
-    end_date = request.args.get('end')
-    
+def create_export():
+    """Arxiv exportini fon navbatiga qo'yish"""
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'So\'rov tanasi JSON obyekt bo\'lishi kerak'}), 400
+    params = archive_params(MultiDict({k: v for k, v in data.items() if v is not None}))
     try:
-        start = datetime.strptime(start_date, '%Y-%m-%d')
-        end = datetime.strptime(end_date, '%Y-%m-%d')
-    except (ValueError, TypeError):
-        return jsonify({'error': 'Sanalar noto\'g\'ri formatda'}), 400
-    
+        archive_movements_query(params)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    state = app_state()
+    warehouse_id = current_warehouse()
+    job_id = export_job_key(params)
+    filename = archive_export_filename(params)
+
+    with state.export_jobs_lock:
+        # Tugagan eski ishlarni tozalash (fayllar keshda qoladi)
+        stale = datetime.now() - timedelta(hours=1)
+        for old_id in [k for k, j in state.export_jobs.items()
+                       if j['status'] in ('DONE', 'FAILED') and j['created_at'] < stale]:
+            del state.export_jobs[old_id]
+
+        job = state.export_jobs.get(job_id)
+        if job is None or job['status'] == 'FAILED':
+            cached = state.export_cache.get(job_id)
+            job = state.export_jobs[job_id] = {
+                'status': 'DONE' if cached else 'PENDING',
+                'progress': 100 if cached else 0,
+                'filename': filename,
+                'created_at': datetime.now()
+            }
+            if not cached:
+                state.export_cache.save_job(job_id, job)
+                state.export_executor.submit(
+                    run_export_job, current_app._get_current_object(), job_id, params, warehouse_id
+                )
+
+    return jsonify(export_job_json(job_id, job)), 202
+
+
+@bp.route('/api/exports/<job_id>', methods=['GET'])
+@login_required
+def get_export(job_id):
+    """Export holati va progressi"""
+    state = app_state()
+    job = state.export_jobs.get(job_id) or state.export_cache.load_job(job_id)
+    if job is None:
+        if not state.export_cache.get(job_id):
+            return jsonify({'error': 'Export topilmadi'}), 404
+        job = {'status': 'DONE', 'progress': 100}
+    return jsonify(export_job_json(job_id, job))
+
+
+@bp.route('/api/exports/<job_id>/download', methods=['GET'])
+@login_required
+def download_export(job_id):
+    """Tayyor export faylini yuklab olish"""
+    state = app_state()
+    path = state.export_cache.get(job_id)
+    if not path:
+        return jsonify({'error': 'Export topilmadi yoki hali tayyor emas'}), 404
+    job = state.export_jobs.get(job_id) or state.export_cache.load_job(job_id) or {}
+    return send_file(
+        path,
+        as_attachment=True,
+        download_name=job.get('filename', f"архив_{job_id[:8]}.xlsx"),
+        mimetype=XLSX_MIMETYPE
+    )
+
+
+# ==================== REPORT API ====================
+def report_totals(start, end):
+    """Davr bo'yicha kirim/chiqim jami"""
     movements = BatchMovement.query.filter(
         BatchMovement.created_at >= start,
         BatchMovement.created_at <= end
@@ -968,14 +2650,380 @@ def report():
     chiqim_kg = sum(m.quantity_kg or 0 for m in outgoing)
     chiqim_sht = sum(m.quantity_sht or 0 for m in outgoing)
     
-    return jsonify({
+    return {
         'kirim': {'partiya': kirim_count, 'kg': kirim_kg, 'sht': kirim_sht},
         'chiqim': {'partiya': chiqim_count, 'kg': chiqim_kg, 'sht': chiqim_sht}
+    }
+
+
+@bp.route('/api/report', methods=['GET'])
+@login_required
+def report():
+    """Kirim/chiqim hisoboti"""
+    start_date = request.args.get('start')
+    end_date = request.args.get('end')
+    
+    try:
+        start = datetime.strptime(start_date, '%Y-%m-%d')
+        end = datetime.strptime(end_date, '%Y-%m-%d')
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Sanalar noto\'g\'ri formatda'}), 400
+    
+    return jsonify(report_totals(start, end))
+
+
+@bp.route('/api/warehouses/report', methods=['GET'])
+@login_required
+def report_all_warehouses():
+    """Barcha omborlar bo'yicha kirim/chiqim hisoboti (parallel)"""
+    start_date = request.args.get('start')
+    end_date = request.args.get('end')
+
+    try:
+        start = datetime.strptime(start_date, '%Y-%m-%d')
+        end = datetime.strptime(end_date, '%Y-%m-%d')
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Sanalar noto\'g\'ri formatda'}), 400
+
+    results = query_all_warehouses(report_totals, start, end)
+
+    total = {key: {'partiya': 0, 'kg': 0, 'sht': 0} for key in ('kirim', 'chiqim')}
+    for result in results.values():
+        for key in total:
+            for field in total[key]:
+                total[key][field] += result[key][field]
+
+    return jsonify(dict(total, warehouses=results))
+
+
+@bp.route('/api/warehouses/archive', methods=['GET'])
+@login_required
+def archive_all_warehouses():
+    """Barcha omborlar bo'yicha arxiv (parallel)"""
+    params = archive_params(request.args)
+    params['search'] = ''
+    try:
+        archive_movements_query(params)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    results = query_all_warehouses(archive_totals, params)
+
+    def merge(direction):
+        merged = {}
+        for result in results.values():
+            for item in result[direction]:
+                key = (item['batch_code'], item['product_name'])
+                if key not in merged:
+                    merged[key] = dict(item)
+                else:
+                    merged[key]['quantity_sht'] += item['quantity_sht']
+                    merged[key]['quantity_kg'] += item['quantity_kg']
+        return list(merged.values())
+
+    return list_response({
+        'incoming': merge('incoming'),
+        'outgoing': merge('outgoing'),
+        'warehouses': results
+    })
+
+
+# ==================== ANALYTICS API ====================
+AGING_BUCKETS = (30, 60, 90, 180)
+ANALYTICS_CACHE_SIZE = 32
+
+analytics_cache = PerWarehouse(dict)
+
+
+def cached_analytics(key, compute):
+    """Natija data_version() (va sana) o'zgarmaguncha keshdan qaytariladi"""
+    cache = analytics_cache.get()
+    version = (data_version(), datetime.now().date())
+    hit = cache.get(key)
+    if hit is not None and hit[0] == version:
+        return hit[1]
+    result = compute()
+    if len(cache) >= ANALYTICS_CACHE_SIZE:
+        cache.clear()
+    cache[key] = (version, result)
+    return result
+
+
+def fetch_columns(statement):
+    """Faqat sonli ustunlardan iborat so'rov natijasi -> ustunlar bo'yicha float64 massiv"""
+    import numpy as np
+
+    result = db.session.connection(bind_arguments={'mapper': Batch}).execute(statement)
+    try:
+        # Row obyektlarisiz: DBAPI kortejlari to'g'ridan-to'g'ri massivga
+        rows = result.cursor.fetchall()
+    finally:
+        result.close()
+    width = len(statement.selected_columns)
+    flat = np.fromiter(chain.from_iterable(rows), dtype=np.float64, count=len(rows) * width)
+    return flat.reshape(len(rows), width).T
+
+
+def aging_batches_query(now):
+    """Faol partiyalar: id, mahsulot, yoshi va oxirgi chiqimdan beri kunlar, qoldiq"""
+    now_day = db.func.julianday(now)
+    last_out = db.select(db.func.max(BatchMovement.created_at)).where(
+        BatchMovement.batch_id == Batch.id,
+        BatchMovement.movement_type == 'OUT'
+    ).scalar_subquery()
+    return db.select(
+        Batch.id,
+        Batch.product_id,
+        now_day - db.func.julianday(Batch.created_at),
+        now_day - db.func.julianday(db.func.coalesce(last_out, Batch.created_at)),
+        db.func.coalesce(Batch.quantity_sht, 0),
+        db.func.coalesce(Batch.quantity_kg, 0),
+    ).where(Batch.status == 'ACTIVE')
+
+
+def turnover_movements_query(start):
+    """Davrdagi harakatlar: mahsulot, chiqimmi (1/0), miqdorlar"""
+    return db.select(
+        Batch.product_id,
+        db.case((BatchMovement.movement_type == 'OUT', 1), else_=0),
+        db.func.coalesce(BatchMovement.quantity_sht, 0),
+        db.func.coalesce(BatchMovement.quantity_kg, 0),
+    ).join(Batch, Batch.id == BatchMovement.batch_id).where(BatchMovement.created_at >= start)
+
+
+def stock_on_hand_query():
+    """Faol partiyalar qoldig'i: mahsulot, miqdorlar"""
+    return db.select(
+        Batch.product_id,
+        db.func.coalesce(Batch.quantity_sht, 0),
+        db.func.coalesce(Batch.quantity_kg, 0),
+    ).where(Batch.status == 'ACTIVE')
+
+
+def stock_aging(edges, dead_days, limit):
+    """Partiyalar yoshi bo'yicha guruhlar va uzoq harakatsiz qoldiqlar"""
+    import numpy as np
+
+    now = datetime.now()
+    ids, _, ages, idle, sht, kg = fetch_columns(aging_batches_query(now))
+    days = np.floor(ages)
+    slot = np.searchsorted(np.asarray(edges, dtype=np.float64), days, side='left')
+    size = len(edges) + 1
+    counts = np.bincount(slot, minlength=size)
+    sums_sht = np.bincount(slot, weights=sht, minlength=size)
+    sums_kg = np.bincount(slot, weights=kg, minlength=size)
+
+    bounds = [0] + [edge + 1 for edge in edges]
+    buckets = []
+    for i in range(size):
+        upper = edges[i] if i < len(edges) else None
+        buckets.append({
+            'label': f'{bounds[i]}-{upper}' if upper is not None else f'{bounds[i]}+',
+            'min_days': bounds[i],
+            'max_days': upper,
+            'batches': int(counts[i]),
+            'quantity_sht': int(sums_sht[i]),
+            'quantity_kg': round(float(sums_kg[i]), 3),
+        })
+
+    dead = np.flatnonzero(np.floor(idle) >= dead_days)
+    dead = dead[np.argsort(-idle[dead], kind='stable')]
+    top = dead[:limit]
+    batches = {b.id: b for b in Batch.query.filter(Batch.id.in_(ids[top].astype(np.int64).tolist()))}
+    dead_stock = []
+    for i in top.tolist():
+        batch = batches[int(ids[i])]
+        dead_stock.append({
+            'batch_id': batch.id,
+            'batch_code': batch.batch_code,
+            'product_name': batch.product_name,
+            'location': batch.location,
+            'quantity_sht': batch.quantity_sht or 0,
+            'quantity_kg': batch.quantity_kg or 0,
+            'age_days': int(days[i]),
+            'idle_days': int(np.floor(idle[i])),
+        })
+
+    return {
+        'as_of': now.strftime('%Y-%m-%d %H:%M'),
+        'batches': int(len(ids)),
+        'average_age_days': round(float(days.mean()), 1) if len(days) else 0,
+        'buckets': buckets,
+        'dead_days': dead_days,
+        'dead_stock_count': int(len(dead)),
+        'dead_stock': dead_stock,
+    }
+
+
+def stock_turnover(days):
+    """Mahsulotlar bo'yicha aylanish: davrdagi chiqim / o'rtacha qoldiq"""
+    import numpy as np
+
+    now = datetime.now()
+    move_products, is_out, move_sht, move_kg = fetch_columns(turnover_movements_query(now - timedelta(days=days)))
+    stock_products, stock_sht, stock_kg = fetch_columns(stock_on_hand_query())
+
+    products, inverse = np.unique(np.concatenate([move_products, stock_products]), return_inverse=True)
+    move_slot, stock_slot = inverse[:len(move_products)], inverse[len(move_products):]
+    size = len(products)
+    is_in = 1 - is_out
+
+    def totals(slot, weights):
+        return np.bincount(slot, weights=weights, minlength=size)
+
+    result = {}
+    for unit, moved, stock in (('sht', move_sht, stock_sht), ('kg', move_kg, stock_kg)):
+        closing = totals(stock_slot, stock)
+        incoming = totals(move_slot, moved * is_in)
+        outgoing = totals(move_slot, moved * is_out)
+        # Davr boshidagi qoldiq: hozirgi qoldiq - kirim + chiqim
+        average = (2 * closing - incoming + outgoing) / 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            turnover = np.where(average > 0, outgoing / average, np.nan)
+            cover = np.where(outgoing > 0, closing / (outgoing / days), np.nan)
+        result[unit] = (incoming, outgoing, closing, turnover, cover)
+
+    def number(value, digits):
+        return None if np.isnan(value) else round(float(value), digits)
+
+    names = dict(db.session.execute(db.select(Product.id, Product.name)).all())
+    items = []
+    for i, product_id in enumerate(products.astype(np.int64).tolist()):
+        item = {'product_id': product_id, 'product_name': names.get(product_id)}
+        for unit, (incoming, outgoing, closing, turnover, cover) in result.items():
+            item[f'in_{unit}'] = round(float(incoming[i]), 3)
+            item[f'out_{unit}'] = round(float(outgoing[i]), 3)
+            item[f'stock_{unit}'] = round(float(closing[i]), 3)
+            item[f'turnover_{unit}'] = number(turnover[i], 2)
+            item[f'days_of_cover_{unit}'] = number(cover[i], 1)
+        items.append(item)
+    items.sort(key=lambda item: (item['product_name'] or '').casefold())
+
+    return {'as_of': now.strftime('%Y-%m-%d %H:%M'), 'days': days, 'items': items}
+
+
+@bp.route('/api/analytics/aging', methods=['GET'])
+@login_required
+def analytics_aging():
+    """Qoldiqlar yoshi (kunlar bo'yicha guruhlar) va harakatsiz qoldiqlar"""
+    try:
+        edges = tuple(sorted({int(x) for x in request.args['buckets'].split(',')})) \
+            if request.args.get('buckets') else AGING_BUCKETS
+    except ValueError:
+        return jsonify({'error': 'Noto\'g\'ri guruh chegaralari'}), 400
+    if not edges or edges[0] < 0:
+        return jsonify({'error': 'Noto\'g\'ri guruh chegaralari'}), 400
+    dead_days = max(request.args.get('dead_days', 90, type=int), 0)
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+
+    key = ('aging', edges, dead_days, limit)
+    return list_response(cached_analytics(key, lambda: stock_aging(edges, dead_days, limit)))
+
+
+@bp.route('/api/analytics/turnover', methods=['GET'])
+@login_required
+def analytics_turnover():
+    """Mahsulotlar aylanishi va qoldiq necha kunga yetishi"""
+    days = min(max(request.args.get('days', 30, type=int), 1), 366)
+
+    key = ('turnover', days)
+    return list_response(cached_analytics(key, lambda: stock_turnover(days)))
+
+
+# ==================== STOCK HISTORY API ====================
+def as_of_movements_query(cutoff, after_id=None):
+    """Sanagacha bo'lgan harakatlar (after_id berilsa - snapshotga kirmaganlari)"""
+    movements = db.session.query(
+        BatchMovement.batch_id, BatchMovement.movement_type,
+        BatchMovement.quantity_sht, BatchMovement.quantity_kg,
+        Product.name.label('product_name'), Batch.batch_code, Batch.location
+    ).join(Batch, Batch.id == BatchMovement.batch_id).join(
+        Product, Product.id == Batch.product_id
+    ).filter(
+        BatchMovement.created_at < cutoff
+    )
+    if after_id is not None:
+        movements = movements.filter(BatchMovement.id > after_id)
+    # Yig'indi tartibga bog'liq emas: ORDER BY id sanasiz holatda butun jadvalni rowid bo'yicha o'qitadi
+    return movements
+
+
+@bp.route('/api/stock/as-of', methods=['GET'])
+@login_required
+def stock_as_of():
+    """Berilgan sanadagi qoldiqlar (eng yaqin snapshot + keyingi harakatlar)"""
+    date_str = request.args.get('date')
+    if not date_str:
+        return jsonify({'error': 'Sana kiritilmagan'}), 400
+    try:
+        cutoff = datetime.strptime(date_str, '%Y-%m-%d') + timedelta(days=1)
+    except ValueError:
+        return jsonify({'error': 'Sana noto\'g\'ri formatda'}), 400
+
+    snapshot = (StockSnapshot.query
+                .filter(StockSnapshot.taken_at < cutoff)
+                .order_by(StockSnapshot.taken_at.desc())
+                .first())
+
+    stock = {}
+    if snapshot:
+        items = db.session.query(StockSnapshotItem, Product.name).join(
+            Product, Product.id == StockSnapshotItem.product_id
+        ).filter(StockSnapshotItem.snapshot_id == snapshot.id)
+        for item, product_name in items:
+            stock[item.batch_id] = {
+                'batch_id': item.batch_id,
+                'product_name': product_name,
+                'batch_code': item.batch_code,
+                'location': item.location,
+                'quantity_sht': item.quantity_sht or 0,
+                'quantity_kg': item.quantity_kg or 0.0
+            }
+
+    # Faqat snapshotdan keyingi harakatlarni qo'llash
+    movements = as_of_movements_query(cutoff, snapshot.last_movement_id if snapshot else None)
+
+    for m in movements:
+        entry = stock.get(m.batch_id)
+        if entry is None:
+            entry = stock[m.batch_id] = {
+                'batch_id': m.batch_id,
+                'product_name': m.product_name,
+                'batch_code': m.batch_code,
+                'location': m.location,
+                'quantity_sht': 0,
+                'quantity_kg': 0.0
+            }
+        sign = 1 if m.movement_type == 'IN' else -1
+        entry['quantity_sht'] += sign * (m.quantity_sht or 0)
+        entry['quantity_kg'] += sign * (m.quantity_kg or 0.0)
+
+    items = [e for e in stock.values() if e['quantity_sht'] > 0 or e['quantity_kg'] > 0]
+    items.sort(key=lambda e: e['location'])
+
+    return list_response({
+        'date': date_str,
+        'snapshot_at': snapshot.taken_at.strftime('%Y-%m-%d %H:%M') if snapshot else None,
+        'total_sht': sum(e['quantity_sht'] for e in items),
+        'total_kg': sum(e['quantity_kg'] for e in items),
+        'items': items
     })
 
 
+@bp.route('/api/stock/snapshots', methods=['POST'])
+@login_required
+def create_stock_snapshot():
+    """Qoldiqlar snapshotini qo'lda yaratish"""
+    snapshot = take_stock_snapshot()
+    return jsonify({
+        'success': True,
+        'id': snapshot.id,
+        'taken_at': snapshot.taken_at.strftime('%Y-%m-%d %H:%M:%S')
+    }), 201
+
+
 # ==================== ERROR HANDLERS ====================
-@app.errorhandler(404)
+@bp.app_errorhandler(404)
 def not_found(e):
     """404 xatosi"""
     if request.is_json or request.path.startswith('/api/'):
@@ -983,17 +3031,545 @@ def not_found(e):
     return render_template('404.html'), 404
 
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def server_error(e):
     """500 xatosi"""
     return jsonify({'error': 'Server xatosi'}), 500
 
 
+# ==================== SCHEMA MIGRATIONS ====================
+def migrate_product_names(cur):
+    """product_name matnini products lug'atiga ko'chirish va ustunni o'chirish"""
+    cur.connection.create_function('product_key', 1, product_key, deterministic=True)
+    cur.connection.create_function('product_display', 1, lambda name: ' '.join((name or '').split()), deterministic=True)
+    cur.execute(
+        'CREATE TABLE IF NOT EXISTS products ('
+        'id INTEGER NOT NULL PRIMARY KEY, name VARCHAR(200) NOT NULL, search_key VARCHAR(200) NOT NULL UNIQUE)'
+    )
+    for table in ('batches', 'stock_requests', 'stock_snapshot_items'):
+        columns = [row[1] for row in cur.execute(f'PRAGMA table_info({table})').fetchall()]
+        if 'product_name' not in columns:
+            continue
+        # Bir xil kalitli nomlardan eng ko'p uchraydigan yozilishi kanonik nom bo'ladi
+        cur.execute(
+            f'INSERT OR IGNORE INTO products (name, search_key) '
+            f'SELECT product_display(product_name), product_key(product_name) FROM {table} '
+            f'GROUP BY product_name ORDER BY COUNT(*) DESC'
+        )
+        if 'product_id' not in columns:
+            cur.execute(f'ALTER TABLE {table} ADD COLUMN product_id INTEGER REFERENCES products(id)')
+        cur.execute(
+            f'UPDATE {table} SET product_id = '
+            f'(SELECT id FROM products WHERE search_key = product_key({table}.product_name))'
+        )
+        cur.execute(f'ALTER TABLE {table} DROP COLUMN product_name')
+
+
+def migrate_reservations(cur):
+    """Partiyalarga band qilingan miqdor ustunlari va mahsulot qoldig'i agregatini yaratish"""
+    columns = [row[1] for row in cur.execute('PRAGMA table_info(batches)').fetchall()]
+    if 'reserved_sht' not in columns:
+        cur.execute('ALTER TABLE batches ADD COLUMN reserved_sht INTEGER DEFAULT 0')
+    if 'reserved_kg' not in columns:
+        cur.execute('ALTER TABLE batches ADD COLUMN reserved_kg FLOAT DEFAULT 0.0')
+    cur.execute(
+        'CREATE TABLE IF NOT EXISTS product_stock ('
+        'product_id INTEGER NOT NULL PRIMARY KEY REFERENCES products(id), '
+        'quantity_sht INTEGER NOT NULL, quantity_kg FLOAT NOT NULL, '
+        'reserved_sht INTEGER NOT NULL, reserved_kg FLOAT NOT NULL)'
+    )
+    cur.execute(
+        'CREATE TABLE IF NOT EXISTS stock_reservations ('
+        'id INTEGER NOT NULL PRIMARY KEY, '
+        'request_id INTEGER NOT NULL REFERENCES stock_requests(id), '
+        'batch_id INTEGER NOT NULL REFERENCES batches(id), '
+        'quantity_sht INTEGER, quantity_kg FLOAT, created_at DATETIME)'
+    )
+    # Agregat faol partiyalardan qayta hisoblanadi
+    cur.execute('DELETE FROM product_stock')
+    cur.execute(
+        'INSERT INTO product_stock (product_id, quantity_sht, quantity_kg, reserved_sht, reserved_kg) '
+        'SELECT product_id, SUM(COALESCE(quantity_sht, 0)), SUM(COALESCE(quantity_kg, 0)), '
+        'SUM(COALESCE(reserved_sht, 0)), SUM(COALESCE(reserved_kg, 0)) '
+        "FROM batches WHERE status = 'ACTIVE' GROUP BY product_id"
+    )
+
+
+def migrate_snapshot_watermark(cur):
+    """Snapshotlarga harakatlar chegarasini (last_movement_id) qo'shish"""
+    columns = [row[1] for row in cur.execute('PRAGMA table_info(stock_snapshots)').fetchall()]
+    if 'last_movement_id' not in columns:
+        cur.execute('ALTER TABLE stock_snapshots ADD COLUMN last_movement_id INTEGER')
+    # Eski snapshotlar uchun eng yaqin taxmin: snapshot vaqtigacha yozilgan harakatlar
+    cur.execute(
+        'UPDATE stock_snapshots SET last_movement_id = ('
+        'SELECT COALESCE(MAX(id), 0) FROM batch_movements WHERE created_at <= stock_snapshots.taken_at) '
+        'WHERE last_movement_id IS NULL'
+    )
+
+
+def migrate_user_activity(cur):
+    """Foydalanuvchi faoliyati hisoblagichlarini yaratish va mavjud tarixdan to'ldirish"""
+    cur.execute(
+        'CREATE TABLE IF NOT EXISTS user_activity ('
+        'user_id INTEGER NOT NULL, day DATE NOT NULL, '
+        'batches_removed INTEGER, requests_created INTEGER, requests_completed INTEGER, requests_failed INTEGER, '
+        'released_sht INTEGER, released_kg FLOAT, '
+        'PRIMARY KEY (user_id, day))'
+    )
+    cur.execute('DELETE FROM user_activity')
+    # Tarixda qisman chiqimlarning muallifi yo'q: partiya to'liq chiqarilgan kun va foydalanuvchiga yoziladi
+    cur.execute(
+        'INSERT INTO user_activity (user_id, day, batches_removed, requests_created, requests_completed, '
+        'requests_failed, released_sht, released_kg) '
+        'SELECT removed_by, date(removed_at), COUNT(*), 0, 0, 0, '
+        'SUM(COALESCE(removed_quantity_sht, 0)), SUM(COALESCE(removed_quantity_kg, 0)) '
+        "FROM batches WHERE status = 'REMOVED' AND removed_by IS NOT NULL AND removed_at IS NOT NULL "
+        'GROUP BY removed_by, date(removed_at)'
+    )
+    # Yakunlangan so'rovlarni kim yopgani saqlanmagan - ular shu migratsiyadan keyin hisoblanadi
+    cur.execute(
+        'INSERT INTO user_activity (user_id, day, batches_removed, requests_created, requests_completed, '
+        'requests_failed, released_sht, released_kg) '
+        'SELECT created_by, date(created_at), 0, COUNT(*), 0, 0, 0, 0 '
+        'FROM stock_requests WHERE created_by IS NOT NULL AND created_at IS NOT NULL '
+        'GROUP BY created_by, date(created_at) '
+        'ON CONFLICT (user_id, day) DO UPDATE SET requests_created = excluded.requests_created'
+    )
+
+
+# (versiya, tavsif, faqat asosiy bazada (users bilan) bajariladimi, SQL yoki callable(cursor) ro'yxati)
+# Indekslar faqat shu yerda aniqlanadi; modellar va db.create_all() indeks yaratmaydi.
+MIGRATIONS = [
+    (1, 'So\'rov shakllariga mos kompozit/qoplovchi indekslar', False, [
+        'DROP INDEX IF EXISTS idx_batches_status',
+        'DROP INDEX IF EXISTS idx_batches_location',
+        'DROP INDEX IF EXISTS idx_batches_batch_code',
+        'DROP INDEX IF EXISTS idx_movements_type',
+        'DROP INDEX IF EXISTS idx_requests_status',
+        'DROP INDEX IF EXISTS ix_stock_snapshots_taken_at',
+        'DROP INDEX IF EXISTS ix_stock_snapshot_items_snapshot_id',
+        # Matritsa va putaway: yacheyka + qoldiq
+        'CREATE INDEX IF NOT EXISTS idx_batches_location_qty ON batches(location, quantity_sht, quantity_kg)',
+        # Faol partiyalar ro'yxati va qidiruv (yangilari birinchi)
+        'CREATE INDEX IF NOT EXISTS idx_batches_status_created_at ON batches(status, created_at)',
+        # Partiya kodi bo'yicha va so'rovlardagi eng yangi yacheyka
+        'CREATE INDEX IF NOT EXISTS idx_batches_code_created_at ON batches(batch_code, created_at, location)',
+        'CREATE INDEX IF NOT EXISTS idx_batches_code_status_created_at ON batches(batch_code, status, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_batches_created_at ON batches(created_at)',
+        # Arxiv: tur + davr, partiya bilan bog'lash
+        'CREATE INDEX IF NOT EXISTS idx_movements_type_created_at ON batch_movements(movement_type, created_at, batch_id)',
+        'CREATE INDEX IF NOT EXISTS idx_movements_created_at ON batch_movements(created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_movements_batch_id ON batch_movements(batch_id)',
+        'CREATE INDEX IF NOT EXISTS idx_requests_status_created_at ON stock_requests(status, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_requests_created_at ON stock_requests(created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_snapshots_taken_at ON stock_snapshots(taken_at)',
+        'CREATE INDEX IF NOT EXISTS idx_snapshot_items_snapshot_id ON stock_snapshot_items(snapshot_id)',
+    ]),
+    (2, 'Mahsulotlar lug\'ati: product_name -> product_id', False, [
+        migrate_product_names,
+        'CREATE INDEX IF NOT EXISTS idx_batches_product_id ON batches(product_id, status)',
+        'CREATE INDEX IF NOT EXISTS idx_requests_product_id ON stock_requests(product_id)',
+    ]),
+    (3, 'Partiyaning oxirgi chiqimi uchun (batch_id, movement_type, created_at) indeksi', False, [
+        # Eski indeks yangisining prefiksi; aks holda korrelyatsiyali MAX() tur indeksini tanlaydi
+        'DROP INDEX IF EXISTS idx_movements_batch_id',
+        'CREATE INDEX IF NOT EXISTS idx_movements_batch_type_created_at '
+        'ON batch_movements(batch_id, movement_type, created_at)',
+    ]),
+    (4, 'So\'rovlar uchun band qilish: product_stock agregati va stock_reservations', False, [
+        migrate_reservations,
+        # Band qilish eski partiyalardan boshlanadi (FIFO)
+        'DROP INDEX IF EXISTS idx_batches_product_id',
+        'CREATE INDEX IF NOT EXISTS idx_batches_product_status_created_at ON batches(product_id, status, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_reservations_request_id ON stock_reservations(request_id)',
+        'CREATE INDEX IF NOT EXISTS idx_reservations_batch_id ON stock_reservations(batch_id)',
+    ]),
+    (5, 'Texnik xizmat natijalari bo\'yicha indeks', True, [
+        'CREATE INDEX IF NOT EXISTS idx_maintenance_runs_started_at ON maintenance_runs(started_at)',
+    ]),
+    (6, 'Foydalanuvchi faoliyati hisoblagichlari (user_activity rollup)', False, [
+        migrate_user_activity,
+    ]),
+    (7, 'Snapshot chegarasi vaqt emas, harakat id bo\'yicha', False, [
+        migrate_snapshot_watermark,
+    ]),
+]
+
+
+def migrate_db(engine, main=True):
+    """Bajarilmagan migratsiyalarni ketma-ket qo'llash (har biri alohida BEGIN IMMEDIATE tranzaksiyada)"""
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            'CREATE TABLE IF NOT EXISTS schema_migrations ('
+            'version INTEGER PRIMARY KEY, description TEXT, applied_at TIMESTAMP)'
+        )
+        conn.commit()
+
+        applied = []
+        for version, description, main_only, steps in MIGRATIONS:
+            if main_only and not main:
+                continue
+            cur.execute('BEGIN IMMEDIATE')
+            try:
+                # Boshqa worker allaqachon qo'llagan bo'lishi mumkin - qulf ostida qayta tekshirish
+                cur.execute('SELECT 1 FROM schema_migrations WHERE version = ?', (version,))
+                if cur.fetchone():
+                    conn.rollback()
+                    continue
+                for step in steps:
+                    if callable(step):
+                        step(cur)
+                    else:
+                        cur.execute(step)
+                cur.execute(
+                    'INSERT INTO schema_migrations (version, description, applied_at) VALUES (?, ?, ?)',
+                    (version, description, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+                )
+                conn.commit()
+                applied.append(version)
+            except Exception:
+                conn.rollback()
+                raise
+        return applied
+    finally:
+        conn.close()
+
+
+def hot_queries():
+    """Asosiy endpointlarning so'rovlari (EXPLAIN QUERY PLAN tekshiruvi uchun)"""
+    now = datetime.now()
+    q = '%un%'
+    return {
+        'get_batches': Batch.query.order_by(Batch.created_at.desc()),
+        'search_batches': Batch.query.filter(
+            Batch.status == 'ACTIVE',
+            db.or_(Batch.product_name.ilike(q), Batch.batch_code.ilike(q), Batch.location.ilike(q))
+        ).order_by(Batch.created_at.desc()),
+        'search': quick_search_query('un'),
+        'get_batch_by_code': Batch.query.filter(
+            Batch.status == 'ACTIVE', Batch.batch_code == 'P1'
+        ).order_by(Batch.created_at.desc()),
+        'rows_matrix_status': Batch.query.filter_by(location='A-1-1').filter(
+            ((Batch.quantity_sht != None) & (Batch.quantity_sht > 0)) |
+            ((Batch.quantity_kg != None) & (Batch.quantity_kg > 0))
+        ).limit(1),
+        'get_user_activity': db.session.query(db.func.count(Batch.id)).filter(Batch.status == 'ACTIVE'),
+        'get_user_activity_series': user_activity_query(1, 'day', now.date() - timedelta(days=29), now.date()),
+        'get_archive': archive_aggregate_query(archive_params(MultiDict({'year': now.year})), 'IN'),
+        'get_archive_all': archive_aggregate_query(archive_params(MultiDict()), 'OUT'),
+        'report': BatchMovement.query.filter(
+            BatchMovement.created_at >= now - timedelta(days=30), BatchMovement.created_at <= now
+        ),
+        'get_stock_requests': stock_requests_query('NEW'),
+        'allocate_stock': Batch.query.filter(
+            Batch.product_id == 1, Batch.status == 'ACTIVE'
+        ).order_by(Batch.created_at, Batch.id),
+        'get_stock_requests_all': stock_requests_query(),
+        'analytics_aging': aging_batches_query(now),
+        'analytics_turnover': turnover_movements_query(now - timedelta(days=30)),
+        'stock_as_of': StockSnapshot.query.filter(StockSnapshot.taken_at < now).order_by(
+            StockSnapshot.taken_at.desc()
+        ).limit(1),
+        'stock_as_of_movements': as_of_movements_query(now, after_id=1),
+        'stock_as_of_movements_no_snapshot': as_of_movements_query(now),
+    }
+
+
+def check_query_plans():
+    """Har bir asosiy so'rov rejasi: [(nom, reja qatorlari, ok)] - indekssiz to'liq SCAN bo'lmasligi kerak"""
+    engine = db.session.get_bind(mapper=Batch)
+    # Reja statistikasiz sxema nusxasida tekshiriladi: ANALYZE'dan keyin kichik bazada SCAN arzonroq
+    # bo'lib qoladi, bu esa indeks yetishmasligini bildirmaydi
+    with engine.connect() as conn:
+        schema = conn.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%' "
+            "ORDER BY type = 'index'"
+        ).scalars().all()
+    sandbox = sqlite3.connect(':memory:')
+    for sql in schema:
+        sandbox.execute(sql)
+
+    results = []
+    for name, query in hot_queries().items():
+        statement = query.statement if hasattr(query, 'statement') else query
+        compiled = statement.compile(dialect=engine.dialect)
+        params = tuple(compiled.params[key] for key in compiled.positiontup)
+        plan = [row[-1] for row in sandbox.execute('EXPLAIN QUERY PLAN ' + str(compiled), params)]
+        ok = not any(
+            line.startswith('SCAN ') and 'USING' not in line and line.split()[1] in SHARDED_TABLES
+            for line in plan
+        )
+        results.append((name, plan, ok))
+    sandbox.close()
+    return results
+
+
+# ==================== MAINTENANCE ====================
+MAINTENANCE_TASKS = ('backup', 'optimize', 'vacuum')
+BACKUP_STEP_SLEEP = 0.005
+BACKUP_MAX_RESTARTS = 50
+VACUUM_STEP_SLEEP = 0.02
+
+
+def database_file(engine):
+    """Engine'ning SQLite fayl yo'li"""
+    return engine.url.database
+
+
+def database_size(engine):
+    """Mantiqiy hajm (sahifalar soni * sahifa hajmi) - WAL'dagi hali ko'chirilmagan sahifalar bilan"""
+    stats = database_stats(engine)
+    return stats['page_count'] * stats['page_size']
+
+
+def database_stats(engine):
+    """Fayl hajmi va sahifalar holati"""
+    conn = engine.raw_connection()
+    try:
+        pragma = lambda name: conn.driver_connection.execute(f'PRAGMA {name}').fetchone()[0]
+        wal = database_file(engine) + '-wal'
+        return {
+            'size': os.path.getsize(database_file(engine)),
+            'wal_size': os.path.getsize(wal) if os.path.exists(wal) else 0,
+            'journal_mode': pragma('journal_mode'),
+            'page_size': pragma('page_size'),
+            'page_count': pragma('page_count'),
+            'freelist_count': pragma('freelist_count'),
+            'auto_vacuum': {0: 'NONE', 1: 'FULL', 2: 'INCREMENTAL'}.get(pragma('auto_vacuum')),
+        }
+    finally:
+        conn.close()
+
+
+def backup_database(warehouse_id, engine):
+    """Onlayn zaxira nusxa: backup API kichik qadamlar bilan, qadamlar orasida yozuvchilar ishlaydi"""
+    directory = current_app.config['BACKUP_DIR']
+    os.makedirs(directory, exist_ok=True)
+    target = os.path.join(directory, f"sklad_{warehouse_id}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.db")
+    partial = target + '.part'
+
+    restarts = 0
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal restarts, last_remaining
+        # Boshqa ulanish manbani o'zgartirsa, backup boshidan boshlanadi (WAL'siz bazalarda)
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > BACKUP_MAX_RESTARTS:
+                raise RuntimeError('Baza juda tez-tez o\'zgarmoqda, zaxira nusxa to\'xtatildi')
+        last_remaining = remaining
+        # Qadamlar orasida disk boshqa so'rovlarga bo'shatiladi
+        time.sleep(BACKUP_STEP_SLEEP)
+
+    conn = engine.raw_connection()
+    source = conn.driver_connection
+    destination = sqlite3.connect(partial)
+    try:
+        # WAL'da ochiq o'qish tranzaksiyasi bir xil snapshotni beradi: qayta boshlanmaydi,
+        # yozuvchilar esa bloklanmaydi
+        wal = source.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        if wal:
+            source.execute('BEGIN')
+            source.execute('SELECT 1 FROM sqlite_master LIMIT 1').fetchall()
+        try:
+            source.backup(destination, pages=current_app.config['BACKUP_PAGES_PER_STEP'], progress=progress)
+        finally:
+            if wal:
+                source.rollback()
+        # Nusxa yagona mustaqil fayl bo'lishi uchun
+        destination.execute('PRAGMA journal_mode = DELETE')
+        # Tekshiruv nusxada bajariladi - asosiy bazada qulf olinmaydi
+        check = destination.execute('PRAGMA integrity_check').fetchone()[0]
+    except Exception:
+        destination.close()
+        os.remove(partial)
+        raise
+    finally:
+        conn.close()
+    destination.close()
+
+    if check != 'ok':
+        os.remove(partial)
+        raise RuntimeError(f'integrity_check: {check}')
+    os.replace(partial, target)
+
+    prefix = f'sklad_{warehouse_id}-'
+    backups = sorted(name for name in os.listdir(directory) if name.startswith(prefix) and name.endswith('.db'))
+    for name in backups[:-current_app.config['BACKUP_KEEP']]:
+        os.remove(os.path.join(directory, name))
+
+    return f'{os.path.basename(target)} ({restarts} marta qayta boshlandi)'
+
+
+def optimize_database(warehouse_id, engine):
+    """Reja statistikasi: har bir jadval uchun cheklangan ANALYZE (alohida qisqa tranzaksiyalarda)"""
+    conn = engine.raw_connection()
+    try:
+        sqlite = conn.driver_connection
+        sqlite.execute('PRAGMA analysis_limit = 400')
+        tables = [row[0] for row in sqlite.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        )]
+        for table in tables:
+            sqlite.execute(f'ANALYZE "{table}"')
+        sqlite.execute('PRAGMA optimize')
+        sqlite.execute('PRAGMA analysis_limit = 0')
+    finally:
+        conn.close()
+    return f'{len(tables)} ta jadval'
+
+
+def vacuum_database(warehouse_id, engine):
+    """Bo'sh sahifalarni kichik qismlarda faylga qaytarish (auto_vacuum=INCREMENTAL bazalar uchun)"""
+    conn = engine.raw_connection()
+    try:
+        sqlite = conn.driver_connection
+        if sqlite.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            return 'auto_vacuum=INCREMENTAL emas (flask --app app maintenance --enable-incremental-vacuum)'
+        freed = 0
+        free = sqlite.execute('PRAGMA freelist_count').fetchone()[0]
+        while free:
+            # Har bir chaqiruv alohida qisqa yozish tranzaksiyasi. execute() bu pragmani bitta
+            # qadamdan keyin to'xtatadi (bitta sahifa) - executescript oxirigacha bajaradi
+            sqlite.executescript(f"PRAGMA incremental_vacuum({current_app.config['MAINTENANCE_VACUUM_PAGES']})")
+            remaining = sqlite.execute('PRAGMA freelist_count').fetchone()[0]
+            if remaining >= free:
+                break
+            freed += free - remaining
+            free = remaining
+            time.sleep(VACUUM_STEP_SLEEP)
+        # WAL'dagi o'zgarishlarni faylga ko'chirish (PASSIVE - hech kimni kutmaydi)
+        sqlite.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchall()
+    finally:
+        conn.close()
+    return f'{freed} ta sahifa bo\'shatildi'
+
+
+MAINTENANCE_FUNCTIONS = {
+    'backup': backup_database,
+    'optimize': optimize_database,
+    'vacuum': vacuum_database,
+}
+
+
+def run_maintenance(tasks=MAINTENANCE_TASKS, warehouses=None):
+    """Vazifalarni har bir ombor bazasida bajarish va o'lchovlarni maintenance_runs ga yozish"""
+    runs = []
+    for warehouse_id in warehouses or current_app.config['WAREHOUSES']:
+        engine = warehouse_engine(warehouse_id) or db.engine
+        for task in tasks:
+            started_at = datetime.now()
+            size_before = database_size(engine)
+            start = time.perf_counter()
+            try:
+                detail, ok = MAINTENANCE_FUNCTIONS[task](warehouse_id, engine), True
+            except Exception as e:
+                current_app.logger.exception('Texnik xizmat xatosi: %s/%s', warehouse_id, task)
+                detail, ok = str(e), False
+            run = MaintenanceRun(
+                warehouse=warehouse_id,
+                task=task,
+                started_at=started_at,
+                duration_ms=int((time.perf_counter() - start) * 1000),
+                size_before=size_before,
+                size_after=database_size(engine),
+                ok=ok,
+                detail=detail[:255]
+            )
+            db.session.add(run)
+            db.session.commit()
+            runs.append(run)
+    return runs
+
+
+def in_maintenance_window(moment):
+    """MAINTENANCE_WINDOW ("HH:MM-HH:MM", yarim tundan o'tishi mumkin) ichidami"""
+    start, end = (datetime.strptime(part.strip(), '%H:%M').time()
+                  for part in current_app.config['MAINTENANCE_WINDOW'].split('-'))
+    current = moment.time()
+    if start <= end:
+        return start <= current < end
+    return current >= start or current < end
+
+
+def try_file_lock(path):
+    """Faylga eksklyuziv qulf (band bo'lsa None); jarayon tugaganda OS qulfni o'zi bo'shatadi"""
+    import fcntl
+
+    f = open(path, 'a')
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+def start_maintenance_scheduler(app, interval=60, lock_path=None):
+    """Fon oqimi: texnik oynada sutkada bir marta barcha vazifalarni bajarish.
+
+    lock_path berilsa (bir nechta worker jarayoni) vazifalarni shu fayl qulfini olgan bitta jarayon
+    bajaradi; u to'xtasa, qulfni keyingi tekshiruvda boshqa worker oladi.
+    """
+    def run():
+        lock = None
+        while True:
+            time.sleep(interval)
+            try:
+                if lock_path and lock is None:
+                    lock = try_file_lock(lock_path)
+                    if lock is None:
+                        continue
+                with app.app_context():
+                    now = datetime.now()
+                    if not in_maintenance_window(now):
+                        continue
+                    # Oxirgi ishga tushirish bazada - qayta ishga tushganda ham takrorlanmaydi
+                    last = db.session.query(db.func.max(MaintenanceRun.started_at)).scalar()
+                    if last and now - last < timedelta(hours=20):
+                        continue
+                    run_maintenance()
+            except Exception:
+                app.logger.exception('Texnik xizmat rejalashtiruvchisi xatosi')
+
+    thread = threading.Thread(target=run, name='maintenance', daemon=True)
+    thread.start()
+    return thread
+
+
+@bp.route('/api/maintenance', methods=['GET'])
+@login_required
+def maintenance_status():
+    """Bazalar holati va oxirgi texnik xizmat natijalari"""
+    runs = MaintenanceRun.query.order_by(MaintenanceRun.started_at.desc()).limit(50).all()
+    return list_response({
+        'databases': {
+            warehouse_id: database_stats(warehouse_engine(warehouse_id) or db.engine)
+            for warehouse_id in current_app.config['WAREHOUSES']
+        },
+        'runs': [{
+            'warehouse': r.warehouse,
+            'task': r.task,
+            'started_at': r.started_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'duration_ms': r.duration_ms,
+            'size_before': r.size_before,
+            'size_after': r.size_after,
+            'ok': r.ok,
+            'detail': r.detail
+        } for r in runs]
+    })
+
+
 # ==================== DATABASE INITIALIZATION ====================
-def init_db():
+def init_db(app):
     """Ma'lumotlar bazasini yaratish"""
     with app.app_context():
         db.create_all()
+        migrate_db(db.engine)
         
         # Admin foydalanuvchi yaratish
         if not User.query.filter_by(username='admin').first():
@@ -1013,36 +3589,229 @@ def init_db():
         
         db.session.commit()
 
-        # Mavjud partiyalar uchun kirim/chiqim tarixini to'ldirish (best-effort)
-        existing_in = {m.batch_id for m in BatchMovement.query.filter_by(movement_type='IN').all()}
-        existing_out = {m.batch_id for m in BatchMovement.query.filter_by(movement_type='OUT').all()}
-        
-        for b in Batch.query.all():
-            if b.id not in existing_in:
-                total_sht = (b.quantity_sht or 0) + (b.removed_quantity_sht or 0)
-                total_kg = (b.quantity_kg or 0.0) + (b.removed_quantity_kg or 0.0)
-                if total_sht > 0 or total_kg > 0:
-                    add_movement(
-                        b,
-                        movement_type='IN',
-                        qty_sht=total_sht,
-                        qty_kg=total_kg,
-                        created_at=b.created_at
-                    )
-            if b.removed_at and b.id not in existing_out:
-                if (b.removed_quantity_sht or 0) > 0 or (b.removed_quantity_kg or 0.0) > 0:
-                    add_movement(
-                        b,
-                        movement_type='OUT',
-                        qty_sht=b.removed_quantity_sht or 0,
-                        qty_kg=b.removed_quantity_kg or 0.0,
-                        created_at=b.removed_at
-                    )
-        
-        db.session.commit()
+        for warehouse_id in app.config['WAREHOUSES']:
+            with warehouse_context(warehouse_id, app):
+                backfill_movements()
+                location_indexes.get().rebuild()
+                for index in autocomplete_indexes.get().values():
+                    index.rebuild()
+
+
+def backfill_movements():
+    """Mavjud partiyalar uchun kirim/chiqim tarixini to'ldirish (best-effort)"""
+    existing_in = {m.batch_id for m in BatchMovement.query.filter_by(movement_type='IN').all()}
+    existing_out = {m.batch_id for m in BatchMovement.query.filter_by(movement_type='OUT').all()}
+    
+    for b in Batch.query.all():
+        if b.id not in existing_in:
+            total_sht = (b.quantity_sht or 0) + (b.removed_quantity_sht or 0)
+            total_kg = (b.quantity_kg or 0.0) + (b.removed_quantity_kg or 0.0)
+            if total_sht > 0 or total_kg > 0:
+                add_movement(
+                    b,
+                    movement_type='IN',
+                    qty_sht=total_sht,
+                    qty_kg=total_kg,
+                    created_at=b.created_at
+                )
+        if b.removed_at and b.id not in existing_out:
+            if (b.removed_quantity_sht or 0) > 0 or (b.removed_quantity_kg or 0.0) > 0:
+                add_movement(
+                    b,
+                    movement_type='OUT',
+                    qty_sht=b.removed_quantity_sht or 0,
+                    qty_kg=b.removed_quantity_kg or 0.0,
+                    created_at=b.removed_at
+                )
+    
+    db.session.commit()
+
+
+@bp.cli.command('snapshot')
+def snapshot_command():
+    """Qoldiqlar snapshotini yaratish (cron orqali har kuni/oyda ishga tushiriladi)"""
+    for warehouse_id in current_app.config['WAREHOUSES']:
+        with warehouse_context(warehouse_id):
+            snapshot = take_stock_snapshot()
+            print(f"[{warehouse_id}] Snapshot #{snapshot.id}: {len(snapshot.items)} ta partiya")
+
+
+@bp.cli.command('migrate')
+def migrate_command():
+    """Barcha omborlar bazalariga migratsiyalarni qo'llash"""
+    db.create_all()
+    print(f"[{default_warehouse()}] qo'llandi: {migrate_db(db.engine) or '-'}")
+    for warehouse_id in current_app.config['WAREHOUSES'][1:]:
+        # warehouse_engine() yangi shard yaratganda migratsiyalarni o'zi qo'llaydi
+        print(f"[{warehouse_id}] qo'llandi: {migrate_db(warehouse_engine(warehouse_id), main=False) or '-'}")
+
+
+@bp.cli.command('check-plans')
+def check_plans_command():
+    """Asosiy so'rovlar indeks ishlatishini tekshirish (xato bo'lsa chiqish kodi 1)"""
+    failed = False
+    for warehouse_id in current_app.config['WAREHOUSES']:
+        with warehouse_context(warehouse_id):
+            for name, plan, ok in check_query_plans():
+                failed = failed or not ok
+                print(f"[{warehouse_id}] {'OK  ' if ok else 'FAIL'} {name}: {' | '.join(plan)}")
+    if failed:
+        raise SystemExit(1)
+
+
+@bp.cli.command('maintenance')
+@click.option('--task', 'tasks', multiple=True, type=click.Choice(MAINTENANCE_TASKS),
+              help='Bajariladigan vazifa (standart: hammasi)')
+@click.option('--warehouse', 'warehouses', multiple=True, help='Ombor (standart: hammasi)')
+@click.option('--enable-incremental-vacuum', is_flag=True,
+              help='Mavjud bazani auto_vacuum=INCREMENTAL ga o\'tkazish (to\'liq VACUUM, yozuvlarni bloklaydi)')
+def maintenance_command(tasks, warehouses, enable_incremental_vacuum):
+    """Zaxira nusxa, ANALYZE va incremental VACUUM (cron yoki qo'lda)"""
+    unknown = sorted(set(warehouses) - set(current_app.config['WAREHOUSES']))
+    if unknown:
+        raise click.BadParameter(', '.join(unknown), param_hint='--warehouse')
+    if enable_incremental_vacuum:
+        for warehouse_id in warehouses or current_app.config['WAREHOUSES']:
+            conn = (warehouse_engine(warehouse_id) or db.engine).raw_connection()
+            try:
+                conn.driver_connection.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                conn.driver_connection.execute('VACUUM')
+            finally:
+                conn.close()
+            print(f"[{warehouse_id}] auto_vacuum=INCREMENTAL")
+        return
+
+    for run in run_maintenance(tasks or MAINTENANCE_TASKS, warehouses or None):
+        print(f"[{run.warehouse}] {'OK  ' if run.ok else 'FAIL'} {run.task}: {run.duration_ms} ms, "
+              f"{run.size_before} -> {run.size_after} bayt, {run.detail}")
+
+
+# ==================== APP FACTORY ====================
+class AppState:
+    """Ilovaga tegishli jarayon ichidagi holat: har bir create_app() uchun alohida"""
+
+    def __init__(self, app):
+        config = app.config
+        self.warehouse_engines = {}
+        self.engines_lock = threading.Lock()
+        self.per_warehouse = {}
+        # Pool oqimlari birinchi vazifada yaratiladi - preload'da fork'dan oldin ishga tushmaydi
+        self.warehouse_executor = ThreadPoolExecutor(
+            max_workers=len(config['WAREHOUSES']), thread_name_prefix='warehouse'
+        )
+        self.write_coordinator = WriteCoordinator(
+            app, config['GROUP_COMMIT_MAX_OPS'], config['GROUP_COMMIT_MAX_DELAY_MS'] / 1000.0,
+            config['GROUP_COMMIT_TIMEOUT']
+        )
+        self.export_cache = ExportCache(config['EXPORT_CACHE_DIR'], config['EXPORT_CACHE_MAX_BYTES'])
+        self.export_executor = ThreadPoolExecutor(max_workers=config['EXPORT_WORKERS'], thread_name_prefix='export')
+        self.export_jobs = {}
+        self.export_jobs_lock = threading.Lock()
+
+
+def create_app(config=None):
+    """Ilova fabrikasi: create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'}) - alohida ilova (masalan, testlar uchun)"""
+    app = Flask(__name__)
+    app.config.update(default_config(app.instance_path))
+    app.config.update(config or {})
+    db.init_app(app)
+    app.extensions['sklad'] = AppState(app)
+    app.register_blueprint(bp)
+    if app.config['INIT_DB']:
+        init_db(app)
+    return app
+
+
+def dispose_engines(app):
+    """fork'dan keyin: ota jarayondan meros qolgan SQLite ulanishlarini ishlatmaslik (gunicorn post_fork)"""
+    with app.app_context():
+        for engine in [*db.engines.values(), *app_state().warehouse_engines.values()]:
+            engine.dispose(close=False)
+
+
+STARTUP_BENCH_SCRIPT = """
+import json, os, sys, time
+config = json.loads(sys.argv[2])
+start = time.perf_counter()
+module = __import__(sys.argv[1])
+imported = time.perf_counter()
+# preload_app: ilova master jarayonda (baza tayyor, INIT_DB=False), worker esa fork orqali
+app = module.create_app(config)
+created = time.perf_counter()
+read_fd, write_fd = os.pipe()
+forking = time.perf_counter()
+if os.fork() == 0:
+    forked = time.perf_counter()
+    module.dispose_engines(app)
+    app.test_client().get('/login')
+    served = time.perf_counter()
+    rss = None
+    try:
+        with open('/proc/self/status') as f:
+            rss = next(int(line.split()[1]) for line in f if line.startswith('VmRSS:')) / 1024
+    except (OSError, StopIteration):
+        pass
+    os.write(write_fd, json.dumps({
+        'fork_ms': (forked - forking) * 1000,
+        'first_request_ms': (served - forked) * 1000,
+        'rss_mb': rss,
+    }).encode())
+    os._exit(0)
+os.close(write_fd)
+with os.fdopen(read_fd) as f:
+    worker = json.loads(f.read())
+os.wait()
+print(json.dumps(dict(
+    worker,
+    import_ms=(imported - start) * 1000,
+    create_app_ms=(created - imported) * 1000,
+    heavy_modules=[m for m in ('openpyxl', 'reportlab', 'numpy') if m in sys.modules],
+)))
+"""
+
+
+@bp.cli.command('bench-startup')
+@click.option('--runs', default=5, show_default=True, help='Necha marta yangi jarayon ishga tushiriladi')
+def bench_startup_command(runs):
+    """Worker ishga tushish yo'li: import + fork + birinchi so'rov va RSS (vaqtinchalik bazada, medianalar)"""
+    import statistics
+    import tempfile
+
+    if not hasattr(os, 'fork'):
+        raise click.ClickException('bench-startup fork talab qiladi (Linux/macOS)')
+
+    module = os.path.splitext(os.path.basename(__file__))[0]
+    samples = []
+    with tempfile.TemporaryDirectory(prefix='sklad-bench-') as tmp:
+        # Haqiqiy instance/sklad.db ga tegilmaydi: migratsiyalar bir marta vaqtinchalik bazada bajariladi
+        config = {
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(tmp, 'sklad.db'),
+            'WAREHOUSES': ['main'],
+            'EXPORT_CACHE_DIR': os.path.join(tmp, 'export_cache'),
+            'BACKUP_DIR': os.path.join(tmp, 'backups'),
+            'MAINTENANCE_SCHEDULER': False,
+        }
+        dispose_engines(create_app(config))
+        config['INIT_DB'] = False
+
+        for _ in range(runs):
+            output = subprocess.run(
+                [sys.executable, '-c', STARTUP_BENCH_SCRIPT, module, json.dumps(config)],
+                cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True
+            ).stdout
+            samples.append(json.loads(output.strip().splitlines()[-1]))
+
+    for key in ('import_ms', 'create_app_ms', 'fork_ms', 'first_request_ms', 'rss_mb'):
+        values = [sample[key] for sample in samples if sample[key] is not None]
+        if values:
+            print(f"{key:18} median {statistics.median(values):8.1f}   min {min(values):8.1f}   max {max(values):8.1f}")
+    print(f"{'heavy_modules':18} {', '.join(samples[-1]['heavy_modules']) or '-'}")
 
 
 # ==================== RUN APPLICATION ====================
 if __name__ == '__main__':
-    init_db()
+    app = create_app()
+    # Reloader'ning ota jarayonida emas, faqat ishlayotgan ilova jarayonida
+    if app.config['MAINTENANCE_SCHEDULER'] and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_maintenance_scheduler(app)
     app.run(debug=True, host='127.0.0.1', port=5000)
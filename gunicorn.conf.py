@@ -0,0 +1,34 @@
+"""
+Gunicorn sozlamalari (ko'p jarayonli production server)
+=======================================================
+gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+threads = int(os.environ.get('WEB_THREADS', 4))
+
+# Ilova (migratsiyalar, xotiradagi indekslar) master jarayonda bir marta yaratiladi,
+# workerlar uni fork orqali tayyor holda oladi
+preload_app = True
+
+# Har bir worker o'z xotiradagi indekslariga ega: boshqa workerlar yozuvlari shu oraliqda yetib keladi
+raw_env = [f"INDEX_REFRESH_SECONDS={os.environ.get('INDEX_REFRESH_SECONDS', '5')}"]
+
+
+def post_fork(server, worker):
+    """Worker master jarayon ochgan SQLite ulanishlarini ishlatmasligi kerak.
+
+    Master faqat nazoratchi: texnik xizmat (MAINTENANCE_SCHEDULER=1) workerlarda ishga tushadi va
+    instance/maintenance.lock qulfini olgan bitta worker bajaradi. Muqobili - cron/systemd timer orqali
+    ``flask --app app maintenance``.
+    """
+    from app import dispose_engines, start_maintenance_scheduler
+
+    app = server.app.wsgi()
+    dispose_engines(app)
+    if app.config['MAINTENANCE_SCHEDULER']:
+        start_maintenance_scheduler(app, lock_path=os.path.join(app.instance_path, 'maintenance.lock'))
@@ -12,10 +12,17 @@ CREATE TABLE IF NOT EXISTS users (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Mahsulotlar lug'ati (search_key - kichik harfli, bo'shliqlari normallashgan nom)
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    name VARCHAR(200) NOT NULL,
+    search_key VARCHAR(200) NOT NULL UNIQUE
+);
+
 -- Partiyalar jadvali
 CREATE TABLE IF NOT EXISTS batches (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
-    product_name TEXT NOT NULL,
+    product_id INTEGER NOT NULL,
     batch_code TEXT NOT NULL,
     quantity INTEGER,
     quantity_sht INTEGER,
@@ -29,6 +36,9 @@ CREATE TABLE IF NOT EXISTS batches (
     removed_by INTEGER,
     removed_quantity_sht INTEGER DEFAULT 0,
     removed_quantity_kg REAL DEFAULT 0.0,
+    reserved_sht INTEGER DEFAULT 0,
+    reserved_kg REAL DEFAULT 0.0,
+    FOREIGN KEY (product_id) REFERENCES products(id),
     FOREIGN KEY (removed_by) REFERENCES users(id)
 );
 
@@ -46,7 +56,7 @@ CREATE TABLE IF NOT EXISTS batch_movements (
 -- Sklad so'rovlar jadvali
 CREATE TABLE IF NOT EXISTS stock_requests (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
-    product_name TEXT NOT NULL,
+    product_id INTEGER NOT NULL,
     batch_code TEXT,
     quantity_sht INTEGER DEFAULT 0,
     quantity_kg REAL DEFAULT 0.0,
@@ -55,16 +65,101 @@ CREATE TABLE IF NOT EXISTS stock_requests (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     seen_at TIMESTAMP,
     created_by INTEGER,
+    FOREIGN KEY (product_id) REFERENCES products(id),
     FOREIGN KEY (created_by) REFERENCES users(id)
 );
 
--- Indekslar
-CREATE INDEX IF NOT EXISTS idx_batches_status ON batches(status);
-CREATE INDEX IF NOT EXISTS idx_batches_location ON batches(location);
-CREATE INDEX IF NOT EXISTS idx_batches_batch_code ON batches(batch_code);
+-- So'rovlar uchun partiyalardan band qilingan miqdorlar
+CREATE TABLE IF NOT EXISTS stock_reservations (
+    id INTEGER PRIMARY KEY,
+    request_id INTEGER NOT NULL,
+    batch_id INTEGER NOT NULL,
+    quantity_sht INTEGER DEFAULT 0,
+    quantity_kg REAL DEFAULT 0.0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (request_id) REFERENCES stock_requests(id),
+    FOREIGN KEY (batch_id) REFERENCES batches(id)
+);
+
+-- Foydalanuvchi faoliyati hisoblagichlari (foydalanuvchi va kun bo'yicha rollup)
+CREATE TABLE IF NOT EXISTS user_activity (
+    user_id INTEGER NOT NULL,
+    day DATE NOT NULL,
+    batches_removed INTEGER DEFAULT 0,
+    requests_created INTEGER DEFAULT 0,
+    requests_completed INTEGER DEFAULT 0,
+    requests_failed INTEGER DEFAULT 0,
+    released_sht INTEGER DEFAULT 0,
+    released_kg REAL DEFAULT 0.0,
+    PRIMARY KEY (user_id, day)
+);
+
+-- Mahsulot bo'yicha faol qoldiq va band qilingan miqdor (partiyalar bilan birga yangilanadi)
+CREATE TABLE IF NOT EXISTS product_stock (
+    product_id INTEGER PRIMARY KEY,
+    quantity_sht INTEGER NOT NULL DEFAULT 0,
+    quantity_kg REAL NOT NULL DEFAULT 0.0,
+    reserved_sht INTEGER NOT NULL DEFAULT 0,
+    reserved_kg REAL NOT NULL DEFAULT 0.0,
+    FOREIGN KEY (product_id) REFERENCES products(id)
+);
+
+-- Qoldiqlar snapshotlari
+CREATE TABLE IF NOT EXISTS stock_snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    taken_at TIMESTAMP NOT NULL,
+    last_movement_id INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS stock_snapshot_items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    snapshot_id INTEGER NOT NULL,
+    batch_id INTEGER NOT NULL,
+    product_id INTEGER NOT NULL,
+    batch_code TEXT NOT NULL,
+    location TEXT NOT NULL,
+    quantity_sht INTEGER DEFAULT 0,
+    quantity_kg REAL DEFAULT 0.0,
+    FOREIGN KEY (snapshot_id) REFERENCES stock_snapshots(id),
+    FOREIGN KEY (batch_id) REFERENCES batches(id),
+    FOREIGN KEY (product_id) REFERENCES products(id)
+);
+
+-- Texnik xizmat (zaxira nusxa, ANALYZE, VACUUM) natijalari
+CREATE TABLE IF NOT EXISTS maintenance_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    warehouse TEXT NOT NULL,
+    task TEXT NOT NULL,
+    started_at TIMESTAMP NOT NULL,
+    duration_ms INTEGER DEFAULT 0,
+    size_before INTEGER DEFAULT 0,
+    size_after INTEGER DEFAULT 0,
+    ok BOOLEAN DEFAULT 1,
+    detail TEXT
+);
+
+-- Qo'llangan migratsiyalar
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    description TEXT,
+    applied_at TIMESTAMP
+);
+
+-- Indekslar (app.py dagi MIGRATIONS bilan bir xil; ilova ularni avtomatik qo'llaydi)
+CREATE INDEX IF NOT EXISTS idx_batches_location_qty ON batches(location, quantity_sht, quantity_kg);
+CREATE INDEX IF NOT EXISTS idx_batches_status_created_at ON batches(status, created_at);
+CREATE INDEX IF NOT EXISTS idx_batches_code_created_at ON batches(batch_code, created_at, location);
+CREATE INDEX IF NOT EXISTS idx_batches_code_status_created_at ON batches(batch_code, status, created_at);
 CREATE INDEX IF NOT EXISTS idx_batches_created_at ON batches(created_at);
-CREATE INDEX IF NOT EXISTS idx_movements_batch_id ON batch_movements(batch_id);
-CREATE INDEX IF NOT EXISTS idx_movements_type ON batch_movements(movement_type);
+CREATE INDEX IF NOT EXISTS idx_movements_type_created_at ON batch_movements(movement_type, created_at, batch_id);
 CREATE INDEX IF NOT EXISTS idx_movements_created_at ON batch_movements(created_at);
-CREATE INDEX IF NOT EXISTS idx_requests_status ON stock_requests(status);
+CREATE INDEX IF NOT EXISTS idx_movements_batch_type_created_at ON batch_movements(batch_id, movement_type, created_at);
+CREATE INDEX IF NOT EXISTS idx_requests_status_created_at ON stock_requests(status, created_at);
 CREATE INDEX IF NOT EXISTS idx_requests_created_at ON stock_requests(created_at);
+CREATE INDEX IF NOT EXISTS idx_snapshots_taken_at ON stock_snapshots(taken_at);
+CREATE INDEX IF NOT EXISTS idx_snapshot_items_snapshot_id ON stock_snapshot_items(snapshot_id);
+CREATE INDEX IF NOT EXISTS idx_batches_product_status_created_at ON batches(product_id, status, created_at);
+CREATE INDEX IF NOT EXISTS idx_requests_product_id ON stock_requests(product_id);
+CREATE INDEX IF NOT EXISTS idx_reservations_request_id ON stock_reservations(request_id);
+CREATE INDEX IF NOT EXISTS idx_reservations_batch_id ON stock_reservations(batch_id);
+CREATE INDEX IF NOT EXISTS idx_maintenance_runs_started_at ON maintenance_runs(started_at);
@@ -0,0 +1,1489 @@
+// Keshni tozalash tugmasi uchun
+document.addEventListener('DOMContentLoaded', function() {
+    var clearBtn = document.getElementById('clearCacheBtn');
+    if (clearBtn) {
+        clearBtn.addEventListener('click', function() {
+            try {
+                localStorage.clear();
+                sessionStorage.clear();
+                document.cookie.split(';').forEach(function(c) {
+                    document.cookie = c.replace(/^ +/, '').replace(/=.*/, '=;expires=' + new Date(0).toUTCString() + ';path=/');
+                });
+                var msg = document.getElementById('cacheClearMsg');
+                if (msg) {
+                    msg.style.display = 'block';
+                    setTimeout(function(){ msg.style.display = 'none'; }, 2000);
+                }
+            } catch (e) {
+                alert('Ошибка при очистке кэша!');
+            }
+        });
+    }
+});
+
+// Matrix modalidagi PDF yuklab olish tugmasi uchun (jadval to'liq sig'sin)
+document.addEventListener('DOMContentLoaded', function() {
+    const pdfBtn = document.getElementById('downloadMatrixPdfBtn');
+    if (pdfBtn) {
+        pdfBtn.addEventListener('click', function() {
+            const matrixDiv = pdfBtn.parentElement;
+            html2canvas(matrixDiv.querySelector('table')).then(function(canvas) {
+                const imgData = canvas.toDataURL('image/png');
+                const pdf = new jspdf.jsPDF({ orientation: 'landscape', unit: 'pt', format: 'a4' });
+                const pageWidth = pdf.internal.pageSize.getWidth();
+                const pageHeight = pdf.internal.pageSize.getHeight();
+                const margin = 10;
+                let imgWidth = pageWidth - margin * 2;
+                let imgHeight = (canvas.height * imgWidth) / canvas.width;
+                if (imgHeight > pageHeight - margin * 2) {
+                    imgHeight = pageHeight - margin * 2;
+                    imgWidth = (canvas.width * imgHeight) / canvas.height;
+                }
+                const imgX = (pageWidth - imgWidth) / 2;
+                const imgY = (pageHeight - imgHeight) / 2;
+                pdf.addImage(imgData, 'PNG', imgX, imgY, imgWidth, imgHeight);
+                pdf.save('qatorlar_holati.pdf');
+            });
+        });
+    }
+});
+
+// Matritsa qiymatlari va band/bo‘sh holat (demo, backenddan keladi)
+const matrix = {
+    A: [[4,3,2,1],[4,3,2,1],[4,3,2,1],[4,3,2,1],[4,3,2,1],[4,3,2,1],[4,3,2,1],[4,3,2,1],[4,3,2,1]],
+    B: [[4,3,2,1],[4,3,2,1],[4,3,2,1],[4,3,2,1],[4,3,2,1],[4,3,2,1],[4,3,2,1],[4,3,2,1],[4,3,2,1]],
+    C: [[4,3,2,1],[4,3,2,1],[4,3,2,1],[4,3,2,1],[4,3,2,1],[4,3,2,1],[4,3,2,1],[4,3,2,1],[4,3,2,1]]
+};
+// Kataklar holati backenddan keladi
+let busyCells = {
+  A: Array(9).fill().map(() => Array(4).fill(false)),
+  B: Array(9).fill().map(() => Array(4).fill(false)),
+  C: Array(9).fill().map(() => Array(4).fill(false)),
+};
+
+    // Katakni band qilish (yangi partiya qo'shilganda)
+    function setCellBusy(location) {
+        // location: "A-1-4"
+        if (!location) return;
+        const [sector, row, cell] = location.split('-');
+        if (busyCells[sector] && busyCells[sector][parseInt(row)-1]) {
+            busyCells[sector][parseInt(row)-1][parseInt(cell)-1] = true;
+            renderMatrix();
+        }
+    }
+
+    // Katakni bo'shatish (mahsulot chiqarilganda)
+    function setCellFree(location) {
+        if (!location) return;
+        const [sector, row, cell] = location.split('-');
+        if (busyCells[sector] && busyCells[sector][parseInt(row)-1]) {
+            busyCells[sector][parseInt(row)-1][parseInt(cell)-1] = false;
+            renderMatrix();
+        }
+    }
+
+async function fetchMatrixStatus() {
+    try {
+        const res = await fetch('/api/rows_matrix_status');
+        if (res.ok) {
+            const data = await res.json();
+            // 'busy' => true, 'free' => false
+            for (const sector of ['A','B','C']) {
+                for (let i = 0; i < 9; i++) {
+                    for (let j = 0; j < 4; j++) {
+                        busyCells[sector][i][j] = (data[sector][i][j] === 'busy');
+                    }
+                }
+            }
+        }
+    } catch (e) {}
+}
+function renderMatrix() {
+    const table = document.querySelector('#rowsMatrix table');
+    // Jadval sarlavhasi
+    table.innerHTML = `
+        <tr>
+            <th style="background:#f8f8f8;">№</th>
+            <th colspan="4" style="background:yellow;">A</th>
+            <th style="background:#f8f8f8;">№</th>
+            <th colspan="4" style="background:yellow;">B</th>
+            <th style="background:#f8f8f8;">№</th>
+            <th colspan="4" style="background:yellow;">C</th>
+        </tr>
+        <tr>
+            <th style="background:#f8f8f8;"></th>
+            <th style="background: #eee;">1</th>
+            <th style="background: #eee;">2</th>
+            <th style="background: #eee;">3</th>
+            <th style="background: #eee;">4</th>
+            <th style="background:#f8f8f8;"></th>
+            <th style="background: #eee;">1</th>
+            <th style="background: #eee;">2</th>
+            <th style="background: #eee;">3</th>
+            <th style="background: #eee;">4</th>
+            <th style="background:#f8f8f8;"></th>
+            <th style="background: #eee;">1</th>
+            <th style="background: #eee;">2</th>
+            <th style="background: #eee;">3</th>
+            <th style="background: #eee;">4</th>
+        </tr>
+    `;
+    for (let i = 0; i < 9; i++) {
+        const tr = document.createElement('tr');
+        // A sektori
+        tr.innerHTML += `<td style='background:#f8f8f8;'>${i+1}</td>`;
+        for (let j = 0; j < 4; j++) {
+            tr.innerHTML += `<td style=\"background:${busyCells['A'][i][j] ? '#e04a6a' : '#27ae60'};color:#fff;text-align:center;font-weight:bold;min-width:32px;\">${matrix['A'][i][j]}</td>`;
+        }
+        // B sektori
+        tr.innerHTML += `<td style='background:#f8f8f8;'>${i+1}</td>`;
+        for (let j = 0; j < 4; j++) {
+            tr.innerHTML += `<td style=\"background:${busyCells['B'][i][j] ? '#e04a6a' : '#27ae60'};color:#fff;text-align:center;font-weight:bold;min-width:32px;\">${matrix['B'][i][j]}</td>`;
+        }
+        // C sektori
+        tr.innerHTML += `<td style='background:#f8f8f8;'>${i+1}</td>`;
+        for (let j = 0; j < 4; j++) {
+            tr.innerHTML += `<td style=\"background:${busyCells['C'][i][j] ? '#e04a6a' : '#27ae60'};color:#fff;text-align:center;font-weight:bold;min-width:32px;\">${matrix['C'][i][j]}</td>`;
+        }
+        table.appendChild(tr);
+    }
+}
+// Modal ochish va yopish
+document.addEventListener('DOMContentLoaded', function() {
+    const showMatrixBtn = document.getElementById('showMatrixBtn');
+    const matrixModal = document.getElementById('matrixModal');
+    const closeMatrixModal = document.getElementById('closeMatrixModal');
+    showMatrixBtn.addEventListener('click', async function() {
+        await fetchMatrixStatus();
+        renderMatrix();
+        matrixModal.classList.add('show');
+    });
+    closeMatrixModal.addEventListener('click', function() {
+        matrixModal.classList.remove('show');
+    });
+    window.addEventListener('click', function(e) {
+        if (e.target === matrixModal) {
+            matrixModal.classList.remove('show');
+        }
+    });
+});
+// Qatorlar holati uchun demo ma'lumot (backenddan keladi)
+
+let rowsStatus = [];
+
+async function fetchRowsStatus() {
+    try {
+        const response = await fetch('/api/rows_status');
+        if (!response.ok) throw new Error('Serverdan xato javob');
+        rowsStatus = await response.json();
+    } catch (e) {
+        rowsStatus = [];
+    }
+}
+
+// Modalni ochish
+document.addEventListener('DOMContentLoaded', function() {
+    const showRowsStatusBtn = document.getElementById('showRowsStatusBtn');
+    const rowsStatusModal = document.getElementById('rowsStatusModal');
+    const closeRowsStatusModal = document.getElementById('closeRowsStatusModal');
+    showRowsStatusBtn.addEventListener('click', async function() {
+        await fetchRowsStatus();
+        renderRowsStatus();
+        rowsStatusModal.classList.add('show');
+    });
+    closeRowsStatusModal.addEventListener('click', function() {
+        rowsStatusModal.classList.remove('show');
+    });
+    window.addEventListener('click', function(e) {
+        if (e.target === rowsStatusModal) {
+            rowsStatusModal.classList.remove('show');
+        }
+    });
+});
+
+// Qatorlar holatini chizish
+function renderMatrix() {
+    // 1. Barcha kataklarni bo'sh deb belgila
+    busyCells = {
+        A: Array(9).fill().map(() => Array(4).fill(false)),
+        B: Array(9).fill().map(() => Array(4).fill(false)),
+        C: Array(9).fill().map(() => Array(4).fill(false)),
+    };
+    // 2. Barcha partiyalarni (allBatches) ko'rib chiqib, band kataklarni belgila
+    if (window.allBatches && Array.isArray(window.allBatches)) {
+        window.allBatches.forEach(batch => {
+            if (batch.location) {
+                const match = batch.location.match(/([ABC])-([1-9])-([1-4])/);
+                if (match) {
+                    const sector = match[1];
+                    const row = parseInt(match[2], 10) - 1;
+                    const col = parseInt(match[3], 10) - 1;
+                    busyCells[sector][row][col] = true;
+                }
+            }
+        });
+    }
+    const table = document.getElementById('matrixAll');
+    let html = '';
+    // 1-qator: sektor sarlavhalari (A, B, C) faqat
+    html += `<tr>`;
+    html += `<th style='background:#f8f8f8; min-width: 36px; min-height: 36px; padding: 10px 12px; font-size: 22px; border-top-left-radius: 18px;'>№</th>`;
+    for (let s = 0; s < 3; s++) {
+        if (s > 0) html += `<th style='min-width: 18px; background: #fffde7; border: none;'></th>`;
+        html += `<th colspan='4' style='background: #ffe600; color: #222; font-weight: 700; font-size: 22px; padding: 10px 0; border-radius: 0 0 0 0;'>${String.fromCharCode(65 + s)}</th>`;
+    }
+    html += `</tr>`;
+    // 3-11 qatorlar: qiymatlar
+    for (let i = 0; i < 9; i++) {
+        html += `<tr>`;
+        html += `<td style='background:#f8f8f8; min-width: 36px; min-height: 36px; padding: 10px 12px; font-size: 22px; text-align: center;'>${i + 1}</td>`;
+        for (let s = 0; s < 3; s++) {
+            if (s > 0) html += `<td style='min-width: 18px; background: #fffde7; border: none;'></td>`;
+            for (let n = 0; n < 4; n++) {
+                // 1 2 3 4 chapdan o'ngga
+                const colIdx = n;
+                html += `<td style=\"background:${busyCells[String.fromCharCode(65+s)][i][colIdx] ? '#e04a6a' : '#27ae60'};color:#fff;text-align:center;font-weight:bold;min-width:36px;min-height:36px;padding:10px 18px;font-size:22px; border-left:2px solid #fff; border-right:2px solid #fff; border-top: 1.5px solid #fff; border-bottom: 1.5px solid #fff;\">${colIdx+1}</td>`;
+            }
+        }
+        html += `</tr>`;
+    }
+    table.innerHTML = html;
+                                function renderSectorMatrix(sectorName, sectorMatrix, sectorBusy, containerId) {
+                                    const container = document.getElementById(containerId);
+                                    let html = `<table style=\"border-collapse: collapse; font-size: 16px;\">`;
+                                    html += `<tr><th style='background:#f8f8f8; min-width: 22px; min-height: 22px; padding: 2px 6px; font-size: 16px;'>№</th><th colspan='4' style='background:yellow; min-width: 88px; min-height: 22px; font-size: 16px; padding: 2px 6px;'>${sectorName}</th></tr>`;
+                                    html += `<tr><th style='background:#f8f8f8; min-width: 22px; min-height: 22px; padding: 2px 6px; font-size: 16px;'></th>`;
+                                    for (let j = 0; j < 4; j++) {
+                                        html += `<th style='background:#eee; min-width: 22px; min-height: 22px; padding: 2px 6px; font-size: 16px;'>${j+1}</th>`;
+                                    }
+                                    html += `</tr>`;
+                                    for (let i = 0; i < 9; i++) {
+                                        html += `<tr>`;
+                                        html += `<td style='background:#f8f8f8; min-width: 22px; min-height: 22px; padding: 2px 6px; font-size: 16px;'>${i+1}</td>`;
+                                        for (let j = 0; j < 4; j++) {
+                                            html += `<td style=\"background:${sectorBusy[i][j] ? '#e04a6a' : '#27ae60'};color:#fff;text-align:center;font-weight:bold;min-width:22px;min-height:22px;padding:2px 6px;font-size:16px;\">${sectorMatrix[i][j]}</td>`;
+                                        }
+                                        html += `</tr>`;
+                                    }
+                                    html += `</table>`;
+                                    container.innerHTML = html;
+                                }
+                        function renderSectorMatrix(sectorName, sectorMatrix, sectorBusy, containerId) {
+                            const container = document.getElementById(containerId);
+                            let html = `<table style="border-collapse: collapse; font-size: 28px;">`;
+                            html += `<tr><th style='background:#f8f8f8; min-width: 48px; min-height: 48px; padding: 12px; font-size: 28px;'>№</th><th colspan='4' style='background:yellow; min-width: 192px; min-height: 48px; font-size: 28px; padding: 12px;'>${sectorName}</th></tr>`;
+                            html += `<tr><th style='background:#f8f8f8; min-width: 48px; min-height: 48px; padding: 12px; font-size: 28px;'></th>`;
+                            for (let j = 0; j < 4; j++) {
+                                html += `<th style='background:#eee; min-width: 48px; min-height: 48px; padding: 12px; font-size: 28px;'>${j+1}</th>`;
+                            }
+                            html += `</tr>`;
+                            for (let i = 0; i < 9; i++) {
+                                html += `<tr>`;
+                                html += `<td style='background:#f8f8f8; min-width: 48px; min-height: 48px; padding: 12px; font-size: 28px;'>${i+1}</td>`;
+                                for (let j = 0; j < 4; j++) {
+                                    html += `<td style="background:${sectorBusy[i][j] ? '#e04a6a' : '#27ae60'};color:#fff;text-align:center;font-weight:bold;min-width:48px;min-height:48px;padding:12px;font-size:28px;">${sectorMatrix[i][j]}</td>`;
+                                }
+                                html += `</tr>`;
+                            }
+                            html += `</table>`;
+                            container.innerHTML = html;
+                        }
+                function renderSectorMatrix(sectorName, sectorMatrix, sectorBusy, containerId) {
+                    const container = document.getElementById(containerId);
+                    let html = `<table style="border-collapse: collapse; font-size: 28px;">`;
+                    html += `<tr><th style='background:#f8f8f8; min-width: 48px; min-height: 48px; padding: 12px; font-size: 28px;'>№</th><th colspan='4' style='background:yellow; min-width: 192px; min-height: 48px; font-size: 28px; padding: 12px;'>${sectorName}</th></tr>`;
+                    html += `<tr><th style='background:#f8f8f8; min-width: 48px; min-height: 48px; padding: 12px; font-size: 28px;'></th>`;
+                    for (let j = 0; j < 4; j++) {
+                        html += `<th style='background:#eee; min-width: 48px; min-height: 48px; padding: 12px; font-size: 28px;'>${j+1}</th>`;
+                    }
+                    html += `</tr>`;
+                    for (let i = 0; i < 9; i++) {
+                        html += `<tr>`;
+                        html += `<td style='background:#f8f8f8; min-width: 48px; min-height: 48px; padding: 12px; font-size: 28px;'>${i+1}</td>`;
+                        for (let j = 0; j < 4; j++) {
+                            html += `<td style="background:${sectorBusy[i][j] ? '#e04a6a' : '#27ae60'};color:#fff;text-align:center;font-weight:bold;min-width:48px;min-height:48px;padding:12px;font-size:28px;">${sectorMatrix[i][j]}</td>`;
+                        }
+                        html += `</tr>`;
+                    }
+                    html += `</table>`;
+                    container.innerHTML = html;
+                }
+        function renderSectorMatrix(sectorName, sectorMatrix, sectorBusy, containerId) {
+            const container = document.getElementById(containerId);
+            let html = `<table style=\"border-collapse: collapse; font-size: 28px;\">`;
+            html += `<tr><th style='background:#f8f8f8; min-width: 48px; min-height: 48px; padding: 12px; font-size: 28px;'>№</th><th colspan='4' style='background:yellow; min-width: 192px; min-height: 48px; font-size: 28px; padding: 12px;'>${sectorName}</th></tr>`;
+            html += `<tr><th style='background:#f8f8f8; min-width: 48px; min-height: 48px; padding: 12px; font-size: 28px;'></th>`;
+            for (let j = 0; j < 4; j++) {
+                html += `<th style='background:#eee; min-width: 48px; min-height: 48px; padding: 12px; font-size: 28px;'>${j+1}</th>`;
+            }
+            html += `</tr>`;
+            for (let i = 0; i < 9; i++) {
+                html += `<tr>`;
+                html += `<td style='background:#f8f8f8; min-width: 48px; min-height: 48px; padding: 12px; font-size: 28px;'>${i+1}</td>`;
+                for (let j = 0; j < 4; j++) {
+                    html += `<td style=\"background:${sectorBusy[i][j] ? '#e04a6a' : '#27ae60'};color:#fff;text-align:center;font-weight:bold;min-width:48px;min-height:48px;padding:12px;font-size:28px;\">${sectorMatrix[i][j]}</td>`;
+                }
+                html += `</tr>`;
+            }
+            html += `</table>`;
+            container.innerHTML = html;
+        }
+}
+
+// endi kerak emas
+// let currentRole = '';
+let allBatches = [];
+let currentPage = 1;
+let pageSize = 7;
+
+// ==================== FETCH WITH AUTH ====================
+async function fetchWithAuth(url, options) {
+    try {
+        const response = await fetch(url, options);
+        if (response.status === 401 || response.status === 403) {
+            window.location.href = '/login';
+            return null;
+        }
+        // Agar JSON emas, HTML qaytsa, xabar ko'rsatish
+        const contentType = response.headers.get('content-type') || '';
+        if (!contentType.includes('json')) {
+            showAlert && showAlert('batchesAlert', '❌ Ошибка: неверный ответ сервера или сессия завершена!', 'error');
+            return null;
+        }
+        return response;
+    } catch (err) {
+        showAlert && showAlert('batchesAlert', '❌ Ошибка: ' + err.message, 'error');
+        return null;
+    }
+}
+
+// Ro'yxat endpointlari: ustunli JSON (kalitlar bir marta) so'raladi va oddiy obyektlarga qaytariladi
+const COLUMNAR_TYPE = 'application/vnd.sklad.columnar+json';
+
+function fetchList(url) {
+    return fetchWithAuth(url, { headers: { 'Accept': COLUMNAR_TYPE } });
+}
+
+function fromColumnar(value) {
+    if (Array.isArray(value)) return value.map(fromColumnar);
+    if (!value || typeof value !== 'object') return value;
+    const keys = Object.keys(value);
+    if (keys.length === 2 && Array.isArray(value.columns) && Array.isArray(value.data)) {
+        const rows = value.data.length ? value.data[0].length : 0;
+        const items = [];
+        for (let i = 0; i < rows; i++) {
+            const item = {};
+            value.columns.forEach((column, c) => { item[column] = fromColumnar(value.data[c][i]); });
+            items.push(item);
+        }
+        return items;
+    }
+    const result = {};
+    keys.forEach(key => { result[key] = fromColumnar(value[key]); });
+    return result;
+}
+
+async function readList(response) {
+    const data = await response.json();
+    const contentType = response.headers.get('content-type') || '';
+    return contentType.includes(COLUMNAR_TYPE) ? fromColumnar(data) : data;
+}
+
+// ==================== INIT ====================
+window.addEventListener('load', async () => {
+    await loadUser();
+    await loadBatches();
+});
+
+document.addEventListener('DOMContentLoaded', () => {
+    const pageSizeSelect = document.getElementById('pageSizeSelect');
+    if (pageSizeSelect) {
+        pageSizeSelect.value = String(pageSize);
+        pageSizeSelect.addEventListener('change', () => {
+            const newSize = parseInt(pageSizeSelect.value, 10);
+            pageSize = Number.isNaN(newSize) ? 7 : newSize;
+            currentPage = 1;
+            if (searchMode) {
+                fetchAndRenderSearch();
+            } else {
+                renderBatchesPage();
+            }
+        });
+    }
+
+    const donePageSizeSelect = document.getElementById('donePageSizeSelect');
+    if (donePageSizeSelect) {
+        donePageSizeSelect.value = String(donePageSize);
+        donePageSizeSelect.addEventListener('change', () => {
+            const newSize = parseInt(donePageSizeSelect.value, 10);
+            donePageSize = Number.isNaN(newSize) ? 12 : newSize;
+            doneCurrentPage = 1;
+            renderDoneRequests(doneFilteredCache, 'Выполненных запросов нет');
+        });
+    }
+});
+
+// ==================== USER INFO ====================
+async function loadUser() {
+    try {
+        const response = await fetchWithAuth('/api/user');
+        if (!response) return;
+        const user = await response.json();
+
+        document.getElementById('username').textContent = user.username;
+        // document.getElementById('role').textContent = user.role === 'admin' ? '🔑 ADMIN' : '👁 KO\'RUVCHI';
+        // currentRole = user.role;
+
+        // Profile button opens profile modal directly
+        const profileBtn = document.getElementById('profileBtn');
+        profileBtn.addEventListener('click', () => {
+            showProfile(user);
+        });
+
+        document.addEventListener('click', (e) => {
+            // Modal yopish uchun overlay-ga bosish
+            if (e.target.id === 'profileModal') {
+                closeProfileModal();
+            }
+        });
+        // Password form submit
+        const passwordForm = document.getElementById('changePasswordForm');
+        if (passwordForm) {
+            passwordForm.addEventListener('submit', changePassword);
+        }
+
+        document.getElementById('addFormBtn').style.display = 'flex';
+        document.getElementById('addBatchForm').addEventListener('submit', addBatch);
+        // Modalni ochish va yopish
+        const adminSection = document.getElementById('adminSection');
+        const addFormBtn = document.getElementById('addFormBtn');
+        const closeAddBatchModal = document.getElementById('closeAddBatchModal');
+        addFormBtn.addEventListener('click', () => {
+            adminSection.classList.add('show');
+        });
+        // Modal va overlayni yopish funksiyasi
+        function closeAdminModal() {
+            adminSection.classList.remove('show');
+            const overlay = document.getElementById('overlay');
+            if (overlay) overlay.classList.remove('show');
+        }
+        if (closeAddBatchModal) {
+            closeAddBatchModal.onclick = closeAdminModal;
+        }
+        const overlay = document.getElementById('overlay');
+        if (overlay) {
+            overlay.addEventListener('click', closeAdminModal);
+        }
+        window.addEventListener('click', (e) => {
+            if (e.target === adminSection) {
+                adminSection.classList.remove('show');
+            }
+        });
+    } catch (error) {
+        console.error('User load error:', error);
+    }
+}
+
+// ==================== SHOW PROFILE ====================
+function showProfile(user) {
+    const modal = document.getElementById('profileModal');
+
+    if (!modal) {
+        console.error('Modal topilmadi!');
+        return;
+    }
+
+    // Fill user info
+    document.getElementById('userFullName').textContent = user.username;
+    document.getElementById('userEmail').textContent = 'user@sklad.uz';
+    document.getElementById('userFirstName').textContent = user.username.charAt(0).toUpperCase() + user.username.slice(1);
+    // document.getElementById('userLastName').textContent = user.role === 'admin' ? '🔑 ADMIN' : '👁 KO\'RUVCHI';
+
+    // Fetch activity
+    fetchActivity();
+
+    // Show modal
+    modal.classList.add('show');
+    console.log('Modal ochildi');
+}
+
+// ==================== FETCH ACTIVITY ====================
+async function fetchActivity() {
+    try {
+        const response = await fetchWithAuth('/api/user/activity');
+        if (!response) return;
+        const data = await response.json();
+
+        document.getElementById('lastLogin').textContent = data.last_active;
+        document.getElementById('totalBatches').textContent = data.total_batches;
+    } catch (error) {
+        console.error('Activity fetch error:', error);
+    }
+}
+
+function closeProfileModal() {
+    const modal = document.getElementById('profileModal');
+    modal.classList.remove('show');
+}
+
+// ==================== CHANGE PASSWORD ====================
+async function changePassword(e) {
+    e.preventDefault();
+
+    const currentPassword = document.getElementById('currentPassword').value;
+    const newPassword = document.getElementById('newPassword').value;
+    const confirmPassword = document.getElementById('confirmPassword').value;
+
+    // Validation
+    if (!currentPassword) {
+        showAlert('batchesAlert', '❌ Joriy parolni kiriting', 'error');
+        return;
+    }
+
+    if (newPassword.length < 5) {
+        showAlert('batchesAlert', '❌ Parol kamida 5 ta belgi bo\'lishi kerak', 'error');
+        return;
+    }
+
+    if (newPassword !== confirmPassword) {
+        showAlert('batchesAlert', '❌ Yangi parollar mos kelmaydi', 'error');
+        return;
+    }
+
+    if (currentPassword === newPassword) {
+        showAlert('batchesAlert', '❌ Yangi parol eski parol bilan bir xil bo\'lmasligi kerak', 'error');
+        return;
+    }
+
+    try {
+        const response = await fetch('/api/user/password', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                current_password: currentPassword,
+                new_password: newPassword
+            })
+        });
+
+        const result = await response.json();
+
+        if (response.ok) {
+            showAlert('batchesAlert', '✅ ' + result.message, 'success');
+            document.getElementById('changePasswordForm').reset();
+            setTimeout(() => {
+                closeProfileModal();
+            }, 2000);
+        } else {
+            showAlert('batchesAlert', '❌ ' + result.error, 'error');
+        }
+    } catch (error) {
+        showAlert('batchesAlert', '❌ Ошибка: ' + error.message, 'error');
+    }
+}
+
+// ==================== FORM TOGGLE ====================
+function setupFormToggle() {
+    // Endi kerak emas
+}
+
+// ==================== LOAD BATCHES ====================
+async function loadBatches() {
+    try {
+        const response = await fetchList('/api/batches');
+        if (!response) return;
+        if (!response.ok) {
+            const text = await response.text();
+            showAlert('batchesAlert', 'Ошибка: ' + text, 'error');
+            return;
+        }
+        allBatches = await readList(response);
+        window.allBatches = allBatches;
+        currentPage = 1;
+        renderBatchesPage();
+    } catch (error) {
+        showAlert('batchesAlert', 'Ошибка: ' + error.message, 'error');
+    }
+}
+
+// ==================== RENDER BATCHES ====================
+// ==================== PAGINATION & SEARCH STATE ====================
+let searchMode = false;
+let searchQuery = '';
+let searchTotal = 0;
+let searchResults = [];
+
+function renderBatchesPage(customBatches, customTotal) {
+    let batches, total;
+    if (searchMode && typeof customBatches !== 'undefined') {
+        batches = customBatches.filter(batch => (batch.quantity_sht || 0) > 0 || (batch.quantity_kg || 0) > 0);
+        total = typeof customTotal === 'number' ? customTotal : searchTotal;
+    } else if (Array.isArray(customBatches)) {
+        batches = customBatches.filter(batch => (batch.quantity_sht || 0) > 0 || (batch.quantity_kg || 0) > 0);
+        total = batches.length;
+    } else {
+        batches = allBatches.filter(batch => (batch.quantity_sht || 0) > 0 || (batch.quantity_kg || 0) > 0);
+        total = batches.length;
+    }
+    const container = document.getElementById('batchesList');
+    const emptyState = document.getElementById('emptyState');
+    const pagination = document.getElementById('pagination');
+    // Umumiy sht va kg hisoblash
+    let totalSht = 0;
+    let totalKg = 0;
+    batches.forEach(batch => {
+        totalSht += batch.quantity_sht || 0;
+        totalKg += batch.quantity_kg || 0;
+    });
+    // Sarlavha yoniga chiqarish
+    let totalInfo = document.getElementById('totalInfo');
+    const header = Array.from(document.querySelectorAll('.section h2')).find(h2 => h2.textContent.includes("Список партий"));
+    if (header) {
+        if (!totalInfo) {
+            totalInfo = document.createElement('span');
+            totalInfo.id = 'totalInfo';
+            totalInfo.style.float = 'right';
+            totalInfo.style.fontSize = '16px';
+            totalInfo.style.fontWeight = 'normal';
+            totalInfo.style.background = '#fff';
+            totalInfo.style.border = '1px solid #dedede';
+            totalInfo.style.borderRadius = '6px';
+            totalInfo.style.padding = '4px 18px';
+            totalInfo.style.marginRight = '10px';
+            header.appendChild(totalInfo);
+        }
+        totalInfo.innerHTML = `<b>Общее количество:</b> ${totalSht} шт / ${totalKg} кг`;
+    }
+    if (batches.length === 0) {
+        container.innerHTML = '';
+        emptyState.style.display = 'block';
+        totalInfo.innerHTML = `<b>Общее количество:</b> 0 шт / 0 кг`;
+        pagination.innerHTML = '';
+        return;
+    }
+    emptyState.style.display = 'none';
+    // Sahifalash
+    const totalPages = Math.ceil(total / pageSize);
+    if (currentPage > totalPages) currentPage = totalPages;
+    if (currentPage < 1) currentPage = 1;
+    // Agar searchMode bo'lsa, backenddan kelgan natijani ko'rsatamiz, aks holda localdan bo'lamiz
+    let pageBatches = batches;
+    if (!searchMode) {
+        const start = (currentPage - 1) * pageSize;
+        const end = start + pageSize;
+        pageBatches = batches.slice(start, end);
+    }
+    container.innerHTML = pageBatches.map(batch => {
+        const maxQty = batch.quantity_sht || 0;
+        const maxKg = batch.quantity_kg || 0;
+        const comment = batch.comment ? `<div class='batch-comment'><strong>Комментарий:</strong> ${batch.comment}</div>` : '';
+        return `
+        <div class="batch-item" data-id="${batch.id}">
+            <div class="batch-content">
+                <div class="batch-title">${batch.product_name}</div>
+                <div class="batch-meta">
+                    <span><strong>Партия:</strong> ${batch.batch_code}</span>
+                    <span><strong>Количество (шт):</strong> ${maxQty}</span>
+                    <span><strong>Количество (кг):</strong> ${maxKg}</span>
+                    <span><strong>Ячейка:</strong> ${batch.location}</span>
+                </div>
+                ${comment}
+            </div>
+            <div class="batch-actions">
+                <button class="btn-slide" onclick="openRemoveModal(${batch.id}, '${batch.product_name.replace(/'/g, '\'')}', '${batch.batch_code}', ${maxQty}, ${maxKg})"><svg width='20' height='20' viewBox='0 0 24 24' fill='none' xmlns='http://www.w3.org/2000/svg' style='vertical-align:middle;'><rect width='24' height='24' fill='none'/><path d='M7 12h10M13 8l4 4-4 4' stroke='#fff' stroke-width='2' stroke-linecap='round' stroke-linejoin='round'/></svg></button>
+            </div>
+        </div>
+        `;
+    }).join('');
+    // Sahifa tugmalari
+    let pagHtml = '';
+    if (totalPages > 1) {
+        // Pagination in groups of 10
+        let groupSize = 10;
+        let currentGroup = Math.floor((currentPage - 1) / groupSize);
+        let startPage = currentGroup * groupSize + 1;
+        let endPage = Math.min(startPage + groupSize - 1, totalPages);
+        // Left arrow
+        if (startPage > 1) {
+            pagHtml += `<button onclick="gotoPage(${startPage - 1}, ${searchMode})" style="padding: 4px 10px; margin: 0 2px; border-radius: 4px; border: 1px solid #dedede; background: #fff; color: #333; font-weight: normal; cursor:pointer;">&#8592;</button>`;
+        }
+        // Page buttons
+        for (let i = startPage; i <= endPage; i++) {
+            pagHtml += `<button onclick="gotoPage(${i}, ${searchMode})" style="padding: 4px 10px; margin: 0 2px; border-radius: 4px; border: 1px solid #dedede; background: ${i === currentPage ? '#e04a6a' : '#fff'}; color: ${i === currentPage ? '#fff' : '#333'}; font-weight: ${i === currentPage ? 'bold' : 'normal'}; cursor:pointer;">${i}</button>`;
+        }
+        // Right arrow
+        if (endPage < totalPages) {
+            pagHtml += `<button onclick="gotoPage(${endPage + 1}, ${searchMode})" style="padding: 4px 10px; margin: 0 2px; border-radius: 4px; border: 1px solid #dedede; background: #fff; color: #333; font-weight: normal; cursor:pointer;">&#8594;</button>`;
+        }
+    }
+    pagination.innerHTML = pagHtml;
+}
+
+function gotoPage(page) {
+    currentPage = page;
+    renderBatchesPage();
+}
+
+// ==================== ADD BATCH ====================
+async function addBatch(e) {
+    e.preventDefault();
+
+    const data = {
+        product_name: document.getElementById('productName').value,
+        batch_code: document.getElementById('batchCode').value,
+        quantity_sht: parseInt(document.getElementById('quantity_sht').value) || 0,
+        quantity_kg: parseFloat(document.getElementById('quantity_kg').value) || 0,
+        location: document.getElementById('location').value,
+        comment: document.getElementById('comment').value || ''
+    };
+
+    try {
+        const response = await fetchWithAuth('/api/batches', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(data)
+        });
+        if (!response) return;
+        let result = null;
+        try {
+            result = await response.json();
+        } catch (jsonErr) {
+            // JSON emas (masalan, HTML) bo'lsa, foydalanuvchiga xato yozuvini ko'rsatamiz
+            showAlert('addAlert', '❌ Ошибка: неверный ответ сервера или сессия завершена!', 'error');
+            return;
+        }
+        if (response.ok) {
+            showAlert('addAlert', '✅ Партия успешно добавлена!', 'success');
+            document.getElementById('addBatchForm').reset();
+            document.getElementById('adminSection').classList.remove('show');
+            document.getElementById('overlay').classList.remove('show');
+                // Katakni band qilish (qizil qilish)
+                setCellBusy(data.location);
+            setTimeout(loadBatches, 500);
+        } else {
+            showAlert('addAlert', '❌ Ошибка: ' + result.error, 'error');
+        }
+    } catch (error) {
+        showAlert('addAlert', '❌ Ошибка: ' + error.message, 'error');
+    }
+}
+
+// ==================== REMOVE BATCH (SLIDE) ====================
+// Modal orqali chiqarish
+let removeModalBatchId = null;
+let removeModalMaxQty = 1;
+window.removeModalMaxKg = 0;
+function openRemoveModal(batchId, productName, batchCode, maxQty, maxKg) {
+    removeModalBatchId = batchId;
+    removeModalMaxQty = maxQty;
+    window.removeModalMaxKg = maxKg;
+    document.getElementById('removeModalInfo').innerHTML = `<b>${productName}</b> (<b>Код:</b> ${batchCode})<br><b>В наличии:</b> ${maxQty} шт<br><b>В наличии:</b> ${maxKg} кг`;
+    const qtyInput = document.getElementById('removeQtyInput');
+    qtyInput.value = '';
+    qtyInput.max = maxQty;
+    qtyInput.min = 0;
+    const kgInput = document.getElementById('removeKgInput');
+    kgInput.value = '';
+    kgInput.max = maxKg;
+    kgInput.min = 0;
+    const overlay = document.getElementById('overlay');
+    if (overlay) overlay.classList.add('show');
+    document.getElementById('removeModal').classList.add('show');
+}
+document.getElementById('closeRemoveModal').onclick = function() {
+    document.getElementById('removeModal').classList.remove('show');
+    const overlay = document.getElementById('overlay');
+    if (overlay) overlay.classList.remove('show');
+};
+// Overlay and modal close logic for remove modal
+const overlay = document.getElementById('overlay');
+if (overlay) {
+    overlay.addEventListener('click', function() {
+        document.getElementById('removeModal').classList.remove('show');
+        overlay.classList.remove('show');
+    });
+}
+window.addEventListener('click', function(e) {
+    const modal = document.getElementById('removeModal');
+    if (e.target === modal) {
+        modal.classList.remove('show');
+        const overlay = document.getElementById('overlay');
+        if (overlay) overlay.classList.remove('show');
+    }
+});
+document.getElementById('removeForm').onsubmit = async function(e) {
+    e.preventDefault();
+    const qtySht = parseInt(document.getElementById('removeQtyInput').value) || 0;
+    const qtyKg = parseFloat(document.getElementById('removeKgInput').value) || 0;
+    if (qtySht < 0 || qtySht > removeModalMaxQty) {
+        showAlert('batchesAlert', `❌ Введите корректное количество (0-${removeModalMaxQty})`, 'error');
+        return;
+    }
+    if (qtyKg < 0 || qtyKg > window.removeModalMaxKg) {
+        showAlert('batchesAlert', `❌ Введите корректный вес (0-${window.removeModalMaxKg})`, 'error');
+        return;
+    }
+    if (qtySht === 0 && qtyKg === 0) {
+        showAlert('batchesAlert', '❌ Введите хотя бы одно значение', 'error');
+        return;
+    }
+    const item = document.querySelector(`[data-id="${removeModalBatchId}"]`);
+    item.classList.add('sliding');
+    document.getElementById('removeModal').classList.remove('show');
+    const overlay = document.getElementById('overlay');
+    if (overlay) overlay.classList.remove('show');
+    setTimeout(async () => {
+        try {
+            const response = await fetchWithAuth(`/api/batches/${removeModalBatchId}/remove`, {
+                method: 'PUT',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ quantity_sht: qtySht, quantity_kg: qtyKg })
+            });
+            if (!response) {
+                item.classList.remove('sliding');
+                return;
+            }
+            if (response.ok) {
+                const result = await response.json();
+                showAlert('batchesAlert', '✅ Партия списана', 'success');
+
+                // If logout is required, redirect to login
+                if (result.logout) {
+                    setTimeout(() => {
+                        window.location.href = '/login';
+                    }, 1500);
+                    return;
+                }
+
+                    // Agar butunlay chiqarilsa, katakni bo'shatish (yashil qilish)
+                    if ((qtySht === removeModalMaxQty || removeModalMaxQty === 0) && (qtyKg === window.removeModalMaxKg || window.removeModalMaxKg === 0)) {
+                        // batch obyektidan location olish kerak, uni backenddan qaytarish yoki oldindan saqlash mumkin
+                        // Bu yerda soddaroq variant: batch obyektidan location olish uchun allBatches dan topamiz
+                        const batch = allBatches.find(b => b.id === removeModalBatchId);
+                        if (batch && batch.location) {
+                            setCellFree(batch.location);
+                        }
+                    }
+                setTimeout(loadBatches, 500);
+            } else {
+                let result = {};
+                try {
+                    result = await response.json();
+                } catch (err) {}
+                showAlert('batchesAlert', '❌ Ошибка! ' + (result.error || ''), 'error');
+                item.classList.remove('sliding');
+            }
+        } catch (error) {
+            showAlert('batchesAlert', '❌ Ошибка: ' + error.message, 'error');
+            item.classList.remove('sliding');
+        }
+    }, 300);
+};
+
+// ==================== SEARCH ====================
+document.getElementById('searchInput').addEventListener('input', async (e) => {
+    const query = e.target.value.trim();
+    searchQuery = query;
+    if (!query) {
+        searchMode = false;
+        currentPage = 1;
+        renderBatchesPage();
+        return;
+    }
+    searchMode = true;
+    currentPage = 1;
+    await fetchAndRenderSearch();
+});
+
+// Search on Enter key
+document.getElementById('searchInput').addEventListener('keypress', async (e) => {
+    if (e.key === 'Enter') {
+        const query = e.target.value.trim();
+        if (query) {
+            searchQuery = query;
+            searchMode = true;
+            currentPage = 1;
+            await fetchAndRenderSearch();
+        }
+    }
+});
+
+async function fetchAndRenderSearch() {
+    const response = await fetchList(`/api/batches/search?q=${encodeURIComponent(searchQuery)}&page=${currentPage}&page_size=${pageSize}`);
+    if (!response) return;
+    const data = await readList(response);
+    searchResults = data.results || [];
+    searchTotal = data.total || 0;
+    renderBatchesPage(searchResults, searchTotal);
+}
+
+function gotoPage(page, isSearch) {
+    currentPage = page;
+    if (searchMode) {
+        fetchAndRenderSearch();
+    } else {
+        renderBatchesPage();
+    }
+}
+
+// ==================== ARCHIVE MODAL ====================
+document.getElementById('archiveBtn').addEventListener('click', function() {
+    const archiveModal = document.getElementById('archiveModal');
+    archiveModal.classList.add('show');
+    const startInput = document.getElementById('archiveStartDate');
+    const endInput = document.getElementById('archiveEndDate');
+    if (startInput) startInput.value = '';
+    if (endInput) endInput.value = '';
+});
+
+
+document.getElementById('closeArchiveModal').addEventListener('click', function() {
+    document.getElementById('archiveModal').classList.remove('show');
+});
+
+window.addEventListener('click', function(e) {
+    const archiveModal = document.getElementById('archiveModal');
+    if (e.target === archiveModal) {
+        archiveModal.classList.remove('show');
+    }
+});
+
+// ==================== REQUESTS MODALS ====================
+document.getElementById('requestBtn').addEventListener('click', function() {
+    const form = document.getElementById('requestForm');
+    if (form) form.reset();
+    const productNameInput = document.getElementById('requestProductName');
+    if (productNameInput) productNameInput.value = '';
+    const batchInfo = document.getElementById('requestBatchInfo');
+    if (batchInfo) batchInfo.textContent = '';
+    document.getElementById('requestModal').classList.add('show');
+    const overlay = document.getElementById('overlay');
+    if (overlay) overlay.classList.add('show');
+});
+document.getElementById('closeRequestModal').addEventListener('click', function() {
+    const form = document.getElementById('requestForm');
+    if (form) form.reset();
+    const productNameInput = document.getElementById('requestProductName');
+    if (productNameInput) productNameInput.value = '';
+    const batchInfo = document.getElementById('requestBatchInfo');
+    if (batchInfo) batchInfo.textContent = '';
+    document.getElementById('requestModal').classList.remove('show');
+    const overlay = document.getElementById('overlay');
+    if (overlay) overlay.classList.remove('show');
+});
+
+document.getElementById('requestsListBtn').addEventListener('click', async function() {
+    document.getElementById('requestsListModal').classList.add('show');
+    const overlay = document.getElementById('overlay');
+    if (overlay) overlay.classList.add('show');
+    await loadRequests();
+});
+document.getElementById('closeRequestsListModal').addEventListener('click', function() {
+    document.getElementById('requestsListModal').classList.remove('show');
+    const overlay = document.getElementById('overlay');
+    if (overlay) overlay.classList.remove('show');
+});
+
+const requestsListPdfBtn = document.getElementById('requestsListPdfBtn');
+if (requestsListPdfBtn) {
+    requestsListPdfBtn.addEventListener('click', async function() {
+        await downloadRequestsPdf();
+    });
+}
+
+document.getElementById('requestsDoneBtn').addEventListener('click', async function() {
+    document.getElementById('requestsDoneModal').classList.add('show');
+    const overlay = document.getElementById('overlay');
+    if (overlay) overlay.classList.add('show');
+    await loadDoneRequests();
+});
+document.getElementById('closeRequestsDoneModal').addEventListener('click', function() {
+    document.getElementById('requestsDoneModal').classList.remove('show');
+    const overlay = document.getElementById('overlay');
+    if (overlay) overlay.classList.remove('show');
+});
+
+const doneBatchFilterInput = document.getElementById('requestsDoneBatchFilter');
+if (doneBatchFilterInput) {
+    doneBatchFilterInput.addEventListener('input', function() {
+        applyDoneRequestsFilter();
+    });
+}
+
+// Overlay close for request modals
+const overlayEl = document.getElementById('overlay');
+if (overlayEl) {
+    overlayEl.addEventListener('click', function() {
+        const form = document.getElementById('requestForm');
+        if (form) form.reset();
+        const productNameInput = document.getElementById('requestProductName');
+        if (productNameInput) productNameInput.value = '';
+        const batchInfo = document.getElementById('requestBatchInfo');
+        if (batchInfo) batchInfo.textContent = '';
+        document.getElementById('requestModal').classList.remove('show');
+        document.getElementById('requestsListModal').classList.remove('show');
+        document.getElementById('requestsDoneModal').classList.remove('show');
+    });
+}
+
+// Submit request
+document.getElementById('requestForm').addEventListener('submit', async function(e) {
+    e.preventDefault();
+    const productName = document.getElementById('requestProductName').value.trim();
+    const batchCode = document.getElementById('requestBatchCode').value.trim();
+    const qtySht = parseInt(document.getElementById('requestQtySht').value) || 0;
+    const qtyKg = parseFloat(document.getElementById('requestQtyKg').value) || 0;
+    const comment = document.getElementById('requestComment').value.trim();
+
+    if (!batchCode) {
+        showAlert('requestAlert', '❌ Введите код партии', 'error');
+        return;
+    }
+    if (!productName) {
+        showAlert('requestAlert', '❌ Партия не найдена. Проверьте код', 'error');
+        return;
+    }
+    if (qtySht === 0 && qtyKg === 0) {
+        showAlert('requestAlert', '❌ Введите количество (шт или кг)', 'error');
+        return;
+    }
+
+    try {
+        const response = await fetchWithAuth('/api/requests', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                product_name: productName,
+                batch_code: batchCode,
+                quantity_sht: qtySht,
+                quantity_kg: qtyKg,
+                comment
+            })
+        });
+        if (!response) return;
+        const data = await response.json();
+        if (response.ok) {
+            showAlert('requestAlert', '✅ Запрос отправлен', 'success');
+            document.getElementById('requestForm').reset();
+            setTimeout(() => {
+                document.getElementById('requestModal').classList.remove('show');
+                const overlay = document.getElementById('overlay');
+                if (overlay) overlay.classList.remove('show');
+            }, 300);
+        } else {
+            showAlert('requestAlert', '❌ Ошибка: ' + (data.error || ''), 'error');
+        }
+    } catch (err) {
+        showAlert('requestAlert', '❌ Ошибка: ' + err.message, 'error');
+    }
+});
+
+// Auto-fill by batch code
+let batchLookupTimer = null;
+const batchCodeInput = document.getElementById('requestBatchCode');
+const batchInfo = document.getElementById('requestBatchInfo');
+const productNameInput = document.getElementById('requestProductName');
+batchCodeInput.addEventListener('input', function() {
+    const code = batchCodeInput.value.trim();
+    if (batchLookupTimer) clearTimeout(batchLookupTimer);
+    if (!code) {
+        batchInfo.textContent = '';
+        productNameInput.value = '';
+        return;
+    }
+    batchLookupTimer = setTimeout(async () => {
+        try {
+            const response = await fetchWithAuth(`/api/batches/by-code?code=${encodeURIComponent(code)}`);
+            if (!response) return;
+            const data = await response.json();
+            if (response.ok) {
+                productNameInput.value = data.product_name || '';
+                const sht = data.available_sht ?? data.quantity_sht ?? 0;
+                const kg = data.available_kg ?? data.quantity_kg ?? 0;
+                batchInfo.textContent = `Свободно: ${sht} шт / ${kg} кг`;
+                batchInfo.style.color = '#2e7d32';
+            } else {
+                batchInfo.textContent = data.error || 'Партия не найдена';
+                batchInfo.style.color = '#c0392b';
+                productNameInput.value = '';
+            }
+        } catch (err) {
+            batchInfo.textContent = 'Ошибка поиска';
+            batchInfo.style.color = '#c0392b';
+            productNameInput.value = '';
+        }
+    }, 400);
+});
+
+let requestsCache = [];
+
+function renderRequestsList(items, includeActions, emptyMessage) {
+    const container = document.getElementById('requestsList');
+    if (!items || items.length === 0) {
+        container.innerHTML = `<p style="color:#999;">${emptyMessage || 'Запросов нет'}</p>`;
+        return;
+    }
+                let html = '<table style="width:100%; border-collapse: separate; border-spacing: 0 0; font-size: 18px;">';
+                html += '<tr style="border-bottom:1px solid #ddd;">'
+                            + '<th style="text-align:center; padding:8px;">Товар</th>'
+                            + '<th style="text-align:center; padding:8px;">Партия</th>'
+                        + '<th style="text-align:center; padding:8px;">Ячейка</th>'
+                            + '<th style="text-align:center; padding:8px;">Шт</th>'
+                            + '<th style="text-align:center; padding:8px 16px 8px 8px;">Кг</th>'
+                            + '<th style="text-align:center; padding:8px 8px 8px 16px;">Комментарий</th>'
+                            + '<th style="text-align:center; padding:8px;">Статус</th>'
+                            + '<th style="text-align:center; padding:8px;">Дата</th>'
+                            + (includeActions ? '<th style="text-align:center; padding:8px;">Готово</th>' : '')
+                            + (includeActions ? '<th style="text-align:center; padding:8px;">Не выполнено</th>' : '')
+                            + '</tr>';
+    items.forEach(r => {
+        html += `<tr style="border-bottom:1px solid #eee;">`
+             + `<td style="padding:8px; text-align:center;">${r.product_name || ''}</td>`
+             + `<td style="padding:8px; text-align:center;">${r.batch_code || '-'}</td>`
+             + `<td style="padding:8px; text-align:center;">${r.location || '-'}</td>`
+             + `<td style="padding:8px; text-align:center;">${r.quantity_sht || 0}</td>`
+             + `<td style="padding:8px 16px 8px 8px; text-align:center;">${(r.quantity_kg || 0).toFixed ? (r.quantity_kg || 0).toFixed(0) : r.quantity_kg}</td>`
+             + `<td style="padding:8px 8px 8px 16px; text-align:center;">${r.comment || ''}</td>`
+             + `<td style="padding:8px; text-align:center;">Новый</td>`
+             + `<td style="padding:8px; text-align:center;">${r.created_at || ''}</td>`
+             + (includeActions ? `<td style="padding:8px; text-align:center;"><button data-done-id="${r.id}" style="background:#2e7d32;color:#fff;border:none;border-radius:6px;padding:6px 10px;cursor:pointer;">✓</button></td>` : '')
+             + (includeActions ? `<td style="padding:8px; text-align:center;"><button data-failed-id="${r.id}" style="background:#d32f2f;color:#fff;border:none;border-radius:6px;padding:6px 10px;cursor:pointer;">✕</button></td>` : '')
+             + `</tr>`;
+    });
+    html += '</table>';
+    container.innerHTML = html;
+
+    if (includeActions) {
+        container.querySelectorAll('[data-done-id]').forEach(btn => {
+            btn.addEventListener('click', async () => {
+                const id = btn.getAttribute('data-done-id');
+                const res = await fetchWithAuth(`/api/requests/${id}/done`, { method: 'PUT' });
+                if (!res) return;
+                if (res.ok) {
+                    await loadRequests();
+                }
+            });
+        });
+        container.querySelectorAll('[data-failed-id]').forEach(btn => {
+            btn.addEventListener('click', async () => {
+                const id = btn.getAttribute('data-failed-id');
+                const res = await fetchWithAuth(`/api/requests/${id}/failed`, { method: 'PUT' });
+                if (!res) return;
+                if (res.ok) {
+                    await loadRequests();
+                }
+            });
+        });
+    }
+}
+
+function downloadRequestsPdf() {
+    const a = document.createElement('a');
+    a.href = '/api/requests/export?format=pdf';
+    document.body.appendChild(a);
+    a.click();
+    a.remove();
+}
+
+async function loadRequests() {
+    const container = document.getElementById('requestsList');
+    container.innerHTML = '<p style="color:#999;">Загрузка...</p>';
+    try {
+        const response = await fetchList('/api/requests?status=NEW');
+        if (!response) return;
+        const items = await readList(response);
+        requestsCache = Array.isArray(items) ? items : [];
+        renderRequestsList(requestsCache, true, 'Запросов нет');
+    } catch (err) {
+        container.innerHTML = '<p style="color:red;">Ошибка загрузки</p>';
+    }
+}
+
+let doneRequestsCache = [];
+let doneFilteredCache = [];
+let doneCurrentPage = 1;
+let donePageSize = 12;
+
+function renderDoneRequestsPagination(total) {
+    const pagination = document.getElementById('requestsDonePagination');
+    if (!pagination) return;
+    const totalPages = Math.ceil(total / donePageSize);
+    if (totalPages <= 1) {
+        pagination.innerHTML = '';
+        return;
+    }
+    let pagHtml = '';
+    const groupSize = 10;
+    const currentGroup = Math.floor((doneCurrentPage - 1) / groupSize);
+    const startPage = currentGroup * groupSize + 1;
+    const endPage = Math.min(startPage + groupSize - 1, totalPages);
+    if (startPage > 1) {
+        pagHtml += `<button onclick="gotoDonePage(${startPage - 1})" style="padding: 4px 10px; margin: 0 2px; border-radius: 4px; border: 1px solid #dedede; background: #fff; color: #333; cursor:pointer;">&#8592;</button>`;
+    }
+    for (let i = startPage; i <= endPage; i++) {
+        pagHtml += `<button onclick="gotoDonePage(${i})" style="padding: 4px 10px; margin: 0 2px; border-radius: 4px; border: 1px solid #dedede; background: ${i === doneCurrentPage ? '#e04a6a' : '#fff'}; color: ${i === doneCurrentPage ? '#fff' : '#333'}; font-weight: ${i === doneCurrentPage ? 'bold' : 'normal'}; cursor:pointer;">${i}</button>`;
+    }
+    if (endPage < totalPages) {
+        pagHtml += `<button onclick="gotoDonePage(${endPage + 1})" style="padding: 4px 10px; margin: 0 2px; border-radius: 4px; border: 1px solid #dedede; background: #fff; color: #333; cursor:pointer;">&#8594;</button>`;
+    }
+    pagination.innerHTML = pagHtml;
+}
+
+function gotoDonePage(page) {
+    doneCurrentPage = page;
+    renderDoneRequests(doneFilteredCache, 'Выполненных запросов нет');
+}
+
+function renderDoneRequests(items, emptyMessage) {
+    const container = document.getElementById('requestsDoneList');
+    if (!items || items.length === 0) {
+        container.innerHTML = `<p style="color:#999;">${emptyMessage || 'Выполненных запросов нет'}</p>`;
+        renderDoneRequestsPagination(0);
+        return;
+    }
+    const total = items.length;
+    const totalPages = Math.ceil(total / donePageSize);
+    if (doneCurrentPage > totalPages) doneCurrentPage = totalPages || 1;
+    if (doneCurrentPage < 1) doneCurrentPage = 1;
+    const start = (doneCurrentPage - 1) * donePageSize;
+    const end = start + donePageSize;
+    const pageItems = items.slice(start, end);
+                let html = '<table style="width:100%; border-collapse: separate; border-spacing: 0 0; font-size: 18px;">';
+                        html += '<tr style="border-bottom:1px solid #ddd;">'
+                                + '<th style="text-align:center; padding:8px; width:40px;">№</th>'
+                                + '<th style="text-align:center; padding:8px;">Товар</th>'
+                                + '<th style="text-align:center; padding:8px;">Партия</th>'
+                                + '<th style="text-align:center; padding:8px;">Ячейка</th>'
+                            + '<th style="text-align:center; padding:8px;">Шт</th>'
+                            + '<th style="text-align:center; padding:8px 16px 8px 8px;">Кг</th>'
+                            + '<th style="text-align:center; padding:8px 8px 8px 16px;">Комментарий</th>'
+                            + '<th style="text-align:center; padding:8px;">Статус</th>'
+                            + '<th style="text-align:center; padding:8px;">Дата</th>'
+                            + '</tr>';
+    pageItems.forEach((r, index) => {
+        const statusLabel = r.status === 'FAILED' ? '✕ Не выполнен' : '✓ Выполнен';
+        const statusColor = r.status === 'FAILED' ? '#d32f2f' : '#2e7d32';
+        const rowNumber = total - (start + index);
+         html += `<tr style="border-bottom:1px solid #eee;">`
+             + `<td style="padding:8px; text-align:center;">${rowNumber}</td>`
+             + `<td style="padding:8px; text-align:center;">${r.product_name || ''}</td>`
+             + `<td style="padding:8px; text-align:center;">${r.batch_code || '-'}</td>`
+             + `<td style="padding:8px; text-align:center;">${r.location || '-'}</td>`
+             + `<td style="padding:8px; text-align:center;">${r.quantity_sht || 0}</td>`
+             + `<td style="padding:8px 16px 8px 8px; text-align:center;">${(r.quantity_kg || 0).toFixed ? (r.quantity_kg || 0).toFixed(0) : r.quantity_kg}</td>`
+             + `<td style="padding:8px 8px 8px 16px; text-align:center;">${r.comment || ''}</td>`
+             + `<td style="padding:8px; color:${statusColor}; font-weight:600; text-align:center;">${statusLabel}</td>`
+             + `<td style="padding:8px; text-align:center;">${r.created_at || ''}</td>`
+             + `</tr>`;
+    });
+    html += '</table>';
+    container.innerHTML = html;
+    renderDoneRequestsPagination(total);
+}
+
+function applyDoneRequestsFilter() {
+    const filterInput = document.getElementById('requestsDoneBatchFilter');
+    const term = (filterInput ? filterInput.value : '').trim().toLowerCase();
+    if (!term) {
+        doneFilteredCache = doneRequestsCache.slice();
+        doneCurrentPage = 1;
+        renderDoneRequests(doneFilteredCache, 'Выполненных запросов нет');
+        return;
+    }
+    doneFilteredCache = doneRequestsCache.filter(r => (r.batch_code || '').toLowerCase().includes(term));
+    doneCurrentPage = 1;
+    renderDoneRequests(doneFilteredCache, 'Ничего не найдено');
+}
+
+async function loadDoneRequests() {
+    const container = document.getElementById('requestsDoneList');
+    container.innerHTML = '<p style="color:#999;">Загрузка...</p>';
+    try {
+        const response = await fetchList('/api/requests?status=COMPLETED');
+        if (!response) return;
+        const items = await readList(response);
+        doneRequestsCache = Array.isArray(items) ? items : [];
+        doneFilteredCache = doneRequestsCache.slice();
+        doneCurrentPage = 1;
+        applyDoneRequestsFilter();
+    } catch (err) {
+        container.innerHTML = '<p style="color:red;">Ошибка загрузки</p>';
+    }
+}
+
+function populateYears() {
+    // No longer needed - using input type="month" instead
+}
+
+
+document.getElementById('archiveFilterBtn').addEventListener('click', async function() {
+    const startDate = document.getElementById('archiveStartDate').value;
+    const endDate = document.getElementById('archiveEndDate').value;
+    const searchTerm = document.getElementById('archiveSearch').value.trim().toLowerCase();
+    try {
+        const params = new URLSearchParams();
+        if (startDate) params.append('start_date', startDate);
+        if (endDate) params.append('end_date', endDate);
+
+        const response = await fetchList(`/api/archive?${params.toString()}`);
+        if (!response) {
+            document.getElementById('archiveResult').innerHTML = '<p style="color:#999;">Данные архива не найдены</p>';
+            return;
+        }
+
+        const data = await readList(response);
+        renderArchiveResult(data, searchTerm);
+    } catch (error) {
+        document.getElementById('archiveResult').innerHTML = '<p style="color:red;">Ошибка: ' + error.message + '</p>';
+    }
+});
+
+document.getElementById('archiveExportBtn').addEventListener('click', async function() {
+    const button = this;
+    const startDate = document.getElementById('archiveStartDate').value;
+    const endDate = document.getElementById('archiveEndDate').value;
+    const searchTerm = document.getElementById('archiveSearch').value.trim();
+
+    // Export fonda tayyorlanadi: ish yaratiladi, holati so'raladi, tayyor fayl yuklab olinadi
+    const label = button.textContent;
+    button.disabled = true;
+    try {
+        const response = await fetchWithAuth('/api/exports', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ start_date: startDate || null, end_date: endDate || null, search: searchTerm || null })
+        });
+        if (!response) return;
+        let job = await response.json();
+        if (!response.ok) {
+            showAlert('batchesAlert', '❌ ' + (job.error || 'Не удалось скачать Excel'), 'error');
+            return;
+        }
+        while (job.status === 'PENDING' || job.status === 'RUNNING') {
+            button.textContent = `Excel ${job.progress || 0}%`;
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            const poll = await fetchWithAuth(`/api/exports/${job.id}`);
+            if (!poll) return;
+            job = await poll.json();
+            if (!poll.ok) {
+                showAlert('batchesAlert', '❌ ' + (job.error || 'Не удалось скачать Excel'), 'error');
+                return;
+            }
+        }
+        if (job.status !== 'DONE') {
+            showAlert('batchesAlert', '❌ ' + (job.error || 'Не удалось скачать Excel'), 'error');
+            return;
+        }
+        const a = document.createElement('a');
+        a.href = job.download_url;
+        document.body.appendChild(a);
+        a.click();
+        a.remove();
+    } catch (error) {
+        showAlert('batchesAlert', '❌ Ошибка: ' + error.message, 'error');
+    } finally {
+        button.textContent = label;
+        button.disabled = false;
+    }
+});
+
+function renderArchiveResult(data, searchTerm = '') {
+    const result = document.getElementById('archiveResult');
+
+    if (!data.incoming || !data.outgoing || (data.incoming.length === 0 && data.outgoing.length === 0)) {
+        result.innerHTML = '<p style="color:#999;">📭 За этот период данных нет</p>';
+        return;
+    }
+
+    function matchesSearch(item) {
+        if (!searchTerm) return true;
+        const code = (item.batch_code || '').toLowerCase();
+        const name = (item.product_name || '').toLowerCase();
+        return code.includes(searchTerm) || name.includes(searchTerm);
+    }
+
+    // Group by batch_code and sum quantities
+    function groupByBatchCode(items) {
+        const grouped = {};
+        items.filter(matchesSearch).forEach(item => {
+            const key = item.batch_code;
+            if (!grouped[key]) {
+                grouped[key] = {
+                    product_name: item.product_name,
+                    batch_code: item.batch_code,
+                    quantity_sht: 0,
+                    quantity_kg: 0
+                };
+            }
+            grouped[key].quantity_sht += (item.quantity_sht || 0);
+            grouped[key].quantity_kg += (item.quantity_kg || 0);
+        });
+        return Object.values(grouped);
+    }
+
+    const incomingGrouped = groupByBatchCode(data.incoming || []);
+    const outgoingGrouped = groupByBatchCode(data.outgoing || []);
+
+    let html = '<div style="display: grid; grid-template-columns: 1fr 1fr; gap: 20px;">';
+
+    // Prixod (Kirim)
+    html += '<div style="border: 2px solid #27ae60; border-radius: 8px; padding: 15px; background: #f0fdf4;">';
+    html += '<h3 style="color: #27ae60; margin-top: 0;">📥 Приход</h3>';
+    if (incomingGrouped.length > 0) {
+        html += '<div style="max-height: 430px; overflow-y: auto;">';
+        html += '<table style="width: 100%; border-collapse: collapse; font-size: 15px;">';
+        html += '<tr style="border-bottom: 1px solid #ddd;"><th style="text-align: left; padding: 8px;">Товар</th><th style="text-align: left; padding: 8px;">Партия</th><th style="text-align: right; padding: 8px;">Шт</th><th style="text-align: right; padding: 8px;">Кг</th></tr>';
+        let totalSht = 0, totalKg = 0;
+        incomingGrouped.forEach(item => {
+            const sht = item.quantity_sht || 0;
+            const kg = item.quantity_kg || 0;
+            totalSht += sht;
+            totalKg += kg;
+            html += `<tr style="border-bottom: 1px solid #eee;"><td style="padding: 8px;">${item.product_name}</td><td style="padding: 8px;">${item.batch_code}</td><td style="text-align: right; padding: 8px;">${sht}</td><td style="text-align: right; padding: 8px;">${kg.toFixed(0)}</td></tr>`;
+        });
+        html += `<tr style="background: #e8f5e9; font-weight: bold;"><td style="padding: 10px;">Итого:</td><td style="padding: 10px;"></td><td style="text-align: right; padding: 10px;">${totalSht}</td><td style="text-align: right; padding: 10px;">${totalKg.toFixed(0)}</td></tr>`;
+        html += '</table>';
+        html += '</div>';
+    } else {
+        html += '<p style="color: #999; margin: 10px 0;">Нет данных по приходу</p>';
+    }
+    html += '</div>';
+
+    // Rasxod (Chiqim)
+    html += '<div style="border: 2px solid #e04a6a; border-radius: 8px; padding: 15px; background: #fdf2f5;">';
+    html += '<h3 style="color: #e04a6a; margin-top: 0;">📤 Расход</h3>';
+    if (outgoingGrouped.length > 0) {
+        html += '<div style="max-height: 430px; overflow-y: auto;">';
+        html += '<table style="width: 100%; border-collapse: collapse; font-size: 15px;">';
+        html += '<tr style="border-bottom: 1px solid #ddd;"><th style="text-align: left; padding: 8px;">Товар</th><th style="text-align: left; padding: 8px;">Партия</th><th style="text-align: right; padding: 8px;">Шт</th><th style="text-align: right; padding: 8px;">Кг</th></tr>';
+        let totalSht = 0, totalKg = 0;
+        outgoingGrouped.forEach(item => {
+            const sht = item.quantity_sht || 0;
+            const kg = item.quantity_kg || 0;
+            totalSht += sht;
+            totalKg += kg;
+            html += `<tr style="border-bottom: 1px solid #eee;"><td style="padding: 8px;">${item.product_name}</td><td style="padding: 8px;">${item.batch_code}</td><td style="text-align: right; padding: 8px;">${sht}</td><td style="text-align: right; padding: 8px;">${kg.toFixed(0)}</td></tr>`;
+        });
+        html += `<tr style="background: #ffe0e6; font-weight: bold;"><td style="padding: 10px;">Итого:</td><td style="padding: 10px;"></td><td style="text-align: right; padding: 10px;">${totalSht}</td><td style="text-align: right; padding: 10px;">${totalKg.toFixed(0)}</td></tr>`;
+        html += '</table>';
+        html += '</div>';
+    } else {
+        html += '<p style="color: #999; margin: 10px 0;">Нет данных по расходу</p>';
+    }
+    html += '</div>';
+
+    html += '</div>';
+    result.innerHTML = html;
+}
+
+// ==================== ALERTS ====================
+function showAlert(elementId, message, type) {
+    const alert = document.getElementById(elementId);
+    alert.className = `alert alert-${type}`;
+    alert.textContent = message;
+    alert.style.display = 'block';
+
+    setTimeout(() => {
+        alert.style.display = 'none';
+    }, 3000);
+}
+
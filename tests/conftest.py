@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, dispose_engines  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Xotiradagi bazali alohida ilova (instance/sklad.db ga tegmaydi)"""
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+        'WAREHOUSES': ['main'],
+        'EXPORT_CACHE_DIR': str(tmp_path / 'export_cache'),
+        'BACKUP_DIR': str(tmp_path / 'backups'),
+    })
+    yield app
+    dispose_engines(app)
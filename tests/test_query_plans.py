@@ -0,0 +1,15 @@
+from app import check_query_plans, hot_queries
+
+
+def test_hot_queries_cover_endpoints(app):
+    with app.app_context():
+        names = set(hot_queries())
+    assert {'search', 'search_batches', 'get_batches', 'stock_as_of', 'stock_as_of_movements'} <= names
+
+
+def test_hot_queries_use_indexes(app):
+    with app.app_context():
+        results = check_query_plans()
+    assert results
+    full_scans = {name: plan for name, plan, ok in results if not ok}
+    assert not full_scans, full_scans
@@ -0,0 +1,9 @@
+"""
+WSGI kirish nuqtasi
+===================
+gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+from app import create_app
+
+app = create_app()